@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+Compare the memory used to hold commands in a CommandStore against a list of
+namedtuples, each with its own args tuple and kwargs dict. Argument values
+are created up front so only the containers are measured.
+
+Usage:
+    python benchmarks/bench_memory.py [num_commands]
+'''
+from __future__ import absolute_import, print_function
+import os
+import sys
+import tracemalloc
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scrim.commands import CommandStore
+
+LegacyCommand = namedtuple('Command', 'name args kwargs')
+
+
+def make_values(num_commands):
+    return [
+        ('VAR_{}'.format(i), 'value_{}'.format(i))
+        for i in range(num_commands)
+    ]
+
+
+def fill_list(values):
+    commands = []
+    for var, value in values:
+        commands.append(LegacyCommand('set_env', (var, value), {}))
+    return commands
+
+
+def fill_store(values):
+    commands = CommandStore()
+    for var, value in values:
+        commands.add('set_env', (var, value), {})
+    return commands
+
+
+def measure(fill, values):
+    tracemalloc.start()
+    commands = fill(values)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(commands) == len(values)
+    return size
+
+
+def main(num_commands=1000000):
+    values = make_values(num_commands)
+    legacy = measure(fill_list, values)
+    store = measure(fill_store, values)
+    print('set_env x {}'.format(num_commands))
+    print('{:<24}{:>14}{:>18}'.format(
+        'storage', 'total (MB)', 'bytes/command'
+    ))
+    for name, size in (('namedtuple list', legacy), ('CommandStore', store)):
+        print('{:<24}{:>14.1f}{:>18.1f}'.format(
+            name, size / 1e6, size / float(num_commands)
+        ))
+    print('CommandStore uses {:.1%} of the namedtuple list'.format(
+        store / float(legacy)
+    ))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
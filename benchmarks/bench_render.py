@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+Compare Scrim.to_string using the precompiled render tables against the
+original CommandExecutor, which dispatched through getattr and rendered
+through fstrings.f. fstrings formatted strings with the locals of its
+caller, the legacy commands below do the same with str.format.
+
+Usage:
+    python benchmarks/bench_render.py [num_commands]
+'''
+from __future__ import absolute_import, print_function
+import ntpath
+import os
+import posixpath
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scrim import Scrim
+from scrim.commands import Command, RawCommand
+
+
+class LegacyBatchCommands(object):
+
+    def execute(self, expression):
+        return 'call {expression}'.format(**locals())
+
+    def echo(self, message):
+        return 'echo {message}'.format(**locals())
+
+    def set(self, var, value):
+        return 'set "{var}={value}"'.format(**locals())
+
+    def unset(self, var):
+        return 'set "{var}="'.format(**locals())
+
+    set_env = set
+    unset_env = unset
+
+    def cd(self, path):
+        path = ntpath.normpath(path)
+        return 'cd {path}'.format(**locals())
+
+    def pushd(self, path):
+        path = ntpath.normpath(path)
+        return 'pushd {path}'.format(**locals())
+
+    def popd(self):
+        return 'popd'
+
+
+class LegacyPowershellCommands(object):
+
+    def execute(self, expression):
+        return 'Invoke-Expression {expression}'.format(**locals())
+
+    def echo(self, message):
+        return 'Write-Host {message}'.format(**locals())
+
+    def set(self, var, value):
+        return '${var}={value}'.format(**locals())
+
+    def unset(self, var):
+        return 'Remove-Variable {var}'.format(**locals())
+
+    def set_env(self, var, value):
+        return '$env:{var}={value}'.format(**locals())
+
+    def unset_env(self, var):
+        return 'Remove-Item Env:{var}'.format(**locals())
+
+    def cd(self, path):
+        path = ntpath.normpath(path)
+        return 'cd {path}'.format(**locals())
+
+    def pushd(self, path):
+        path = ntpath.normpath(path)
+        return 'Push-Location -Path "{path}"'.format(**locals())
+
+    def popd(self):
+        return 'Pop-Location'
+
+
+class LegacyBashCommands(object):
+
+    def execute(self, expression):
+        return '$({expression})'.format(**locals())
+
+    def echo(self, message):
+        return 'echo {message}'.format(**locals())
+
+    def set(self, var, value):
+        return '{var}={value}'.format(**locals())
+
+    def unset(self, var):
+        return 'unset {var}'.format(**locals())
+
+    def set_env(self, var, value):
+        return 'export {var}={value}'.format(**locals())
+
+    def unset_env(self, var):
+        return 'unset {var}'.format(**locals())
+
+    def cd(self, path):
+        path = posixpath.normpath(path)
+        return 'cd {path}'.format(**locals())
+
+    def pushd(self, path):
+        path = posixpath.normpath(path)
+        return 'pushd {path}'.format(**locals())
+
+    def popd(self):
+        return 'popd'
+
+
+LEGACY_COMMANDS = {
+    'cmd.exe': LegacyBatchCommands(),
+    'powershell.exe': LegacyPowershellCommands(),
+    'bash': LegacyBashCommands(),
+}
+
+
+def legacy_to_string(scrim, shell):
+    '''Scrim.to_string as implemented before the render tables'''
+
+    lines = []
+    for c in scrim.commands:
+        if isinstance(c, Command):
+            method = getattr(LEGACY_COMMANDS[shell], c.name)
+            text = method(*c.args, **c.kwargs)
+        elif isinstance(c, RawCommand):
+            text = c.command if shell == c.required_shell else None
+        if text is not None:
+            lines.append(text)
+    return '\n'.join(lines)
+
+
+def make_scrim(num_commands):
+    scrim = Scrim(auto_write=False)
+    for i in range(num_commands // 4):
+        scrim.set_env('VAR_{}'.format(i), 'value_{}'.format(i))
+        scrim.echo('message {}'.format(i))
+        scrim.pushd('path/to/{}'.format(i))
+        scrim.popd()
+    return scrim
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(num_commands=1000000):
+    scrim = make_scrim(num_commands)
+    print('Scrim.to_string with {} commands'.format(len(scrim.commands)))
+    print('{:<16}{:>12}{:>12}{:>10}'.format(
+        'shell', 'legacy (s)', 'tables (s)', 'speedup'
+    ))
+    for shell in LEGACY_COMMANDS:
+        legacy, expected = timed(legacy_to_string, scrim, shell)
+        tables, result = timed(scrim.to_string, shell)
+        assert result == expected
+        print('{:<16}{:>12.3f}{:>12.3f}{:>9.1f}x'.format(
+            shell, legacy, tables, legacy / tables
+        ))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
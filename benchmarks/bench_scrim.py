@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+'''
+Microbenchmarks for the scrim api and renderers.
+
+Results are printed as a table and optionally saved as json. Pass a
+previously saved json file to --compare to report the change of the fastest
+repeat of each benchmark against that baseline. The exit code is 1 when any
+benchmark is slower than the baseline by more than --threshold.
+
+Usage:
+    python benchmarks/bench_scrim.py
+    python benchmarks/bench_scrim.py --quick --json baseline.json
+    python benchmarks/bench_scrim.py --compare baseline.json
+    python benchmarks/bench_scrim.py --filter to_string
+'''
+from __future__ import absolute_import, print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import scrim
+from scrim import Scrim, get_scrim, copy_templates, parse_setup
+from scrim.project import find_console_scripts, parse_setup_static
+from scrim.globals import SHELLS
+
+BENCHMARKS = []
+SIZES = [1, 1000, 1000000]
+SETUP_PY = '''
+from setuptools import setup
+
+setup(
+    name='pytool',
+    version='0.1.0',
+    packages=['pytool'],
+    entry_points={
+        'console_scripts': [
+            'pytool = pytool.cli:main',
+            'pyother = pytool.cli:other',
+        ]
+    },
+)
+'''
+
+
+def benchmark(name, number=1, repeat=5, size=None, timer=False):
+    '''Register a benchmark. The decorated function is called once to set up
+    the benchmark and returns the function to time. The timed function is
+    called number times per repeat.
+
+    Arguments:
+        name: Name of the benchmark
+        number: Calls per repeat
+        repeat: Number of repeats
+        size: Number of commands, benchmarks are skipped by --quick when
+            size is larger than 1000
+        timer: The timed function returns its own duration in seconds
+    '''
+
+    def register(setup):
+        BENCHMARKS.append(dict(
+            name=name,
+            setup=setup,
+            number=number,
+            repeat=repeat,
+            size=size,
+            timer=timer,
+        ))
+        return setup
+    return register
+
+
+def make_scrim(size, **kwargs):
+    kwargs.setdefault('auto_write', False)
+    scrim = Scrim(**kwargs)
+    for i in range(size):
+        if i % 4 == 0:
+            scrim.set_env('VAR_{}'.format(i), 'value_{}'.format(i))
+        elif i % 4 == 1:
+            scrim.echo('message {}'.format(i))
+        elif i % 4 == 2:
+            scrim.pushd('path/to/{}'.format(i))
+        else:
+            scrim.popd()
+    return scrim
+
+
+@benchmark('import scrim', repeat=10, timer=True)
+def bench_import():
+    '''Cumulative import time of scrim reported by python -X importtime'''
+
+    def run():
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import scrim'],
+            cwd=ROOT,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True
+        )
+        for line in proc.stderr.splitlines():
+            if line.endswith('| scrim'):
+                return int(line.split('|')[1]) / 1e6
+        raise RuntimeError('scrim not found in importtime output')
+    return run
+
+
+@benchmark('get_scrim', number=100000)
+def bench_get_scrim():
+    get_scrim()
+    return get_scrim
+
+
+@benchmark('Scrim._add', number=100000)
+def bench_add():
+    scrim = Scrim(auto_write=False)
+    scrim._registered = True
+
+    def run():
+        scrim._add('set_env', 'VAR', 'value')
+    return run
+
+
+for _shell in SHELLS:
+    for _size in SIZES:
+        def _bench_to_string(shell=_shell, size=_size):
+            scrim = make_scrim(size)
+
+            def run():
+                # Measure a full render rather than the render cache
+                scrim._render_cache.clear()
+                scrim.to_string(shell)
+            return run
+
+        benchmark(
+            'to_string[{}-{}]'.format(_shell, _size),
+            number=max(1, 1000 // _size),
+            repeat=3 if _size > 1000 else 5,
+            size=_size,
+        )(_bench_to_string)
+
+
+# Multi-megabyte values for the quoting benchmarks, a PATH that needs no
+# quoting in posix shells and a json blob full of special characters
+QUOTE_SIZE = 4 * 1024 * 1024
+QUOTE_VALUES = {
+    'path': ':'.join(
+        '/opt/tools/tool_{}/bin'.format(i) for i in range(QUOTE_SIZE // 20)
+    )[:QUOTE_SIZE],
+    'json': json.dumps([
+        {'name': "it's {}".format(i), 'cmd': 'a & b | c > "%TEMP%"'}
+        for i in range(QUOTE_SIZE // 60)
+    ])[:QUOTE_SIZE],
+}
+
+for _shell in SHELLS:
+    for _value in sorted(QUOTE_VALUES):
+        def _bench_quote(shell=_shell, value=QUOTE_VALUES[_value]):
+            from scrim.commands import get_shell_commands
+            quote = get_shell_commands(shell).quote
+
+            def run():
+                quote(value)
+            return run
+
+        benchmark(
+            'quote[{}-{}]'.format(_shell, _value),
+            number=3,
+            size=QUOTE_SIZE,
+        )(_bench_quote)
+
+
+for _size in SIZES[:2]:
+    def _bench_paths(size=_size):
+        # size edits of a PATH that holds size paths, interleaved with
+        # set_env commands that don't read it
+        paths = ['/opt/tools/tool_{}/bin'.format(i) for i in range(size)]
+        os.environ['SCRIM_BENCH_PATH'] = os.pathsep.join(paths)
+
+        def run():
+            scrim = Scrim(auto_write=False)
+            for i, path in enumerate(paths):
+                scrim.prepend_path('SCRIM_BENCH_PATH', paths[-i - 1])
+                scrim.remove_path('SCRIM_BENCH_PATH', path)
+                scrim.set_env('VAR', 'value')
+            scrim.to_string('bash')
+        return run
+
+    benchmark(
+        'paths[{}]'.format(_size),
+        number=max(1, 100 // _size),
+        size=_size,
+    )(_bench_paths)
+
+
+def _bench_write(dirname, size):
+    path = os.path.join(dirname, 'scrim_bench', 'scrim_out.sh')
+    scrim = make_scrim(size, path=path, shell='bash')
+    return scrim.write
+
+
+if os.path.isdir('/dev/shm'):
+    @benchmark('write[tmpfs-1000]', number=100)
+    def bench_write_tmpfs():
+        return _bench_write('/dev/shm', 1000)
+
+
+@benchmark('write[disk-1000]', number=100)
+def bench_write_disk():
+    return _bench_write(tempfile.gettempdir(), 1000)
+
+
+@benchmark('copy_templates', number=100)
+def bench_copy_templates():
+    output_dir = os.path.join(tempfile.gettempdir(), 'scrim_bench', 'bin')
+
+    def run():
+        copy_templates('tool', 'pytool', True, output_dir)
+    return run
+
+
+def write_setup_py():
+    path = os.path.join(tempfile.gettempdir(), 'scrim_bench', 'setup.py')
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(SETUP_PY)
+    return path
+
+
+@benchmark('parse_setup', number=20)
+def bench_parse_setup():
+    path = write_setup_py()
+
+    def run():
+        parse_setup(path)
+    return run
+
+
+@benchmark('parse_setup_static', number=100)
+def bench_parse_setup_static():
+    path = write_setup_py()
+
+    def run():
+        parse_setup_static(path)
+    return run
+
+
+@benchmark('find_console_scripts[cached]', number=1000)
+def bench_find_console_scripts():
+    root = os.path.dirname(write_setup_py())
+    os.environ['SCRIM_CACHE_DIR'] = os.path.join(root, 'cache')
+    find_console_scripts(root)
+
+    def run():
+        find_console_scripts(root)
+    return run
+
+
+def run_benchmark(bench):
+    '''Run a registered benchmark returning seconds per call for each
+    repeat. Changes the benchmark makes to os.environ, like setting
+    SCRIM_CACHE_DIR, are reverted afterwards.'''
+
+    environ = dict(os.environ)
+    try:
+        func = bench['setup']()
+        number = bench['number']
+        times = []
+        for _ in range(bench['repeat']):
+            if bench['timer']:
+                times.append(func())
+                continue
+
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number)
+        return times
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def summarize(times):
+    ordered = sorted(times)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        median = ordered[middle]
+    else:
+        median = (ordered[middle - 1] + ordered[middle]) / 2.0
+    return dict(
+        min=ordered[0],
+        max=ordered[-1],
+        mean=sum(ordered) / len(ordered),
+        median=median,
+        repeat=len(ordered),
+    )
+
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds >= 1 / scale:
+            return '{:.3f} {}'.format(seconds * scale, unit)
+    return '{:.1f} ns'.format(seconds * 1e9)
+
+
+def run(filter=None, quick=False):
+    results = {}
+    for bench in BENCHMARKS:
+        if filter and filter not in bench['name']:
+            continue
+        if quick and (bench['size'] or 0) > 1000:
+            continue
+
+        results[bench['name']] = summarize(run_benchmark(bench))
+        print('{:<36}{:>16}'.format(
+            bench['name'],
+            format_seconds(results[bench['name']]['min'])
+        ))
+
+    shutil.rmtree(
+        os.path.join(tempfile.gettempdir(), 'scrim_bench'),
+        ignore_errors=True
+    )
+    if os.path.isdir('/dev/shm'):
+        shutil.rmtree('/dev/shm/scrim_bench', ignore_errors=True)
+
+    return dict(
+        meta=dict(
+            scrim=scrim.__version__,
+            python=platform.python_version(),
+            implementation=platform.python_implementation(),
+            platform=platform.platform(),
+            time=time.time(),
+        ),
+        results=results,
+    )
+
+
+def compare(report, baseline, threshold):
+    '''Print the change of each benchmark in report against baseline.
+
+    Returns:
+        list: names of benchmarks slower than baseline by more than threshold
+    '''
+
+    regressions = []
+    print('')
+    print('{:<36}{:>16}{:>16}{:>10}'.format(
+        'benchmark', 'baseline', 'current', 'change'
+    ))
+    for name, result in sorted(report['results'].items()):
+        if name not in baseline['results']:
+            continue
+
+        before = baseline['results'][name]['min']
+        after = result['min']
+        change = (after - before) / before
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = ' !'
+        print('{:<36}{:>16}{:>16}{:>+9.1%}{}'.format(
+            name, format_seconds(before), format_seconds(after), change, flag
+        ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--json', help='Save results to this json file')
+    parser.add_argument('--compare', help='Baseline json file to compare to')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='Allowed slowdown relative to the baseline (default: 0.1)'
+    )
+    parser.add_argument('--filter', help='Only run matching benchmarks')
+    parser.add_argument(
+        '--quick',
+        action='store_true',
+        help='Skip benchmarks with more than 1000 commands'
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.filter, args.quick)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
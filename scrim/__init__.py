@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import time
+
+# Python startup ends about here, see scrim.trace
+_imported = time.time()
 
 __title__ = 'scrim'
 __author__ = 'Dan Bradham'
@@ -9,6 +13,52 @@ __url__ = 'https://github.com/danbradham/scrim.git'
 __description__ = 'Opaque Python CLI Wrapper'
 __version__ = '0.1.0'
 
-from scrim.api import *
-from scrim.globals import *
-from scrim.utils import *
+# Public names and the modules they live in. Modules are imported on first
+# attribute access so that importing scrim costs next to nothing.
+_exports = {
+    'Scrim': 'scrim.api',
+    'get_scrim': 'scrim.api',
+    'SHELLS': 'scrim.globals',
+    'SCRIM_SHELL': 'scrim.globals',
+    'SCRIM_PATH': 'scrim.globals',
+    'SCRIM_AUTO_WRITE': 'scrim.globals',
+    'SCRIM_SCRIPT': 'scrim.globals',
+    'SCRIM_DEBUG': 'scrim.globals',
+    'SCRIM_STREAM': 'scrim.globals',
+    'SCRIM_FD': 'scrim.globals',
+    'SCRIM_TRACE': 'scrim.globals',
+    'SCRIM_TRACE_ID': 'scrim.globals',
+    'SCRIM_WORKERS': 'scrim.globals',
+    'SCRIM_WORKER': 'scrim.globals',
+    'SCRIM_MEMO': 'scrim.globals',
+    'SCRIM_MEMO_KEY': 'scrim.globals',
+    'this_path': 'scrim.utils',
+    'relative_path': 'scrim.utils',
+    'bin_path': 'scrim.utils',
+    'copy_templates': 'scrim.utils',
+    'parse_setup': 'scrim.utils',
+    'get_console_scripts': 'scrim.utils',
+    'find_console_scripts': 'scrim.project',
+    'PathList': 'scrim.paths',
+    'cache_path': 'scrim.utils',
+    'init_attr': 'scrim.utils',
+}
+__all__ = list(_exports)
+_namespace = globals()
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name)
+        )
+
+    module = __import__(_exports[name], fromlist=[name])
+    value = getattr(module, name)
+    _namespace[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(_namespace) | set(_exports))
+
@@ -4,7 +4,8 @@ from __future__ import absolute_import
 import os
 from pprint import pprint
 import click
-from scrim.utils import copy_templates, parse_setup, get_console_scripts
+from scrim.utils import write_templates, parse_setup
+from scrim.project import find_console_scripts
 
 
 @click.group()
@@ -17,7 +18,11 @@ def cli():
 @click.option('--all_entry_points', is_flag=True, default=False)
 @click.option('--auto_write', is_flag=True, default=True)
 @click.option('--scripts_path', default='bin')
-def add(entry_point, all_entry_points, auto_write, scripts_path):
+@click.option('--root', default=None,
+              help='Add scripts to all projects found under this directory')
+@click.option('--jobs', default=None, type=int,
+              help='Number of processes used with --root')
+def add(entry_point, all_entry_points, auto_write, scripts_path, root, jobs):
     '''Add Scrim scripts for a python project'''
 
     click.echo()
@@ -25,13 +30,20 @@ def add(entry_point, all_entry_points, auto_write, scripts_path):
         raise click.UsageError(
             'Missing required option: --entry_point or --all_entry_points'
         )
-    if not os.path.exists('setup.py'):
-        raise click.UsageError('No setup.py found.')
+    if root:
+        if entry_point:
+            raise click.UsageError('--root requires --all_entry_points')
+        return add_all(root, auto_write, scripts_path, jobs)
+    project_files = ('setup.py', 'setup.cfg', 'pyproject.toml')
+    if not any(os.path.exists(f) for f in project_files):
+        raise click.UsageError(
+            'No setup.py, setup.cfg or pyproject.toml found.'
+        )
 
-    setup_data = parse_setup('setup.py')
-    console_scripts = get_console_scripts(setup_data)
+    console_scripts = find_console_scripts('.')
 
     scripts = []
+    counts = dict(created=0, updated=0, unchanged=0)
     if all_entry_points and console_scripts:
 
         # Make sure our entry points start with py
@@ -45,17 +57,18 @@ def add(entry_point, all_entry_points, auto_write, scripts_path):
             click.echo('Found entry_point: ' + entry)
             py_entry_point = entry
             entry_point = entry[2:]
-            more_scripts = copy_templates(
+            results = write_templates(
                 entry_point,
                 py_entry_point,
                 auto_write,
                 scripts_path
             )
 
-            for script in more_scripts:
-                click.echo('    Created ' + script)
+            for script, status in results:
+                click.echo('    {} {}'.format(status.title(), script))
+                counts[status] += 1
 
-            scripts.extend(more_scripts)
+            scripts.extend(script for script, _ in results)
 
     elif entry_point:
         if not entry_point.startswith('py'):
@@ -70,17 +83,21 @@ def add(entry_point, all_entry_points, auto_write, scripts_path):
         click.echo('\nCreating scripts for: ' + entry_point)
         py_entry_point = entry_point
         entry_point = entry_point[2:]
-        more_scripts = copy_templates(
+        results = write_templates(
             entry_point,
             py_entry_point,
             auto_write,
             scripts_path
         )
 
-        for script in more_scripts:
-            click.echo('    Created ' + script)
+        for script, status in results:
+            click.echo('    {} {}'.format(status.title(), script))
+            counts[status] += 1
+
+        scripts.extend(script for script, _ in results)
 
-        scripts.extend(more_scripts)
+    summary = '{created} created, {updated} updated, {unchanged} unchanged'
+    click.echo('\n' + summary.format(**counts))
 
     click.echo('\n\nAdd the following section to your package setup:\n')
     click.echo('scripts=[')
@@ -89,6 +106,142 @@ def add(entry_point, all_entry_points, auto_write, scripts_path):
     click.echo('],')
 
 
+def add_all(root, auto_write, scripts_path, jobs):
+    '''Add Scrim scripts for all projects found under root'''
+
+    from scrim.project import add_projects
+
+    results = add_projects(root, auto_write, scripts_path, jobs)
+    if not results:
+        raise click.UsageError('No setup.py or pyproject.toml found.')
+
+    counts = dict(created=0, updated=0, unchanged=0)
+    errors = 0
+    for result in results:
+        for _, status in result['scripts']:
+            counts[status] += 1
+        for entry in result['skipped']:
+            click.echo('Skipped {}: {} does not start with py.'.format(
+                result['project'], entry
+            ))
+        if result['error']:
+            click.echo('Failed {}: {}'.format(
+                result['project'], result['error']
+            ))
+            errors += 1
+
+    summary = '{created} created, {updated} updated, {unchanged} unchanged'
+    click.echo('{} projects: {}, {} failed'.format(
+        len(results), summary.format(**counts), errors
+    ))
+
+    click.echo('\n\nAdd the following sections to your package setups:')
+    for result in results:
+        if not result['scripts']:
+            continue
+        click.echo('\n# ' + result['project'])
+        click.echo('scripts=[')
+        for script, _ in result['scripts']:
+            click.echo("    '{}',".format(script))
+        click.echo('],')
+
+
+@cli.command()
+@click.option('--socket', 'socket_path', default=None)
+@click.argument('entry_points', nargs=-1)
+def daemon(socket_path, entry_points):
+    '''Serve warm console scripts to scrim scripts'''
+
+    from scrim.daemon import Daemon
+
+    server = Daemon(socket_path)
+    for entry_point in entry_points:
+        click.echo('Preloading ' + entry_point)
+        server.preload(entry_point)
+
+    click.echo('Listening on ' + server.path)
+    server.serve_forever()
+
+
+@cli.command()
+@click.argument('path')
+def trace(path):
+    '''Summarize a SCRIM_TRACE file'''
+
+    from scrim.trace import read_trace, summarize_trace
+
+    calls = read_trace(path)
+    click.echo('{} calls\n'.format(len(calls)))
+    columns = ('mean', 'median', 'p95', 'max')
+    header = '{:<10}{:>8}' + '{:>12}' * len(columns)
+    row = '{:<10}{:>8}' + '{:>10.2f}ms' * len(columns)
+    click.echo(header.format('phase', 'count', *columns))
+    for phase, stats in summarize_trace(calls).items():
+        values = [stats[column] * 1000 for column in columns]
+        click.echo(row.format(phase, stats['count'], *values))
+
+
+@cli.command(context_settings=dict(ignore_unknown_options=True))
+@click.option('--number', '-n', default=100, help='Number of calls')
+@click.option(
+    '--compare',
+    is_flag=True,
+    help='Also time the console script without the scrim script'
+)
+@click.argument('entry_point')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def bench(number, compare, entry_point, args):
+    '''Time calls to the bash scrim script of ENTRY_POINT
+
+    Reports the wrapper overhead (setup), interpreter startup (startup) and
+    sourcing of the scrim (apply) of each call along with the other phases.
+    '''
+
+    from scrim.trace import bench as run_bench, summarize_trace
+
+    calls, bare = run_bench(entry_point, args, number, compare)
+    click.echo('{} calls\n'.format(len(calls)))
+    columns = ('median', 'p95', 'p99')
+    header = '{:<10}{:>8}' + '{:>12}' * len(columns)
+    row = '{:<10}{:>8}' + '{:>10.2f}ms' * len(columns)
+    click.echo(header.format('phase', 'count', 'p50', 'p95', 'p99'))
+    summary = summarize_trace(calls)
+    for phase, stats in summary.items():
+        values = [stats[column] * 1000 for column in columns]
+        click.echo(row.format(phase, stats['count'], *values))
+
+    if not bare:
+        return
+
+    stats = summarize_trace([
+        dict(phases=dict(total=duration)) for duration in bare
+    ])['total']
+    values = [stats[column] * 1000 for column in columns]
+    click.echo(row.format('bare', stats['count'], *values))
+    if 'total' in summary:
+        overhead = [
+            (summary['total'][column] - stats[column]) * 1000
+            for column in columns
+        ]
+        click.echo(row.format('overhead', '', *overhead))
+
+
+@cli.group()
+def memo():
+    '''Manage the cache of memoized scrims'''
+
+
+@memo.command()
+@click.argument('entry_point', required=False)
+def clear(entry_point):
+    '''Clear the memoized scrims of ENTRY_POINT or all entry points'''
+
+    from scrim.memo import clear as clear_memo
+
+    removed = clear_memo(entry_point)
+    click.echo('Removed {} memoized scrims'.format(removed))
+
+
 @cli.command()
 def print_setup():
     '''Print setup.py setup kwargs'''
@@ -6,24 +6,303 @@ scrim.api
 '''
 from __future__ import absolute_import
 import os
+import io
+import sys
 import atexit
-from fstrings import f
+import time
+from _thread import allocate_lock, RLock
 from scrim.globals import (
     SHELLS,
     SCRIM_AUTO_WRITE,
     SCRIM_PATH,
     SCRIM_SHELL,
-    SCRIM_SCRIPT
+    SCRIM_SCRIPT,
+    SCRIM_STREAM,
+    SCRIM_FD,
+    SCRIM_TRACE,
+    SCRIM_TRACE_ID,
+    SCRIM_WORKERS,
+    SCRIM_WORKER,
+    SCRIM_MEMO,
+    SCRIM_MEMO_KEY
+)
+from scrim.commands import (
+    CommandExecutor,
+    CommandStore,
+    Command,
+    RawCommand,
+    render,
+    render_all
 )
-from scrim.commands import CommandExecutor, Command, RawCommand
 from scrim.utils import init_attr
+from scrim import _imported
 __all__ = ['Scrim', 'get_scrim']
 
+perf_counter = getattr(time, 'perf_counter', time.time)
+
+# Instances returned by get_scrim
+_scrims = {}
+_scrims_lock = allocate_lock()
+
+# Instances that registered on_exit, see Scrim.collect_workers
+_instances = []
+
+# Descriptors written to by any scrim, later writes start with a newline
+_written_fds = set()
+
+# Workers directory exported to child processes, see export_workers
+_worker = SCRIM_WORKER
+_workers = SCRIM_WORKERS if SCRIM_WORKER else None
+_owns_output = not SCRIM_WORKER and (
+    SCRIM_PATH is not None or SCRIM_FD is not None
+)
+
+
+def temp_workers_path():
+    '''A new unpredictable path for a workers directory in the temporary
+    directory. The directory is not created.'''
+
+    tmpdir = os.environ.get('TMPDIR') or os.environ.get('TEMP') or '/tmp'
+    name = 'scrim-{}-{}.workers'.format(os.getpid(), os.urandom(8).hex())
+    return os.path.join(tmpdir, name)
+
+
+def export_workers(path=None):
+    '''Set :envvar:`SCRIM_WORKERS` so child processes started from now on
+    become workers of this process. It defaults to SCRIM_PATH.workers or
+    :func:`temp_workers_path` when writing to :envvar:`SCRIM_FD`. The
+    directory is only created when a worker writes its commands.
+
+    Arguments:
+        path (str): Use this directory instead
+
+    Returns:
+        str: workers directory
+    '''
+
+    global _workers
+
+    if path is not None:
+        _workers = path
+    elif _workers is None:
+        _workers = SCRIM_WORKERS or temp_workers_path()
+    os.environ['SCRIM_WORKERS'] = _workers
+    return _workers
+
+
+def _output_scrims():
+    scrims = dict((id(s), s) for s in list(_scrims.values()) + _instances)
+    return [scrim for scrim in scrims.values() if scrim._output]
+
+
+def _before_fork():
+    # Forked children are workers even when the scrim has no commands yet,
+    # register it so it collects their commands
+    if _owns_output:
+        for scrim in _output_scrims():
+            scrim._register()
+
+
+def _after_fork():
+    # Children forked by a scrim wrapped tool are its workers. Commands
+    # inherited from the parent are the parents to write.
+    global _worker
+
+    if not _workers:
+        return
+    _worker = True
+    for scrim in _output_scrims():
+        scrim.workers = _workers
+        scrim._become_worker()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork)
+
+
+class StreamWriter(object):
+    '''Buffered writer used by :class:`Scrim` in stream mode. Rendered lines
+    are written to a temporary file next to path whenever the buffer exceeds
+    max_size characters or max_count lines. :meth:`commit` atomically
+    replaces path with the temporary file.
+
+    Pass append to continue a stream that was already committed to path.
+    Only the new lines are written to the temporary file, :meth:`commit`
+    appends them to path with a single write.
+    '''
+
+    def __init__(self, path, max_size=65536, max_count=4096, append=False):
+        self.path = path
+        self.max_size = max_size
+        self.max_count = max_count
+        self.append = append
+        self.buffer = []
+        self.size = 0
+        self.count = 0
+        self.written = 0
+
+        import tempfile
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except:
+                raise OSError('Failed to create root for scrim output.')
+
+        fd, self.tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(path) + '.',
+            suffix='.tmp',
+            dir=dirname
+        )
+        os.close(fd)
+
+        if append and os.path.exists(path):
+            self.count = int(os.path.getsize(path) > 0)
+
+        self.file = io.open(self.tmp_path, 'w')
+
+    def write(self, line):
+        if self.count:
+            line = '\n' + line
+        self.buffer.append(line)
+        self.size += len(line)
+        self.count += 1
+        if self.size >= self.max_size or len(self.buffer) >= self.max_count:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            data = ''.join(self.buffer)
+            self.file.write(data)
+            self.written += encoded_size(data)
+            self.buffer = []
+            self.size = 0
+        self.file.flush()
+
+    def pop_written(self):
+        '''Returns the number of bytes written since the last call'''
+
+        written, self.written = self.written, 0
+        return written
+
+    def commit(self):
+        '''Flush and atomically move the stream to path'''
+
+        self.flush()
+        self.file.close()
+        if not self.append:
+            os.replace(self.tmp_path, self.path)
+            return
+
+        with io.open(self.tmp_path, 'rb') as f:
+            data = f.read()
+        with io.open(self.path, 'ab') as f:
+            f.write(data)
+        os.remove(self.tmp_path)
+
+    def discard(self):
+        '''Close and remove the temporary file'''
+
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def snapshot_env():
+    '''Copy of the underlying data of os.environ. On CPython this copies the
+    encoded keys and values without decoding them.'''
+
+    return dict(getattr(os.environ, '_data', os.environ))
+
+
+class EnvCapture(object):
+    '''Records changes made to os.environ between :meth:`start` and
+    :meth:`stop` as commands on a :class:`Scrim`. The environment is diffed
+    using set operations on the items of two snapshots, only changed keys
+    and values are decoded. Values are quoted, the shell sets them literally.
+    '''
+
+    def __init__(self, scrim):
+        self.scrim = scrim
+        self.snapshot = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        '''Take a snapshot of os.environ'''
+
+        self.snapshot = snapshot_env()
+        return self
+
+    def stop(self):
+        '''Add the changes made since :meth:`start` to the scrim'''
+
+        if self.snapshot is None:
+            return
+
+        before, after = self.snapshot, snapshot_env()
+        self.snapshot = None
+        if before == after:
+            return
+
+        decodekey = getattr(os.environ, 'decodekey', str)
+        decodevalue = getattr(os.environ, 'decodevalue', str)
+        changed = sorted(after.items() - before.items())
+        removed = sorted(before.keys() - after.keys())
+        self.scrim.set_env_many(
+            ((decodekey(k), decodevalue(v)) for k, v in changed),
+            quote=True
+        )
+        self.scrim.unset_env_many(decodekey(k) for k in removed)
+
+
+class FdStreamWriter(StreamWriter):
+    '''Buffered writer used by :class:`Scrim` in stream mode when writing to
+    a file descriptor. The scrim script reads the descriptor to its end
+    before executing it, so lines can be written as soon as they are
+    flushed. Other scrims may write to the same descriptor, lines are
+    separated when they are flushed.'''
+
+    def __init__(self, fd, max_size=65536, max_count=4096):
+        self.path = None
+        self.fd = fd
+        self.max_size = max_size
+        self.max_count = max_count
+        self.buffer = []
+        self.size = 0
+        self.count = 0
+        self.written = 0
+        self.file = io.open(fd, 'w', closefd=False)
 
-try:
-    basestring
-except NameError:
-    basestring = (str, bytes)
+    def write(self, line):
+        self.buffer.append(line)
+        self.size += len(line) + 1
+        self.count += 1
+        if self.size >= self.max_size or len(self.buffer) >= self.max_count:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            if self.fd in _written_fds:
+                self.buffer.insert(0, '')
+            _written_fds.add(self.fd)
+            data = '\n'.join(self.buffer)
+            self.file.write(data)
+            self.written += encoded_size(data)
+            self.buffer = []
+            self.size = 0
+        self.file.flush()
+
+    def commit(self):
+        self.flush()
+
+    def discard(self):
+        self.flush()
 
 
 class Scrim(object):
@@ -34,6 +313,31 @@ class Scrim(object):
         auto_write: Write scrim file on program exit. Defaults to
                     :envvar:`SCRIM_AUTO_WRITE`
         script: Path to scrim script. Defaults to :envvar:`SCRIM_AUTO_WRITE`
+        stream: Render each command as it is added and stream it to path
+                instead of keeping it in :attr:`commands`. Streamed commands
+                can't be rendered again, :meth:`to_string` raises. Defaults
+                to :envvar:`SCRIM_STREAM`
+        fd: File descriptor to write to instead of path. Defaults to
+            :envvar:`SCRIM_FD`. The scrim script reads it until every
+            process holding it exits, see :mod:`scrim.globals`
+
+    Runtime statistics are available from :attr:`stats`. Use
+    :meth:`subscribe` to be notified when commands are added, rendered or
+    written.
+
+    Commands may be added from multiple threads. Commands are appended to a
+    pending list, holding a lock only for the append, and moved to
+    :attr:`commands`, in the order they were added, whenever the commands are
+    read. Reading, replacing and optimizing the commands hold the scrims
+    lock, commands added meanwhile stay pending.
+
+    Child processes, like multiprocessing workers, write their commands to
+    :attr:`workers` instead of the scrims output when they exit. The parent
+    collects them before it writes, see :meth:`collect_workers`.
+
+    Arguments of commands may be callables or awaitables. They are resolved
+    together when the commands are rendered, using up to
+    :attr:`deferred_workers` threads, see :mod:`scrim.deferred`.
 
     Usage:
         >>> scrim = Scrim()
@@ -42,14 +346,60 @@ class Scrim(object):
         'echo Hello World!'
     '''
 
-    def __init__(self, path=None, auto_write=None, shell=None, script=None):
+    stream_buffer_size = 65536
+    stream_buffer_count = 4096
+    auto_optimize = False
+    deferred_workers = None
+
+    # Callbacks registered with subscribe
+    _add_hooks = ()
+    _render_hooks = ()
+    _write_hooks = ()
+
+    def __init__(self, path=None, auto_write=None, shell=None, script=None,
+                 stream=None, fd=None):
         self.shell = init_attr(shell, SCRIM_SHELL)
         self.path = init_attr(path, SCRIM_PATH)
         self.auto_write = init_attr(auto_write, SCRIM_AUTO_WRITE)
         self.script = init_attr(script, SCRIM_SCRIPT)
-        self.command_executor = CommandExecutor()
-        self.commands = []
-        atexit.register(self.on_exit)
+        self.stream = init_attr(stream, SCRIM_STREAM)
+        self.fd = init_attr(fd, SCRIM_FD)
+        # The store and number of its commands written to fd
+        self._fd_written = (None, 0)
+        self._commands = CommandStore()
+        self._pending = []
+        self._pending_lock = allocate_lock()
+        self._lock = RLock()
+        self._render_cache = {}
+        self._resolved = (None, 0)
+        self.stream_writer = None
+        self._stream_committed = False
+        self._command_executor = None
+        self._registered = False
+        self._env_captures = []
+        self._paths = {}
+        self._added = {}
+        self._render_times = {}
+        self._writes = 0
+        self._write_time = 0.0
+        self._bytes_written = 0
+        self.trace = SCRIM_TRACE
+
+        # Only scrims writing the scrim scripts output have workers and memos,
+        # workers are exported when the scrim is registered
+        self._output = self.path == SCRIM_PATH and self.fd == SCRIM_FD
+        if self._output:
+            self.workers = _workers if _worker else None
+            self.memo = SCRIM_MEMO
+            self.memo_key = SCRIM_MEMO_KEY
+        else:
+            self.workers = None
+            self.memo = None
+            self.memo_key = None
+        self._memo_inputs = None
+        self.worker = bool(_worker and self.workers)
+        if self.worker:
+            self.stream = False
 
     def __repr__(self):
         args = (
@@ -58,13 +408,233 @@ class Scrim(object):
             repr(self.shell),
             repr(self.script)
         )
-        return f("<{}>({}, {}, {}, {})", self.__class__.__name__, *args)
+        return "<{}>({}, {}, {}, {})".format(self.__class__.__name__, *args)
+
+    @property
+    def commands(self):
+        '''The list of commands added to this scrim. Modifying this list
+        directly invalidates the render cache.'''
+
+        self._merge()
+        return self._commands
+
+    @commands.setter
+    def commands(self, value):
+        with self._lock:
+            self._merge()
+            self._replace_commands(value)
+
+    def _replace_commands(self, value):
+        # Called while holding the lock. Pending commands are not merged,
+        # they are added to the new commands.
+        if value is self._commands:
+            return
+        if not isinstance(value, CommandStore):
+            value = CommandStore(value)
+        self._commands = value
+        self._render_cache.clear()
+        self._resolved = (None, 0)
+
+    @property
+    def stats(self):
+        '''Runtime statistics of this scrim.
+
+        Returns:
+            dict: with the following keys
+
+                - commands: number of commands added by name, including
+                  commands removed since
+                - render_time: seconds spent rendering by shell
+                - writes: number of writes
+                - write_time: seconds spent writing, including rendering
+                - bytes_written: total size of the written scripts in bytes
+                - scrims: number of live :func:`get_scrim` instances
+        '''
+
+        self._merge()
+        return dict(
+            commands=dict(self._added),
+            render_time=dict(self._render_times),
+            writes=self._writes,
+            write_time=self._write_time,
+            bytes_written=self._bytes_written,
+            scrims=len(_scrims),
+        )
+
+    @classmethod
+    def subscribe(cls, event, callback):
+        '''Call callback whenever event happens on any instance of this class.
+        Callbacks receive the scrim followed by the arguments listed below.
+
+            - add: name, args, kwargs of the command added
+            - render: shell, seconds spent rendering
+            - write: bytes written, seconds spent writing
+
+        Arguments:
+            event (str): one of add, render or write
+            callback (callable): function to call
+        '''
+
+        attr = cls._hooks_attr(event)
+        setattr(cls, attr, getattr(cls, attr) + (callback,))
+
+    @classmethod
+    def unsubscribe(cls, event, callback):
+        '''Stop calling a callback registered with :meth:`subscribe`'''
+
+        attr = cls._hooks_attr(event)
+        hooks = getattr(cls, attr)
+        setattr(cls, attr, tuple(h for h in hooks if h is not callback))
+
+    @staticmethod
+    def _hooks_attr(event):
+        if event not in ('add', 'render', 'write'):
+            raise ValueError(
+                'event must be one of add, render or write: ' + event
+            )
+        return '_{}_hooks'.format(event)
+
+    @property
+    def command_executor(self):
+        if self._command_executor is None:
+            self._command_executor = CommandExecutor()
+        return self._command_executor
 
     def _add(self, name, *args, **kwargs):
         '''Appends a command to the scrims list of commands. You should not
         need to use this.'''
 
-        self.commands.append(Command(name, args, kwargs))
+        if self._add_hooks:
+            for hook in self._add_hooks:
+                hook(self, name, args, kwargs)
+
+        if self._registered and not self.stream:
+            with self._pending_lock:
+                self._pending.append((name, args, kwargs))
+            return
+
+        self._append(Command(name, args, kwargs))
+
+    def _register(self):
+        # Scrims do nothing until their first command is added
+        with self._lock:
+            if self._registered:
+                return
+            atexit.register(self.on_exit)
+            _instances.append(self)
+            if self.worker:
+                self._finalize_worker()
+            elif self._output and _owns_output:
+                self.workers = export_workers()
+            self._registered = True
+
+    def _finalize_worker(self):
+        # multiprocessing exits its children without running atexit
+        if 'multiprocessing' in sys.modules:
+            from multiprocessing.util import Finalize
+            Finalize(None, self.on_exit, exitpriority=0)
+
+    def _become_worker(self):
+        # Called in a forked child, the lock may have been held by another
+        # thread of the parent
+        self._lock = RLock()
+        self._pending_lock = allocate_lock()
+        self._commands = CommandStore()
+        self._pending = []
+        self._paths = {}
+        self._render_cache.clear()
+        self._resolved = (None, 0)
+        self.stream = False
+        self.stream_writer = None
+        self.worker = True
+        if self._registered and 'multiprocessing' in sys.modules:
+            # multiprocessing clears its finalizers after forking
+            from multiprocessing.util import register_after_fork
+            register_after_fork(self, Scrim._finalize_worker)
+
+    def _merge(self):
+        '''Move the pending commands to :attr:`commands`. The pending list is
+        swapped for an empty one, so threads can keep adding commands while
+        merging. Those are left for the next merge.'''
+
+        if not self._pending:
+            return
+
+        with self._lock:
+            with self._pending_lock:
+                entries, self._pending = self._pending, []
+            self._commands.add_many(entries)
+            self._count_added(entries)
+
+    def _count_added(self, entries):
+        # Count pending entries by name for stats, entries without a name
+        # hold a command
+        added = self._added
+        for name, args, _ in entries:
+            if name is None:
+                name = command_name(args)
+            added[name] = added.get(name, 0) + 1
+
+    def _resolve(self):
+        '''Resolve the deferred arguments of the commands added since the
+        last call, see :mod:`scrim.deferred`. Called while holding the lock
+        before rendering.
+
+        Returns:
+            CommandStore: :attr:`commands`
+        '''
+
+        commands = self.commands
+        version, count = self._resolved
+        if version != commands.version or count > len(commands):
+            count = 0
+        if count < len(commands):
+            from scrim.deferred import resolve_commands
+            resolve_commands(commands, count, self.deferred_workers)
+            self._resolved = (commands.version, len(commands))
+        return commands
+
+    def _append(self, command):
+        if not self._registered:
+            self._register()
+
+        if not self.stream:
+            # Commands that aren't added by name are pending without one
+            with self._pending_lock:
+                self._pending.append((None, command, None))
+            return
+
+        with self._lock:
+            self._stream(command)
+
+    def _stream(self, command):
+        if command.__class__ is Command and command.args:
+            from scrim.deferred import resolve_command
+            command = resolve_command(command, self.deferred_workers)
+        text = self.command_executor(command, self.shell)
+        name = command_name(command)
+        self._added[name] = self._added.get(name, 0) + 1
+        if text is None:
+            return
+
+        if self.stream_writer is None and self.fd is not None:
+            self.stream_writer = FdStreamWriter(
+                self.fd,
+                self.stream_buffer_size,
+                self.stream_buffer_count
+            )
+        elif self.stream_writer is None:
+            if self.path is None:
+                raise Exception('Scrim.path is None')
+            # Only continue the stream this scrim committed, anything else
+            # at path is left over from another process
+            self.stream_writer = StreamWriter(
+                self.path,
+                self.stream_buffer_size,
+                self.stream_buffer_count,
+                self._stream_committed
+            )
+        self.stream_writer.write(text)
 
     def execute(self, expression):
         '''Execute the specified expression or script.
@@ -75,24 +645,32 @@ class Scrim(object):
 
         self._add('execute', expression)
 
-    def echo(self, message):
+    def echo(self, message, quote=False):
         '''Write to stdout.
 
         Arguments:
             message (str): Message to write
+            quote (bool): Quote message so the shell reads it literally
         '''
 
-        self._add('echo', message)
+        if quote:
+            self._add('echo', message, quote=True)
+        else:
+            self._add('echo', message)
 
-    def set(self, var, value):
+    def set(self, var, value, quote=False):
         '''Set a variable.
 
         Arguments:
             var (str): variable name
             value (Any): value to write
+            quote (bool): Quote value so the shell reads it literally
         '''
 
-        self._add('set', var, value)
+        if quote:
+            self._add('set', var, value, quote=True)
+        else:
+            self._add('set', var, value)
 
     def unset(self, var):
         '''Unset a variable.
@@ -103,16 +681,28 @@ class Scrim(object):
 
         self._add('unset', var)
 
-    def set_env(self, var, value):
+    def set_env(self, var, value, quote=False):
         '''Set an environment variable. Depending on shell this is identical
         to :meth:`set`
 
+        By default value is inserted as-is, so it may reference other
+        variables. Pass quote to quote it instead, see :mod:`scrim.quoting`.
+
         Arguments:
             var (str): variable name
             value (Any): value to write
+            quote (bool): Quote value so the shell reads it literally
+
+        Examples:
+            >>> scrim.set_env('PRICE', '$5 & up', quote=True)
+            >>> scrim.to_bash()
+            "export PRICE='$5 & up'"
         '''
 
-        self._add('set_env', var, value)
+        if quote:
+            self._add('set_env', var, value, quote=True)
+        else:
+            self._add('set_env', var, value)
 
     def unset_env(self, var):
         '''Unset an environment variable. Depending on shell this is identical
@@ -124,6 +714,279 @@ class Scrim(object):
 
         self._add('unset_env', var)
 
+    def set_env_many(self, variables, quote=False):
+        '''Set multiple environment variables using a single command. Each
+        shell renders this in the most compact form it supports, for example
+        a single export in bash. In bash all values are expanded before any
+        of the variables are set.
+
+        Arguments:
+            variables (dict or iterable): mapping or (var, value) pairs
+            quote (bool): Quote values so the shell reads them literally
+        '''
+
+        if hasattr(variables, 'items'):
+            variables = variables.items()
+        pairs = tuple(variables)
+        if pairs and quote:
+            self._add('set_env_many', pairs, quote=True)
+        elif pairs:
+            self._add('set_env_many', pairs)
+
+    def unset_env_many(self, variables):
+        '''Unset multiple environment variables using a single command.
+
+        Arguments:
+            variables (iterable): variable names
+        '''
+
+        names = tuple(variables)
+        if names:
+            self._add('unset_env_many', names)
+
+    def prepend_path(self, var, paths):
+        '''Prepend paths to the list of paths in an environment variable
+        like PATH. Paths already in the list are moved to the front.
+
+        Arguments:
+            var (str): variable name
+            paths (str or list): path or paths to prepend, in order
+
+        Examples:
+            >>> scrim.prepend_path('TOOL_PATH', ['/opt/tool/bin', '/bin'])
+            >>> scrim.append_path('TOOL_PATH', '/opt/tool/scripts')
+            >>> scrim.remove_path('TOOL_PATH', '/bin')
+            >>> scrim.to_bash()
+            'export TOOL_PATH=/opt/tool/bin:/opt/tool/scripts'
+        '''
+
+        self._edit_path(var, 'prepend', paths)
+
+    def append_path(self, var, paths):
+        '''Append paths to the list of paths in an environment variable
+        like PATH. Paths already in the list are moved to the end.
+
+        Arguments:
+            var (str): variable name
+            paths (str or list): path or paths to append, in order
+        '''
+
+        self._edit_path(var, 'append', paths)
+
+    def remove_path(self, var, paths):
+        '''Remove paths from the list of paths in an environment variable
+        like PATH.
+
+        Arguments:
+            var (str): variable name
+            paths (str or list): path or paths to remove
+        '''
+
+        self._edit_path(var, 'remove', paths)
+
+    def _edit_path(self, var, method, paths):
+        '''Apply an edit to the :class:`scrim.paths.PathList` of var.
+
+        The list of a variable is seeded from the last command writing it,
+        or os.environ, and is held by a set_path command. Edits are folded
+        into that command, which renders the list when the scrim is
+        rendered, until a command that may observe the variable is added
+        after it. Then the edit adds a new set_path command.
+
+        Deferred paths and deferred seeds are applied when the scrim is
+        rendered by a :class:`scrim.paths.DeferredPaths` set_path command.
+
+        Raises:
+            ValueError: when the seed may reference variables, like a
+                set_env of '$PATH:/bin'
+        '''
+
+        from scrim.paths import DeferredPaths, PathList, written_paths
+        from scrim.deferred import is_deferred
+        from scrim.optimize import is_barrier
+
+        if isinstance(paths, str):
+            paths = (paths,)
+        elif not is_deferred(paths):
+            paths = tuple(paths)
+        deferred = is_deferred(paths) or any(map(is_deferred, paths))
+
+        with self._lock:
+            if self.stream:
+                # Streamed commands are rendered at once, add each edit
+                path_list = self._paths.get(var)
+                if path_list is None:
+                    path_list = PathList.from_environ(var)
+                if deferred:
+                    path_list = PathList(
+                        DeferredPaths(path_list, method, paths)()
+                    )
+                else:
+                    getattr(path_list, method)(*paths)
+                self._paths[var] = path_list
+                self._add('set_path', var, tuple(path_list))
+                return
+
+            # The cache holds the list, the store and version it was checked
+            # against, the number of commands checked and the first index
+            # the set_path command of the list can be at
+            commands = self.commands
+            path_list, store, version, checked, first = self._paths.get(
+                var,
+                (None, None, None, 0, 0)
+            )
+            if store is commands and version == commands.version:
+                seed = path_list
+            else:
+                # Commands were modified or replaced, look for writes from
+                # the start
+                seed = None
+                checked = 0
+
+            observed = False
+            for i, command in enumerate(commands[checked:], checked):
+                if command.__class__ is Command and command.name == 'set_path':
+                    if command.args[1] is path_list:
+                        seed = path_list
+                        first = i
+                        observed = False
+                        continue
+                    if command.args[0] != var:
+                        continue
+                try:
+                    written = written_paths(command, var)
+                except ValueError as e:
+                    # Only raised if no later command overwrites var
+                    written = e
+                if written is not None:
+                    seed = written
+                    observed = True
+                elif is_barrier(command):
+                    observed = True
+
+            if isinstance(seed, ValueError):
+                raise seed
+
+            if deferred or isinstance(seed, DeferredPaths):
+                # The new set_path command is the seed of the next edit
+                if seed is None:
+                    seed = PathList.from_environ(var)
+                self._paths[var] = (
+                    None, commands, commands.version, len(commands),
+                    len(commands)
+                )
+                self._add('set_path', var, DeferredPaths(seed, method, paths))
+                return
+
+            # Commands written to fd are rendered already
+            if (seed is path_list and not observed and path_list is not None
+                    and first >= self._fd_offset()):
+                getattr(path_list, method)(*paths)
+                # Invalidate renders of the set_path command
+                commands.version += 1
+                self._paths[var] = (
+                    path_list, commands, commands.version, len(commands), first
+                )
+                return
+
+            if seed is None:
+                path_list = PathList.from_environ(var)
+            else:
+                path_list = PathList(seed)
+            before = list(path_list)
+            getattr(path_list, method)(*paths)
+            if list(path_list) == before:
+                return
+
+            self._paths[var] = (
+                path_list, commands, commands.version, len(commands),
+                len(commands)
+            )
+            self._add('set_path', var, path_list)
+
+    def memoize(self, files=(), env=()):
+        '''Cache the scrim of this call. The bash and zsh scrim scripts
+        source the cached scrim instead of running python when the tool is
+        called again with the same arguments in the same directory, until one
+        of files is modified or one of the env variables changes. Call this
+        once the tool succeeded, after adding its commands.
+
+        Only memoize tools whose effect is entirely in their scrim, output
+        written to stdout and other side effects are not repeated. Pass the
+        tool's own modules in files to invalidate the cache when it is
+        upgraded. See :mod:`scrim.memo`. Calls that exit with a non-zero
+        status are not cached.
+
+        Arguments:
+            files (list): Paths of the files the scrim depends on
+            env (list): Names of the environment variables the scrim
+                depends on
+
+        Raises:
+            ValueError: when env contains an invalid variable name
+            RuntimeError: in stream mode, the scrim is never rendered whole
+        '''
+
+        self._check_not_streaming('memoize')
+        from scrim.memo import ENV_NAME, MEMO_SHELLS, enable
+
+        env = list(env)
+        for name in env:
+            if not ENV_NAME.match(name):
+                raise ValueError('Invalid environment variable: ' + name)
+        self._memo_inputs = ([os.path.abspath(p) for p in files], env)
+
+        if self.memo is None and self.script and self.shell in MEMO_SHELLS:
+            # Scrim scripts only look up memos of entry points that have a
+            # memo directory, the next call will be cached
+            enable(os.path.basename(sys.argv[0]))
+
+    def store_memo(self, script, started=None):
+        '''Store script in the memo cache when :meth:`memoize` was called.
+        You should not need to use this.
+
+        Arguments:
+            script (str): Rendered scrim
+            started (float): Time the call started, files modified later
+                invalidate the cache. Defaults to the time scrim was imported
+
+        Returns:
+            int: number of bytes written
+        '''
+
+        if self._memo_inputs is None or not (self.memo and self.memo_key):
+            return 0
+
+        from scrim.memo import store
+
+        if started is None:
+            started = _imported
+        files, env = self._memo_inputs
+        return store(self.memo, self.memo_key, script, files, env, started)
+
+    def capture_env(self, at_exit=False):
+        '''Capture changes made to os.environ as set_env_many and
+        unset_env_many commands. Use the returned :class:`EnvCapture` as a
+        context manager or pass at_exit to capture all changes made until the
+        program exits.
+
+        Arguments:
+            at_exit (bool): Stop capturing when the program exits
+
+        Examples:
+            >>> with scrim.capture_env():
+            ...     os.environ['MYTOOL'] = 'Hello World!'
+            >>> scrim.to_bash()
+            "export MYTOOL='Hello World!'"
+        '''
+
+        capture = EnvCapture(self).start()
+        if at_exit:
+            if not self._registered:
+                self._register()
+            self._env_captures.append(capture)
+        return capture
+
     def cd(self, path):
         '''Change directory.
 
@@ -165,35 +1028,108 @@ class Scrim(object):
             'Get-Content text.txt'
         '''
 
-        if not isinstance(command, basestring):
-            raise TypeError(f('{command} must be a string'))
+        if not isinstance(command, str):
+            raise TypeError('{} must be a string'.format(command))
 
         if required_shell not in SHELLS:
-            raise ValueError(f('{required_shell} must be one of {SHELLS}'))
+            from scrim.shells import get_index
+            shells = get_index()
+            if required_shell not in shells:
+                raise ValueError(
+                    '{} must be one of {}'.format(required_shell, list(shells))
+                )
+
+        if self._add_hooks:
+            for hook in self._add_hooks:
+                hook(self, 'raw', (command, required_shell), {})
+
+        self._append(RawCommand(command, required_shell))
+
+    def optimize(self):
+        '''Rewrite :attr:`commands` into the smallest equivalent list of
+        commands. Commands that may observe the shell's state, like execute,
+        echo and raw commands, are never removed or reordered across. See
+        :mod:`scrim.optimize` for the rules applied.
+
+        When :attr:`auto_optimize` is True this runs before :meth:`write`
+        and :meth:`write_all`.
 
-        self.commands.append(RawCommand(command, required_shell))
+        Returns:
+            int: number of commands removed
+        '''
+
+        from scrim.optimize import optimize_commands
+
+        with self._lock:
+            # Commands already written to fd can't be taken back
+            written = self._fd_offset()
+            commands = self.commands
+            optimized, removed = optimize_commands(commands[written:])
+            if removed:
+                self._replace_commands(commands[:written] + optimized)
+                if written:
+                    self._fd_written = (self._commands, written)
+        return removed
 
     def to_string(self, shell=None):
         '''Use the command executor to retrieve the text of the scrim script
         compatible with the provided shell. If no shell is provided, use
         :attr:`scrim.shell`.
 
+        Renders are cached per shell, subsequent calls only render the
+        commands added since the last call. Modifying :attr:`commands` in any
+        other way than appending invalidates the cache.
+
         Attributes:
             shell (str): Which shell should we return a script for
                 cmd.exe, powershell.exe, bash...
 
         Returns:
             str
+
+        Raises:
+            RuntimeError: in stream mode
         '''
 
+        self._check_not_streaming('to_string')
         shell = shell or self.shell
-        lines = []
-        for c in self.commands:
-            text = self.command_executor(c, shell)
-            if text is not None:
-                lines.append(text)
+        with self._lock:
+            return self._to_string(shell)
+
+    def _check_not_streaming(self, method):
+        if self.stream:
+            raise RuntimeError(
+                'Scrim.{} is not available in stream mode, commands are '
+                'rendered when they are added'.format(method)
+            )
+
+    def _to_string(self, shell):
+        # The render cache maps shells to (version, count, chunks). Renders
+        # append a chunk for the new commands, the chunks are only joined
+        # when the text is returned.
+        commands = self._resolve()
+        version, count, chunks = self._render_cache.get(shell, (None, 0, []))
+        if version != commands.version or count > len(commands):
+            count, chunks = 0, []
+
+        if count < len(commands):
+            start = perf_counter()
+            lines = render(commands, shell, count)
+            if lines:
+                chunks.append('\n'.join(lines))
+            self._render_cache[shell] = (
+                commands.version,
+                len(commands),
+                chunks
+            )
+            self._rendered(shell, perf_counter() - start)
 
-        return '\n'.join(lines)
+        return join_chunks(chunks)
+
+    def _rendered(self, shell, seconds):
+        self._render_times[shell] = self._render_times.get(shell, 0) + seconds
+        for hook in self._render_hooks:
+            hook(self, shell, seconds)
 
     def to_cmd(self):
         '''scrim.to_powershell() == scrim.to_string('powershell')
@@ -223,32 +1159,327 @@ class Scrim(object):
         return self.to_string('bash')
 
     def write(self):
-        '''Write this Scrims commands to its path'''
+        '''Write this Scrims commands to its path. In stream mode this commits
+        the streamed commands to path.
+
+        When :attr:`fd` is set the commands are written to the file
+        descriptor instead. A descriptor can't be rewritten, so only the
+        commands added since the last write are written to it.
 
-        if self.path is None:
+        In a worker process the commands are written to :attr:`workers`,
+        the commands of exited workers are collected before writing.
+        '''
+
+        if not self.worker and self.path is None and self.fd is None:
             raise Exception('Scrim.path is None')
 
-        dirname = os.path.dirname(os.path.abspath(self.path))
-        if not os.path.exists(dirname):
-            try:
-                os.makedirs(dirname)
-            except:
-                raise OSError('Failed to create root for scrim output.')
+        start = perf_counter()
+        self._written(self._write(), perf_counter() - start)
+
+    def _write(self):
+        if self.worker:
+            return self._write_worker()
+
+        self.collect_workers()
+        if self.stream:
+            written = 0
+            if self.stream_writer is not None:
+                self.stream_writer.commit()
+                written = self.stream_writer.pop_written()
+                if self.fd is None:
+                    self.stream_writer = None
+                    self._stream_committed = True
+            return written
+
+        if self.auto_optimize:
+            self.optimize()
+
+        if self.fd is not None:
+            with self._lock:
+                written = self._write_fd()
+        else:
+            written = write_script(self.path, self.to_string())
+        if self._memo_inputs is not None:
+            self.store_memo(self.to_string())
+        return written
+
+    def _write_worker(self):
+        import pickle
+
+        with self._lock:
+            # Deferred arguments may not be picklable
+            commands = list(self._resolve())
+            self._commands = CommandStore()
+            self._render_cache.clear()
+            self._resolved = (None, 0)
+        if not commands:
+            return 0
+
+        try:
+            os.makedirs(self.workers, 0o700)
+        except OSError:
+            if not os.path.isdir(self.workers):
+                raise
+
+        # Parts are collected in the order they were written
+        name = '{:017.6f}-{}'.format(time.time(), os.getpid())
+        path = os.path.join(self.workers, name)
+        data = pickle.dumps(commands, pickle.HIGHEST_PROTOCOL)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path + '.part')
+        return len(data)
+
+    def collect_workers(self):
+        '''Add the commands written by worker processes that have exited.
+        Each workers commands are added in the order the workers wrote them.
+        Workers are child processes of this process, they inherit
+        :attr:`workers` through :envvar:`SCRIM_WORKERS`.
+
+        Returns:
+            int: number of commands added
+        '''
+
+        workers = self.workers
+        if self.worker or not workers or not os.path.isdir(workers):
+            return 0
+
+        # Parts are pickles, only trust a directory private to this user
+        if hasattr(os, 'getuid'):
+            stat = os.stat(workers)
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+                return 0
+
+        import pickle
+        import shutil
+
+        added = 0
+        try:
+            for name in sorted(os.listdir(workers)):
+                # Workers killed while writing leave .tmp parts behind
+                if not name.endswith('.part'):
+                    continue
+                with open(os.path.join(workers, name), 'rb') as f:
+                    commands = pickle.load(f)
+                for command in commands:
+                    self._append(command)
+                added += len(commands)
+        finally:
+            shutil.rmtree(workers, ignore_errors=True)
+        return added
+
+    def _fd_offset(self):
+        '''Number of commands already written to fd. Replacing
+        :attr:`commands` starts over, the new commands are all written.'''
+
+        store, count = self._fd_written
+        if store is not self._commands:
+            return 0
+        return min(count, len(store))
+
+    def _write_fd(self):
+        lines = render(self._resolve(), self.shell, self._fd_offset())
+        self._fd_written = (self._commands, len(self._commands))
+        if not lines:
+            return 0
+        if self.fd in _written_fds:
+            lines.insert(0, '')
+        _written_fds.add(self.fd)
+        text = '\n'.join(lines)
+        with io.open(self.fd, 'w', closefd=False) as f:
+            f.write(text)
+        return encoded_size(text)
+
+    def _written(self, size, seconds):
+        self._writes += 1
+        self._write_time += seconds
+        self._bytes_written += size
+        for hook in self._write_hooks:
+            hook(self, size, seconds)
+
+    def render_all(self, shells=None):
+        '''Render this scrim for multiple shells in a single pass over
+        :attr:`commands`. Shares the render cache with :meth:`to_string`.
+
+        Arguments:
+            shells (list): Shells to render. Defaults to :data:`SHELLS`
+
+        Returns:
+            dict: mapping shell to script text
+
+        Raises:
+            RuntimeError: in stream mode
+        '''
 
-        with open(self.path, 'w') as f:
-            f.write(self.to_string())
+        self._check_not_streaming('render_all')
+        with self._lock:
+            return self._render_all(list(shells or SHELLS))
+
+    def _render_all(self, shells):
+        commands = self._resolve()
+        cached = set(
+            self._render_cache.get(shell, (None, None, None))[:2]
+            for shell in shells
+        )
+        count = 0
+        if len(cached) == 1:
+            version, count = cached.pop()
+            if version != commands.version or count > len(commands):
+                count = 0
+
+        texts = {}
+        if count < len(commands):
+            start = perf_counter()
+            rendered = render_all(commands, shells, count)
+            seconds = perf_counter() - start
+        else:
+            rendered = dict((shell, []) for shell in shells)
+
+        for shell, lines in rendered.items():
+            chunks = self._render_cache[shell][2] if count else []
+            if lines:
+                chunks.append('\n'.join(lines))
+            self._render_cache[shell] = (
+                commands.version,
+                len(commands),
+                chunks
+            )
+            texts[shell] = join_chunks(chunks)
+
+        if count < len(commands):
+            # A single pass renders all shells, split its time between them
+            for shell in shells:
+                self._rendered(shell, seconds / len(shells))
+        return texts
+
+    def write_all(self, paths):
+        '''Render this scrim for multiple shells in a single pass and write
+        the scripts concurrently.
+
+        Arguments:
+            paths (dict): mapping shell to output path
+
+        Examples:
+            >>> scrim.write_all({
+            ...     'bash': 'activate.sh',
+            ...     'cmd.exe': 'activate.bat',
+            ...     'powershell.exe': 'activate.ps1',
+            ... })
+        '''
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        start = perf_counter()
+        if self.auto_optimize:
+            self.optimize()
+
+        texts = self.render_all(paths)
+        with ThreadPoolExecutor(max_workers=len(paths) or 1) as executor:
+            futures = [
+                executor.submit(write_script, path, texts[shell])
+                for shell, path in paths.items()
+            ]
+        written = sum(future.result() for future in futures)
+        self._written(written, perf_counter() - start)
 
     def on_exit(self):
         '''atexit callback. If :attr:`Scrim.auto_write` is True write the
-        scrim to :attr:`Scrim.path` as :attr:`Scrim.shell`'''
+        scrim to :attr:`Scrim.path` as :attr:`Scrim.shell`. If
+        :attr:`Scrim.trace` is set the time spent writing is appended to the
+        trace file, see :mod:`scrim.trace`. Like writing, this only happens
+        for scrims that had commands added.'''
+
+        if not self.trace or self.worker:
+            return self._on_exit()
+
+        from scrim.trace import append_trace, python_record
+
+        exited = time.time()
+        self._on_exit()
+        append_trace(self.trace, python_record(
+            SCRIM_TRACE_ID,
+            _imported,
+            exited,
+            time.time(),
+            len(self.commands)
+        ))
+
+    def _on_exit(self):
+        while self._env_captures:
+            self._env_captures.pop().stop()
 
-        if not all([self.auto_write, self.commands, self.script, self.path]):
+        if getattr(sys, 'last_value', None) is not None:
+            # The tool is exiting with an uncaught exception, the scrim
+            # script also drops memos of calls exiting with a non-zero status
+            self._memo_inputs = None
+
+        output = (
+            self.path is not None or self.fd is not None or self.worker
+        )
+        writes = all([self.auto_write, self.script, output])
+        if writes:
+            # Only the scrim that writes takes the commands of the workers
+            self.collect_workers()
+        commands = self.commands or self.stream_writer
+        if not (writes and commands):
+            if self.stream_writer is not None:
+                self.stream_writer.discard()
+                self.stream_writer = None
             return
 
         self.write()
 
 
-def get_scrim(path=None, auto_write=None, shell=None, script=None, cache={}):
+def command_name(command):
+    '''Name of a command as counted by :meth:`CommandStore.counts`'''
+
+    if command.__class__ is Command:
+        return command.name
+    if command.__class__ is RawCommand:
+        return 'raw'
+    return command.__class__.__name__
+
+
+def join_chunks(chunks):
+    '''Join the rendered chunks of a render cache entry in place, so the
+    joined text is reused until new chunks are appended'''
+
+    if len(chunks) > 1:
+        chunks[:] = ['\n'.join(chunks)]
+    return chunks[0] if chunks else ''
+
+
+def encoded_size(text):
+    '''Size of text encoded as utf-8 in bytes'''
+
+    return len(text.encode('utf-8'))
+
+
+def write_script(path, text):
+    '''Write text to path creating missing directories
+
+    Returns:
+        int: number of bytes written
+    '''
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except:
+            raise OSError('Failed to create root for scrim output.')
+
+    # Written as bytes to count them, with the newlines text mode would use
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    data = text.encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def get_scrim(path=None, auto_write=None, shell=None, script=None,
+              stream=None, fd=None):
     '''Get a :class:`Scrim` instance. Each instance is cached so if you call
     get_scrim again with the same arguments you get the same instance.
 
@@ -256,7 +1487,13 @@ def get_scrim(path=None, auto_write=None, shell=None, script=None, cache={}):
         :class:`Scrim`
     '''
 
-    args = (path, auto_write, shell, script)
-    if args not in cache:
-        cache[args] = Scrim(*args)
-    return cache[args]
+    args = (path, auto_write, shell, script, stream, fd)
+    try:
+        return _scrims[args]
+    except KeyError:
+        pass
+
+    with _scrims_lock:
+        if args not in _scrims:
+            _scrims[args] = Scrim(*args)
+        return _scrims[args]
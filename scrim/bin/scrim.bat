@@ -1,4 +1,5 @@
 @echo off
+if defined SCRIM_TRACE call :now SCRIM_TRACE_T0
 call :setdefault PY_ENTRY_POINT {{py_entry_point}}.exe
 call :setdefault SCRIM_AUTO_WRITE {{auto_write}}
 call :setdefault SCRIM_LOG %temp%\scrim_log.txt
@@ -15,7 +16,12 @@ call :debug "       SCRIM_SHELL: %SCRIM_SHELL%"
 call :debug "       SCRIM_DEBUG: %SCRIM_DEBUG%"
 call :debug "executing %PY_ENTRY_POINT%"
 
+if defined SCRIM_TRACE (
+    set SCRIM_TRACE_ID=%RANDOM%-%SCRIM_TRACE_T0%
+    call :now SCRIM_TRACE_T1
+)
 %PY_ENTRY_POINT% %*
+if defined SCRIM_TRACE call :now SCRIM_TRACE_T2
 
 if exist %SCRIM_PATH% (
     goto :try
@@ -37,6 +43,14 @@ if not defined %1 (
 goto :eof
 
 
+:now
+:: Store the centiseconds since midnight in the variable named %1
+for /f "tokens=1-4 delims=:.," %%a in ("%TIME: =0%") do (
+    set /a "%1=(((1%%a-100)*60+(1%%b-100))*60+(1%%c-100))*100+(1%%d-100)"
+)
+goto :eof
+
+
 :unset
 if defined LOCAL_%1 (
     set LOCAL_%1=
@@ -76,6 +90,11 @@ if exist %SCRIM_PATH% (
     del %SCRIM_PATH%
 )
 
+if defined SCRIM_TRACE (
+    call :now SCRIM_TRACE_T3
+    call :trace
+)
+
 
 call :unset SCRIM_AUTO_WRITE
 call :unset SCRIM_LOG
@@ -83,3 +102,15 @@ call :unset SCRIM_PATH
 call :unset SCRIM_SCRIPT
 call :unset SCRIM_SHELL
 call :unset SCRIM_DEBUG
+set SCRIM_TRACE_ID=
+set SCRIM_TRACE_T0=
+set SCRIM_TRACE_T1=
+set SCRIM_TRACE_T2=
+set SCRIM_TRACE_T3=
+goto :eof
+
+
+:trace
+:: Timestamps are centiseconds since midnight, see scrim.trace
+>> "%SCRIM_TRACE%" echo {"id": "%SCRIM_TRACE_ID%", "source": "cmd.exe", "clock": "day", "entry_point": "%PY_ENTRY_POINT%", "transport": "path", "start": %SCRIM_TRACE_T0%, "python_start": %SCRIM_TRACE_T1%, "python_end": %SCRIM_TRACE_T2%, "applied": %SCRIM_TRACE_T3%}
+goto :eof
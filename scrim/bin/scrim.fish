@@ -0,0 +1,43 @@
+function {{entry_point}}
+
+    set -l py_entry_point "{{py_entry_point}}"
+
+    # Variables set with -lx are exported and removed when we return
+    set -q SCRIM_AUTO_WRITE; or set -lx SCRIM_AUTO_WRITE {{auto_write}}
+    set -lx SCRIM_SCRIPT (status current-filename)
+    set -q SCRIM_SHELL; or set -lx SCRIM_SHELL fish
+    set -q SCRIM_DEBUG; or set -lx SCRIM_DEBUG 0
+    set -q SCRIM_PATH; or set -lx SCRIM_PATH (mktemp)
+
+    if test "$SCRIM_DEBUG" = 1
+        echo "Variables:"
+        echo "  SCRIM_AUTO_WRITE: $SCRIM_AUTO_WRITE"
+        echo "        SCRIM_PATH: $SCRIM_PATH"
+        echo "      SCRIM_SCRIPT: $SCRIM_SCRIPT"
+        echo "       SCRIM_SHELL: $SCRIM_SHELL"
+        echo "       SCRIM_DEBUG: $SCRIM_DEBUG"
+        echo "executing $py_entry_point"
+    end
+
+    $py_entry_point $argv
+    # Exit status of the tool, returned once the scrim is applied
+    set -l _scrim_status $status
+
+    if test -s "$SCRIM_PATH"
+
+        source "$SCRIM_PATH"
+        or begin
+            echo "[scrim] error executing:"
+            echo ""
+            cat "$SCRIM_PATH"
+            echo
+        end
+
+    end
+
+    test "$SCRIM_DEBUG" = 1; and echo "Removing $SCRIM_PATH"
+    rm -f "$SCRIM_PATH"
+
+    return $_scrim_status
+
+end
@@ -5,6 +5,12 @@ function Debug([string]$msg){
 }
 
 
+function Get-Timestamp(){
+    # Seconds since the epoch
+    ([DateTime]::UtcNow.Ticks - 621355968000000000) / 1e7
+}
+
+
 function Set-Default([string]$var, $value){
     # Sets environment variable only if it is undefined
     # If it is undefined create a new variable prefixed with LOCAL marking
@@ -25,6 +31,16 @@ function Unset-Item([string]$var){
 }
 
 
+if ($env:SCRIM_TRACE) {
+    $scrim_trace = [ordered]@{
+        id = "$PID-$(Get-Timestamp)"
+        source = "powershell"
+        entry_point = "{{py_entry_point}}"
+        transport = "path"
+        start = Get-Timestamp
+    }
+    $env:SCRIM_TRACE_ID = $scrim_trace.id
+}
 $py_entry_point="{{py_entry_point}}.exe"
 Set-Default SCRIM_AUTO_WRITE "{{auto_write}}"
 Set-Default SCRIM_PATH "$env:TEMP\scrim_out.ps1"
@@ -41,7 +57,9 @@ Debug "       SCRIM_SHELL: $env:SCRIM_SHELL"
 Debug "       SCRIM_DEBUG: $env:SCRIM_DEBUG"
 Debug "executing $py_entry_point"
 
+if ($env:SCRIM_TRACE) { $scrim_trace.python_start = Get-Timestamp }
 & $py_entry_point $args
+if ($env:SCRIM_TRACE) { $scrim_trace.python_end = Get-Timestamp }
 
 if (Test-Path $env:SCRIM_PATH) {
     Debug "found $env:SCRIM_PATH"
@@ -67,6 +85,15 @@ if (Test-Path $env:SCRIM_PATH) {
 }
 
 
+if ($env:SCRIM_TRACE) {
+    $scrim_trace.applied = Get-Timestamp
+    $scrim_line = $scrim_trace | ConvertTo-Json -Compress
+    Add-Content -Path $env:SCRIM_TRACE -Value $scrim_line
+    Remove-Variable scrim_trace, scrim_line
+    Remove-Item Env:SCRIM_TRACE_ID
+}
+
+
 Remove-Variable py_entry_point
 Unset-Item SCRIM_AUTO_WRITE
 Unset-Item SCRIM_DEBUG
@@ -1,11 +1,16 @@
 #!/bin/bash
 
+_scrim_now () {
+    # Store the time in seconds since the epoch in the variable named $1
+    local now="${EPOCHREALTIME:-$(date +%s.%N)}"
+    printf -v "$1" '%s' "${now/,/.}"
+}
+
 {{entry_point}} () {
 
+    [ -n "$SCRIM_TRACE" ] && _scrim_now _scrim_t0
     py_entry_point="{{py_entry_point}}"
-    _tmpdir=$(mktemp -d)
     export SCRIM_AUTO_WRITE="${SCRIM_AUTO_WRITE:={{auto_write}}}"
-    export SCRIM_PATH="${SCRIM_PATH:=$_tmpdir/scrim_out.sh}"
     export SCRIM_SCRIPT="${0}"
     export SCRIM_SHELL="${SCRIM_SHELL:=bash}"
     export SCRIM_DEBUG="${SCRIM_DEBUG:=0}"
@@ -19,20 +24,120 @@
     $debug && echo "       SCRIM_DEBUG: $SCRIM_DEBUG"
     $debug && echo "executing $py_entry_point"
 
-    $py_entry_point "$@"
+    if [ -n "$SCRIM_TRACE" ]; then
+        export SCRIM_TRACE_ID="$$-$_scrim_t0"
+        _scrim_now _scrim_t1
+    fi
+
+    # Entry points that called Scrim.memoize have a memo directory, source
+    # the cached scrim of this call if it is still valid
+    _scrim_memo_dir="${SCRIM_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/scrim}/memo"
+    _scrim_memo_hit=
+    # Exit status of the tool, returned once the scrim is applied
+    local _scrim_status=0
+    if [ -d "$_scrim_memo_dir/$py_entry_point" ]; then
+        printf -v _scrim_memo_key '%q ' \
+            "$SCRIM_SHELL" "$py_entry_point" "$PWD" "$@"
+        _scrim_memo=$(cksum <<< "$_scrim_memo_key")
+        _scrim_memo="$_scrim_memo_dir/$py_entry_point/${_scrim_memo// /-}.sh"
+        export SCRIM_MEMO="$_scrim_memo"
+        export SCRIM_MEMO_KEY="$_scrim_memo_key"
+        if [ -f "$_scrim_memo" ] && [ -O "$_scrim_memo" ]; then
+            source "$_scrim_memo"
+        fi
+    fi
+
+    _scrim_sock="${SCRIM_DAEMON_SOCKET:-${TMPDIR:-/tmp}/scrim-$UID/daemon.sock}"
+    if [ -n "$_scrim_memo_hit" ]; then
 
-    if [ -e "$SCRIM_PATH" ]; then
+        [ -n "$SCRIM_TRACE" ] && _scrim_now _scrim_t2
+        _scrim_transport=memo
+        $debug && echo "sourced $_scrim_memo"
 
-        source "$SCRIM_PATH"
+    # Only daemons of this user get the environment, console scripts the
+    # daemon can't find fall back to running directly
+    elif [ -S "$_scrim_sock" ] && [ -O "$_scrim_sock" ] &&
+        [ -O "${_scrim_sock%/*}" ] &&
+        command -v socat > /dev/null && _scrim_out=$(
+        { printf '%s\0' "$py_entry_point" "$PWD" "$#" "$@"; env -0; } |
+        socat -t 86400 - UNIX-CONNECT:"$_scrim_sock" 2> /dev/null
+    ) && [ "$_scrim_out" != _scrim_fallback=1 ]; then
+
+        [ -n "$SCRIM_TRACE" ] && _scrim_now _scrim_t2
+        _scrim_transport=daemon
+        $debug && echo "executed $py_entry_point in $_scrim_sock"
+        eval "$_scrim_out"
 
         if [ $? -ne 0 ]; then
             echo "[scrim] error executing:"
             echo ""
-            cat $SCRIM_PATH
+            echo "$_scrim_out"
             echo
         fi
 
-        $debug && echo "Removing $SCRIM_PATH"
+    elif [ -n "$SCRIM_PATH" ]; then
+
+        export SCRIM_PATH
+        $py_entry_point "$@"
+        _scrim_status=$?
+        [ -n "$SCRIM_TRACE" ] && _scrim_now _scrim_t2
+        _scrim_transport=path
+
+        if [ -e "$SCRIM_PATH" ]; then
+
+            source "$SCRIM_PATH"
+
+            if [ $? -ne 0 ]; then
+                echo "[scrim] error executing:"
+                echo ""
+                cat $SCRIM_PATH
+                echo
+            fi
+
+            $debug && echo "Removing $SCRIM_PATH"
+            rm -f "$SCRIM_PATH"
+        fi
+
+    else
+
+        # Python writes the scrim to fd 3 which is captured here, its stdout
+        # is passed through on fd 4
+        {
+            _scrim_out=$(SCRIM_FD=3 $py_entry_point "$@" 3>&1 1>&4 4>&-)
+        } 4>&1
+        _scrim_status=$?
+        [ -n "$SCRIM_TRACE" ] && _scrim_now _scrim_t2
+        _scrim_transport=fd
+
+        if [ -n "$_scrim_out" ]; then
+
+            eval "$_scrim_out"
+
+            if [ $? -ne 0 ]; then
+                echo "[scrim] error executing:"
+                echo ""
+                echo "$_scrim_out"
+                echo
+            fi
+
+        fi
+
+    fi
+
+    # Calls that failed are not memoized, however the tool exited
+    if [ "$_scrim_status" -ne 0 ] && [ -n "$_scrim_memo" ]; then
+        rm -f "$_scrim_memo"
+    fi
+
+    if [ -n "$SCRIM_TRACE" ]; then
+        _scrim_now _scrim_t3
+        # A single printf so concurrent calls append whole lines
+        _scrim_fmt='{"id": "%s", "source": "bash", "entry_point": "%s", '
+        _scrim_fmt+='"transport": "%s", "start": %s, "python_start": %s, '
+        _scrim_fmt+='"python_end": %s, "applied": %s}\n'
+        printf "$_scrim_fmt" "$SCRIM_TRACE_ID" "$py_entry_point" \
+            "$_scrim_transport" "$_scrim_t0" "$_scrim_t1" "$_scrim_t2" \
+            "$_scrim_t3" >> "$SCRIM_TRACE"
     fi
 
     $debug && echo "Unset environment variables."
@@ -43,6 +148,14 @@
     unset SCRIM_SHELL
     unset SCRIM_DEBUG
     unset debug
-    rm -rf $_tmpdir
+    unset _scrim_sock
+    unset SCRIM_MEMO SCRIM_MEMO_KEY
+    unset _scrim_memo _scrim_memo_dir _scrim_memo_key _scrim_memo_hit
+    unset _scrim_out
+    unset _scrim_transport _scrim_fmt
+    unset _scrim_t0 _scrim_t1 _scrim_t2 _scrim_t3
+    unset SCRIM_TRACE_ID
+
+    return $_scrim_status
 
 }
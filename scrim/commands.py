@@ -7,14 +7,273 @@ Implements functionality available across multiple shell scripting languages.
 '''
 from __future__ import absolute_import
 import abc
-from collections import namedtuple
-from fstrings import f
-import ntpath
-import posixpath
+from array import array
+from itertools import count, islice
+from operator import itemgetter
 
 ABC = abc.ABCMeta('ABC', (object,), {})
-Command = namedtuple('Command', 'name args kwargs')
-RawCommand = namedtuple('RawCommand', 'command required_shell')
+
+
+class Command(tuple):
+    '''Command(name, args, kwargs)
+
+    Equivalent to a namedtuple without the cost of importing collections.
+    '''
+
+    __slots__ = ()
+    _fields = ('name', 'args', 'kwargs')
+
+    def __new__(cls, name, args, kwargs):
+        return tuple.__new__(cls, (name, args, kwargs))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __repr__(self):
+        return 'Command(name={!r}, args={!r}, kwargs={!r})'.format(*self)
+
+    name = property(itemgetter(0))
+    args = property(itemgetter(1))
+    kwargs = property(itemgetter(2))
+
+
+class RawCommand(tuple):
+    '''RawCommand(command, required_shell)
+
+    Equivalent to a namedtuple without the cost of importing collections.
+    '''
+
+    __slots__ = ()
+    _fields = ('command', 'required_shell')
+
+    def __new__(cls, command, required_shell):
+        return tuple.__new__(cls, (command, required_shell))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __repr__(self):
+        return 'RawCommand(command={!r}, required_shell={!r})'.format(*self)
+
+    command = property(itemgetter(0))
+    required_shell = property(itemgetter(1))
+
+
+# Commands are stored as interned opcodes, RAW and OTHER are reserved for
+# RawCommands and objects of any other type.
+RAW = 0
+OTHER = 1
+OPCODE_NAMES = [None, None]
+OPCODES = {}
+
+
+def intern_opcode(name):
+    '''Get the opcode for a command name, adding it if necessary'''
+
+    try:
+        return OPCODES[name]
+    except KeyError:
+        OPCODES[name] = len(OPCODE_NAMES)
+        OPCODE_NAMES.append(name)
+        return OPCODES[name]
+
+
+class CommandStore(object):
+    '''A compact sequence of commands. Instead of a Command with an args
+    tuple and a kwargs dict per entry, commands are stored as an array of
+    interned opcodes, a flat list of arguments, an array of offsets into the
+    arguments and a dict holding the kwargs of the few commands that have
+    them. Commands are materialized when indexed or iterated.
+
+    Appending and extending leave :attr:`version` alone, every other
+    modification increments it. This allows renders of the store to be cached
+    and extended with only the commands appended since.
+    '''
+
+    __slots__ = ('_ops', '_offsets', '_args', '_kwargs', 'version')
+
+    def __init__(self, iterable=()):
+        self.version = 0
+        self._reset()
+        self.extend(iterable)
+
+    def _reset(self):
+        self._ops = array('H')
+        self._offsets = array('L', [0])
+        self._args = []
+        self._kwargs = {}
+
+    def _modify(self, method, *args):
+        items = list(self)
+        result = method(items, *args)
+        self._reset()
+        self.extend(items)
+        self.version += 1
+        return result
+
+    def _get(self, index):
+        op = self._ops[index]
+        args = self._args[self._offsets[index]:self._offsets[index + 1]]
+        if op == RAW:
+            return RawCommand(*args)
+        if op == OTHER:
+            return args[0]
+        kwargs = self._kwargs.get(index, {})
+        return Command(OPCODE_NAMES[op], tuple(args), kwargs)
+
+    def add(self, name, args, kwargs):
+        '''Append a command without creating a Command'''
+
+        if kwargs:
+            self._kwargs[len(self._ops)] = kwargs
+        try:
+            self._ops.append(OPCODES[name])
+        except KeyError:
+            self._ops.append(intern_opcode(name))
+        self._args.extend(args)
+        self._offsets.append(len(self._args))
+
+    def append(self, command):
+        cls = command.__class__
+        if cls is Command:
+            self.add(*command)
+            return
+
+        if cls is RawCommand:
+            self._ops.append(RAW)
+            self._args.extend(command)
+        else:
+            self._ops.append(OTHER)
+            self._args.append(command)
+        self._offsets.append(len(self._args))
+
+    def extend(self, commands):
+        for command in commands:
+            self.append(command)
+
+    def add_many(self, entries):
+        '''Append (name, args, kwargs) entries like :meth:`add`. Entries
+        with a name of None hold a command to :meth:`append` in args.'''
+
+        ops = self._ops
+        offsets = self._offsets
+        all_args = self._args
+        for name, args, kwargs in entries:
+            if name is None:
+                self.append(args)
+                continue
+            if kwargs:
+                self._kwargs[len(ops)] = kwargs
+            try:
+                ops.append(OPCODES[name])
+            except KeyError:
+                ops.append(intern_opcode(name))
+            all_args.extend(args)
+            offsets.append(len(all_args))
+
+    def counts(self):
+        '''Number of commands by name. RawCommands are counted as raw and
+        other objects by their class name.
+
+        Returns:
+            dict: mapping name to count
+        '''
+
+        ops = self._ops
+        counts = {}
+        for op in set(ops):
+            if op == RAW:
+                counts['raw'] = ops.count(op)
+            elif op != OTHER:
+                counts[OPCODE_NAMES[op]] = ops.count(op)
+
+        if OTHER in ops:
+            for i, op in enumerate(ops):
+                if op == OTHER:
+                    name = self._args[self._offsets[i]].__class__.__name__
+                    counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def __iadd__(self, commands):
+        self.extend(commands)
+        return self
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('CommandStore index out of range')
+        return self._get(index)
+
+    def __iter__(self):
+        for i in range(len(self._ops)):
+            yield self._get(i)
+
+    def __eq__(self, other):
+        if isinstance(other, (CommandStore, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'CommandStore({!r})'.format(list(self))
+
+    def index(self, value):
+        return list(self).index(value)
+
+    def count(self, value):
+        return list(self).count(value)
+
+    def __setitem__(self, index, value):
+        self._modify(list.__setitem__, index, value)
+
+    def __delitem__(self, index):
+        self._modify(list.__delitem__, index)
+
+    def __imul__(self, value):
+        self._modify(list.__imul__, value)
+        return self
+
+    def insert(self, index, value):
+        self._modify(list.insert, index, value)
+
+    def remove(self, value):
+        self._modify(list.remove, value)
+
+    def pop(self, index=-1):
+        if index not in (-1, len(self) - 1):
+            return self._modify(list.pop, index)
+
+        command = self[-1]
+        index = len(self) - 1
+        del self._ops[index]
+        del self._offsets[-1]
+        del self._args[self._offsets[-1]:]
+        self._kwargs.pop(index, None)
+        self.version += 1
+        return command
+
+    def clear(self):
+        self._reset()
+        self.version += 1
+
+    def sort(self, *args, **kwargs):
+        self._modify(list.sort, *args, **kwargs)
+
+    def reverse(self):
+        self._modify(list.reverse)
 
 
 class CommandExecutor(object):
@@ -26,17 +285,121 @@ class CommandExecutor(object):
     def __call__(self, command, shell):
 
         if isinstance(command, Command):
-            method = getattr(SHELL_COMMANDS[shell], command.name)
-            return method(*command.args, **command.kwargs)
+            if command.kwargs:
+                method = getattr(get_shell_commands(shell), command.name)
+                return method(*command.args, **command.kwargs)
+            return get_shell_commands(shell).table[command.name](*command.args)
 
         elif isinstance(command, RawCommand):
             if shell == command.required_shell:
                 return command.command
 
         else:
-            raise TypeError(f(
-                'command must be Command or RawCommand not {}', type(command)
-            ))
+            raise TypeError(
+                'command must be Command or RawCommand not {}'.format(
+                    type(command)
+                )
+            )
+
+
+def render(commands, shell, start=0):
+    '''Render a sequence of commands to a list of lines for shell. This is
+    the hot path used by :meth:`Scrim.to_string`, it dispatches through the
+    precompiled :attr:`ShellCommands.table` and only falls back to the
+    :class:`CommandExecutor` for commands with kwargs or unknown types.
+
+    Arguments:
+        commands: CommandStore or sequence of commands
+        shell (str): Shell to render for
+        start (int): Index of the first command to render
+    '''
+
+    return render_all(commands, [shell], start)[shell]
+
+
+def render_all(commands, shells, start=0):
+    '''Render a sequence of commands for multiple shells in a single pass.
+    Each command is unpacked once and rendered through the
+    :attr:`ShellCommands.table` of every shell.
+
+    Arguments:
+        commands: CommandStore or sequence of commands
+        shells (list): Shells to render for
+        start (int): Index of the first command to render
+
+    Returns:
+        dict: mapping shell to a list of lines
+    '''
+
+    if not isinstance(commands, CommandStore):
+        commands = CommandStore(islice(commands, start, None))
+        start = 0
+
+    executor = CommandExecutor()
+    output = dict((shell, []) for shell in shells)
+    tables = [
+        (get_shell_commands(shell).table, output[shell].append)
+        for shell in shells
+    ]
+    names = OPCODE_NAMES
+    argv = commands._args
+    kwargs = commands._kwargs
+    entries = zip(
+        count(start),
+        islice(commands._ops, start, None),
+        islice(commands._offsets, start, None),
+        islice(commands._offsets, start + 1, None),
+    )
+
+    if len(tables) == 1:
+        # Skip the inner loop over shells when rendering a single shell
+        (table, append), = tables
+        for i, op, a, b in entries:
+            if op > OTHER and i not in kwargs:
+                append(table[names[op]](*argv[a:b]))
+            elif op == RAW:
+                if argv[a + 1] in output:
+                    append(argv[a])
+            else:
+                text = executor(commands[i], shells[0])
+                if text is not None:
+                    append(text)
+        return output
+
+    for i, op, a, b in entries:
+        if op > OTHER and i not in kwargs:
+            name = names[op]
+            args = argv[a:b]
+            for table, append in tables:
+                append(table[name](*args))
+        elif op == RAW:
+            if argv[a + 1] in output:
+                output[argv[a + 1]].append(argv[a])
+        else:
+            command = commands[i]
+            for shell in shells:
+                text = executor(command, shell)
+                if text is not None:
+                    output[shell].append(text)
+    return output
+
+
+def _normalized(render_template, normpath):
+    def render_path(path):
+        return render_template(normpath(path))
+    return render_path
+
+
+def _batched(prefix, render_item, separator):
+    def render_batch(items):
+        return prefix + separator.join([render_item(*item) for item in items])
+    return render_batch
+
+
+def _batched_names(prefix, render_item, separator):
+    def render_batch(names):
+        return prefix + separator.join([render_item(name) for name in names])
+    return render_batch
 
 
 class ShellCommands(ABC):
@@ -44,8 +407,8 @@ class ShellCommands(ABC):
     the common commands we want to define for all shells.
 
     Sometimes commands are available across multiple shells like: cd. For
-    clarity we define these commands for each implementation anyways instead of
-    using inheritance.
+    clarity we define the templates for these commands for each
+    implementation anyways instead of using inheritance.
 
     We only cover commands with functonality present in all the shells we
     support. Special cases can be handled using :meth:`Scrim.raw`.
@@ -63,6 +426,24 @@ class ShellCommands(ABC):
     even when batch has no direct analogy. This provides users with a
     memorable set of commands that cover all shells.
 
+    Implementations define a format template for each command in
+    :attr:`templates`. Arguments are passed positionally to the templates.
+    Batch commands like `set_env_many` are defined in
+    :attr:`batch_templates` as a tuple of (prefix, item template, separator).
+    The commands in :attr:`path_commands` normalize their first argument
+    using the normpath function of :attr:`path_module`. The templates are
+    compiled once per shell into :attr:`table`, a dict mapping command names
+    to render functions.
+
+    echo, set, set_env and set_env_many accept quote=True to quote their
+    values with :meth:`quote`, using the function named by
+    :attr:`quote_function` in :mod:`scrim.quoting`. Quoted values are
+    rendered with :attr:`quoted_table`, compiled from :attr:`templates`
+    updated with :attr:`quote_templates`.
+
+    set_path renders a :class:`scrim.paths.PathList` as a quoted set_env,
+    joining the paths with :attr:`path_separator`.
+
     Attributes:
         shell: Should match the SCRIM_SHELL value set in one of the scrim
             scripts. For example:
@@ -70,162 +451,281 @@ class ShellCommands(ABC):
         - scrim.bat defines SCRIM_SHELL as cmd.exe
         - scrim.ps1 defines SCRIM_SHELL as powershell.exe
         - scrim.sh defines SCRIM_SHELL as bash
+        templates: Mapping of command names to format strings
+        batch_templates: Mapping of batch command names to tuples of
+            (prefix, item template, separator)
+        path_module: Name of the module used to normalize paths
+        quote_function: Name of the function in :mod:`scrim.quoting` used
+            to quote values
+        quote_templates: Mapping of command names to the templates or batch
+            templates used for quoted values
+        path_separator: Separator of the paths in variables like PATH
+        extension: File extension of scripts for this shell, like the scrim
+            script of the shell
     '''
 
+    path_commands = ('cd', 'pushd', 'cat')
+    extension = None
+    path_separator = ':'
+    quote_function = None
+    quote_templates = {}
+    _table = None
+    _quoted_table = None
+    _quote = None
+
     @abc.abstractproperty
     def shell(self):
         raise NotImplementedError
 
-    @abc.abstractmethod
-    def execute(self, expression):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def echo(self, message):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def set(self, var, value):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def unset(self, var):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def set_env(self, var, value):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def unset_env(self, var):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def cd(self, path):
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def pushd(self, path):
+    @abc.abstractproperty
+    def templates(self):
         raise NotImplementedError
 
-    @abc.abstractmethod
-    def popd(self):
+    @abc.abstractproperty
+    def batch_templates(self):
         raise NotImplementedError
 
-    @abc.abstractmethod
-    def cat(self):
+    @abc.abstractproperty
+    def path_module(self):
         raise NotImplementedError
 
-
-class BatchCommands(ShellCommands):
-
-    shell = 'cmd.exe'
+    def compile(self, quoted=False):
+        '''Compile :attr:`templates` to a dict of render functions. When
+        quoted is True :attr:`quote_templates` replace the templates.'''
+
+        templates = self.templates
+        batch_templates = self.batch_templates
+        if quoted:
+            templates = dict(templates)
+            batch_templates = dict(batch_templates)
+            for name, template in self.quote_templates.items():
+                if name in batch_templates:
+                    batch_templates[name] = template
+                else:
+                    templates[name] = template
+
+        normpath = __import__(self.path_module).normpath
+        table = {}
+        for name, template in templates.items():
+            if name in self.path_commands:
+                table[name] = _normalized(template.format, normpath)
+            else:
+                table[name] = template.format
+
+        prefix, item, separator = batch_templates['set_env_many']
+        table['set_env_many'] = _batched(prefix, item.format, separator)
+        prefix, item, separator = batch_templates['unset_env_many']
+        table['unset_env_many'] = _batched_names(
+            prefix,
+            item.format,
+            separator
+        )
+        table['set_path'] = self.set_path
+        return table
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = self.compile()
+        return self._table
+
+    @property
+    def quoted_table(self):
+        if self._quoted_table is None:
+            if self.quote_templates:
+                self._quoted_table = self.compile(quoted=True)
+            else:
+                self._quoted_table = self.table
+        return self._quoted_table
+
+    def quote(self, value):
+        '''Quote value so this shell reads it literally'''
+
+        if self._quote is None:
+            if self.quote_function is None:
+                raise NotImplementedError(
+                    '{} does not support quoting'.format(self.shell)
+                )
+            from scrim import quoting
+            self._quote = getattr(quoting, self.quote_function)
+        return self._quote(value)
 
     def execute(self, expression):
-        return f('call {expression}')
+        return self.table['execute'](expression)
 
-    def echo(self, message):
-        return f('echo {message}')
+    def echo(self, message, quote=False):
+        if quote:
+            return self.quoted_table['echo'](self.quote(message))
+        return self.table['echo'](message)
 
-    def set(self, var, value):
-        return f('set "{var}={value}"')
+    def set(self, var, value, quote=False):
+        if quote:
+            return self.quoted_table['set'](var, self.quote(value))
+        return self.table['set'](var, value)
 
     def unset(self, var):
-        return f('set "{var}="')
-
-    set_env = set
-    unset_env = unset
-
-    def cd(self, path):
-        path = ntpath.normpath(path)
-        return f('cd {path}')
-
-    def pushd(self, path):
-        path = ntpath.normpath(path)
-        return f('pushd {path}')
-
-    def popd(self):
-        return 'popd'
-
-    def cat(self, path):
-        path = ntpath.normpath(path)
-        return f('type {path}')
-
+        return self.table['unset'](var)
 
-class PowershellCommands(ShellCommands):
-
-    shell = 'powershell.exe'
+    def set_env(self, var, value, quote=False):
+        if quote:
+            return self.quoted_table['set_env'](var, self.quote(value))
+        return self.table['set_env'](var, value)
 
-    def execute(self, expression):
-        return f('Invoke-Expression {expression}')
-
-    def echo(self, message):
-        return f('Write-Host {message}')
-
-    def set(self, var, value):
-        return f('${var}={value}')
+    def unset_env(self, var):
+        return self.table['unset_env'](var)
 
-    def unset(self, var, value):
-        return f('Remove-Variable {var}')
+    def set_env_many(self, pairs, quote=False):
+        if quote:
+            pairs = [(var, self.quote(value)) for var, value in pairs]
+            return self.quoted_table['set_env_many'](pairs)
+        return self.table['set_env_many'](pairs)
 
-    def set_env(self, var, value):
-        return f('$env:{var}={value}')
+    def unset_env_many(self, names):
+        return self.table['unset_env_many'](names)
 
-    def unset_env(self, var, value):
-        return f('Remove-Item Env:{var}')
+    def set_path(self, var, paths):
+        value = self.path_separator.join(paths)
+        if self.quote_function is None:
+            return self.table['set_env'](var, value)
+        return self.quoted_table['set_env'](var, self.quote(value))
 
     def cd(self, path):
-        path = ntpath.normpath(path)
-        return f('cd {path}')
+        return self.table['cd'](path)
 
     def pushd(self, path):
-        path = ntpath.normpath(path)
-        return f('Push-Location -Path "{path}"')
+        return self.table['pushd'](path)
 
     def popd(self):
-        return 'Pop-Location'
+        return self.table['popd']()
 
     def cat(self, path):
-        path = ntpath.normpath(path)
-        return f('Get-Content {path}')
-
-
-class BashCommands(ShellCommands):
-
-    shell = 'bash'
-
-    def execute(self, expression):
-        return f('$({expression})')
+        return self.table['cat'](path)
 
-    def echo(self, message):
-        return f('echo {message}')
 
-    def set(self, var, value):
-        return f('{var}={value}')
-
-    def unset(self, var):
-        return f('unset {var}')
-
-    def set_env(self, var, value):
-        return f('export {var}={value}')
+class BatchCommands(ShellCommands):
 
-    def unset_env(self, var):
-        return f('unset {var}')
+    shell = 'cmd.exe'
+    extension = '.bat'
+    path_module = 'ntpath'
+    path_separator = ';'
+    quote_function = 'quote_cmd'
+    templates = {
+        'execute': 'call {0}',
+        'echo': 'echo {0}',
+        'set': 'set "{0}={1}"',
+        'unset': 'set "{0}="',
+        'set_env': 'set "{0}={1}"',
+        'unset_env': 'set "{0}="',
+        'cd': 'cd {0}',
+        'pushd': 'pushd {0}',
+        'popd': 'popd',
+        'cat': 'type {0}',
+    }
+    batch_templates = {
+        # One set per line keeps lines below cmd.exe's 8191 character limit
+        'set_env_many': ('', 'set "{0}={1}"', '\n'),
+        'unset_env_many': ('', 'set "{0}="', '\n'),
+    }
+    # Quoted values escape special characters outside of double quotes
+    quote_templates = {
+        'set': 'set {0}={1}',
+        'set_env': 'set {0}={1}',
+        'set_env_many': ('', 'set {0}={1}', '\n'),
+    }
+
+    def set_path(self, var, paths):
+        # cmd.exe can't hold an empty variable, an empty path list unsets it
+        if not paths:
+            return self.table['unset_env'](var)
+        return super(BatchCommands, self).set_path(var, paths)
 
-    def cd(self, path):
-        path = posixpath.normpath(path)
-        return f('cd {path}')
 
-    def pushd(self, path):
-        path = posixpath.normpath(path)
-        return f('pushd {path}')
+class PowershellCommands(ShellCommands):
 
-    def popd(self):
-        return 'popd'
+    shell = 'powershell.exe'
+    extension = '.ps1'
+    path_module = 'ntpath'
+    path_separator = ';'
+    quote_function = 'quote_powershell'
+    templates = {
+        'execute': 'Invoke-Expression {0}',
+        'echo': 'Write-Host {0}',
+        'set': '${0}={1}',
+        'unset': 'Remove-Variable {0}',
+        'set_env': '$env:{0}={1}',
+        'unset_env': 'Remove-Item Env:{0}',
+        'cd': 'cd {0}',
+        'pushd': 'Push-Location -Path "{0}"',
+        'popd': 'Pop-Location',
+        'cat': 'Get-Content {0}',
+    }
+    batch_templates = {
+        'set_env_many': ('', '$env:{0}={1}', '; '),
+        'unset_env_many': ('Remove-Item ', 'Env:{0}', ', '),
+    }
 
-    def cat(self, path):
-        path = posixpath.normpath(path)
-        return f('cat {path}')
 
+class BashCommands(ShellCommands):
 
-SHELL_COMMANDS = dict((c.shell, c()) for c in ShellCommands.__subclasses__())
+    shell = 'bash'
+    extension = '.sh'
+    path_module = 'posixpath'
+    quote_function = 'quote_bash'
+    templates = {
+        'execute': '$({0})',
+        'echo': 'echo {0}',
+        'set': '{0}={1}',
+        'unset': 'unset {0}',
+        'set_env': 'export {0}={1}',
+        'unset_env': 'unset {0}',
+        'cd': 'cd {0}',
+        'pushd': 'pushd {0}',
+        'popd': 'popd',
+        'cat': 'cat {0}',
+    }
+    batch_templates = {
+        'set_env_many': ('export ', '{0}={1}', ' '),
+        'unset_env_many': ('unset ', '{0}', ' '),
+    }
+
+
+_shell_commands = {}
+
+
+def _find_subclass(shell, cls=ShellCommands):
+    for subclass in cls.__subclasses__():
+        if subclass.shell == shell:
+            return subclass
+        found = _find_subclass(shell, subclass)
+        if found is not None:
+            return found
+
+
+def get_shell_commands(shell):
+    '''Get the ShellCommands instance for shell. Backends are looked up in
+    the :mod:`scrim.shells` registry, falling back to ShellCommands subclasses
+    that are already defined, and are instantiated on first use.'''
+
+    try:
+        return _shell_commands[shell]
+    except KeyError:
+        from scrim.shells import load_backend
+        try:
+            cls = load_backend(shell)
+        except KeyError:
+            cls = _find_subclass(shell)
+            if cls is None:
+                raise KeyError(shell)
+        _shell_commands[shell] = cls()
+        return _shell_commands[shell]
+
+
+def __getattr__(name):
+    if name == 'SHELL_COMMANDS':
+        from scrim.shells import get_index
+        for shell in get_index():
+            get_shell_commands(shell)
+        return _shell_commands
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name)
+    )
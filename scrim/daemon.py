@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+'''
+============
+scrim.daemon
+============
+A warm interpreter for scrim wrapped tools. The daemon listens on a per-user
+unix socket and keeps the modules of your console scripts imported. Each
+request forks the daemon, runs the entry point in the child against a fresh
+:class:`scrim.Scrim` and sends back the rendered scrim script.
+
+The bash scrim script uses the daemon when its socket exists and socat is
+available, otherwise it falls back to running the console script directly.
+Requests are NUL separated fields sent by the scrim script::
+
+    py_entry_point \\0 cwd \\0 argc \\0 arg... \\0 NAME=VALUE \\0 ...
+
+The response is a bash script which stores the tools exit status in
+_scrim_status, replays its stdout and stderr and then runs the scrim
+commands. The scrim script returns that status. Requests for console scripts
+the daemon can't find are answered with :data:`FALLBACK_RESPONSE`, the scrim
+script then runs the console script directly.
+
+The socket directory must be owned by the user and private to them, the
+daemon refuses to start otherwise. The scrim script only connects to sockets
+in a directory the user owns.
+
+Tools run with stdin attached to /dev/null and their output is delivered when
+they exit. Don't serve tools that prompt for input, need a tty or print
+progress, they behave differently than when they are run directly.
+
+Requires Python 3.5+ and a platform with unix sockets and os.fork.
+'''
+from __future__ import absolute_import
+import asyncio
+import io
+import os
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import time
+import traceback
+from collections import namedtuple
+from scrim.quoting import quote_bash
+__all__ = [
+    'Daemon', 'Request', 'FALLBACK_RESPONSE', 'socket_path',
+    'load_entry_point', 'parse_request', 'encode_request', 'render_response'
+]
+
+Request = namedtuple('Request', 'entry_point cwd args env')
+
+# Tells the scrim script to run the console script itself
+FALLBACK_RESPONSE = '_scrim_fallback=1\n'
+
+
+def socket_path():
+    '''Path to the daemon socket. Defaults to :envvar:`SCRIM_DAEMON_SOCKET`
+    falling back to $TMPDIR/scrim-$UID/daemon.sock'''
+
+    path = os.environ.get('SCRIM_DAEMON_SOCKET')
+    if path:
+        return path
+
+    tmpdir = os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(tmpdir, 'scrim-{}'.format(os.getuid()), 'daemon.sock')
+
+
+def load_entry_point(name):
+    '''Load a console_scripts entry point by name'''
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        for ep in pkg_resources.iter_entry_points('console_scripts', name):
+            return ep.load()
+    else:
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            matches = eps.select(group='console_scripts', name=name)
+        else:
+            matches = [
+                ep for ep in eps.get('console_scripts', [])
+                if ep.name == name
+            ]
+        for ep in matches:
+            return ep.load()
+
+    raise LookupError('console_script not found: {}'.format(name))
+
+
+def encode_request(entry_point, cwd, args, env):
+    '''Encode a request the same way the bash scrim script does'''
+
+    fields = [entry_point, cwd, str(len(args))] + list(args)
+    fields.extend(k + '=' + v for k, v in env.items())
+    return b''.join(os.fsencode(field) + b'\0' for field in fields)
+
+
+def parse_request(data):
+    '''Parse the bytes sent by a scrim script into a :class:`Request`'''
+
+    fields = [os.fsdecode(field) for field in data.split(b'\0')]
+    if fields and not fields[-1]:
+        fields.pop()
+    if len(fields) < 3:
+        raise ValueError('Malformed scrim daemon request')
+
+    entry_point, cwd, argc = fields[:3]
+    argc = int(argc)
+    args = fields[3:3 + argc]
+    env = dict(
+        field.split('=', 1) for field in fields[3 + argc:] if '=' in field
+    )
+    return Request(entry_point, cwd, args, env)
+
+
+def render_response(stdout, stderr, script, status=0):
+    '''Render the bash script sent back to the scrim script'''
+
+    lines = ['_scrim_status={:d}'.format(status)]
+    if stdout:
+        lines.append("printf '%s' " + quote_bash(stdout))
+    if stderr:
+        lines.append("printf '%s' " + quote_bash(stderr) + ' >&2')
+    if script:
+        lines.append(script)
+    return '\n'.join(lines) + '\n'
+
+
+def run_request(func, request):
+    '''Run a console script function as described by request. This replaces
+    the cwd, environment, argv and standard streams of the current process, it
+    is only meant to be called in a child forked by the :class:`Daemon`.
+
+    Returns:
+        tuple: (exit status, stdout, stderr, scrim script)
+    '''
+
+    from scrim.api import export_workers, get_scrim, temp_workers_path
+
+    started = time.time()
+    os.chdir(request.cwd)
+    os.environ.clear()
+    os.environ.update(request.env)
+    sys.argv = [request.entry_point] + list(request.args)
+
+    scrim = get_scrim()
+    scrim.commands = []
+    scrim.shell = request.env.get('SCRIM_SHELL', 'bash')
+    scrim.path = request.env.get('SCRIM_PATH')
+    scrim.script = request.env.get('SCRIM_SCRIPT')
+    scrim.auto_write = False
+    scrim.stream = False
+    scrim.memo = os.environ.pop('SCRIM_MEMO', None)
+    scrim.memo_key = os.environ.pop('SCRIM_MEMO_KEY', None)
+
+    # Child processes of the tool write their commands here
+    scrim.workers = export_workers(temp_workers_path())
+
+    stdout = tempfile.TemporaryFile()
+    stderr = tempfile.TemporaryFile()
+    with open(os.devnull, 'rb') as devnull:
+        os.dup2(devnull.fileno(), 0)
+    os.dup2(stdout.fileno(), 1)
+    os.dup2(stderr.fileno(), 2)
+    sys.stdin = io.open(0, 'r', closefd=False)
+    sys.stdout = io.open(1, 'w', buffering=1, closefd=False)
+    sys.stderr = io.open(2, 'w', buffering=1, closefd=False)
+
+    status = 0
+    try:
+        result = func()
+        if isinstance(result, int):
+            status = result
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            sys.stderr.write(str(e.code) + '\n')
+            status = 1
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    output = []
+    for stream in (stdout, stderr):
+        stream.seek(0)
+        output.append(stream.read().decode('utf-8', 'replace'))
+
+    exited = time.time()
+    scrim.collect_workers()
+    script = scrim.to_string()
+    if status == 0:
+        scrim.store_memo(script, started)
+    if request.env.get('SCRIM_TRACE'):
+        from scrim.trace import append_trace, python_record
+        append_trace(request.env['SCRIM_TRACE'], python_record(
+            request.env.get('SCRIM_TRACE_ID'),
+            started,
+            exited,
+            time.time(),
+            len(scrim.commands)
+        ))
+
+    return status, output[0], output[1], script
+
+
+class Daemon(object):
+    '''Serve scrim script requests over a unix socket.
+
+    Arguments:
+        path: Path to the unix socket. Defaults to :func:`socket_path`
+        entry_points: Mapping of console script names to functions. Console
+            scripts that are not found here are loaded on first use.
+
+    Usage:
+        >>> daemon = Daemon()
+        >>> daemon.preload('pymytool')
+        >>> daemon.serve_forever()
+    '''
+
+    def __init__(self, path=None, entry_points=None):
+        self.path = path or socket_path()
+        self.entry_points = dict(entry_points or {})
+        self.server = None
+
+    def preload(self, name):
+        '''Import a console script ahead of the first request'''
+
+        self.entry_points[name] = load_entry_point(name)
+
+    def get_entry_point(self, name):
+        if name not in self.entry_points:
+            self.preload(name)
+        return self.entry_points[name]
+
+    async def start(self):
+        '''Start listening on :attr:`path`'''
+
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, 0o700)
+            os.chmod(dirname, 0o700)
+
+        # Other users could read the requests or answer them
+        st = os.lstat(dirname)
+        if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+                stat.S_IMODE(st.st_mode) != 0o700):
+            raise RuntimeError(
+                'Refusing to start, {} must be a directory owned by this '
+                'user with mode 0700'.format(dirname)
+            )
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        loop = asyncio.get_event_loop()
+        loop.add_signal_handler(signal.SIGCHLD, self.reap)
+        self.server = await asyncio.start_unix_server(
+            self.handle,
+            path=self.path
+        )
+        os.chmod(self.path, 0o600)
+        return self.server
+
+    async def stop(self):
+        '''Stop listening and remove the socket'''
+
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        asyncio.get_event_loop().remove_signal_handler(signal.SIGCHLD)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def reap(self):
+        '''SIGCHLD handler, collect all exited children'''
+
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+    async def respond(self, writer, response):
+        '''Send response from the daemon itself and close the connection'''
+
+        writer.write(response.encode('utf-8'))
+        await writer.drain()
+        writer.close()
+
+    async def handle(self, reader, writer):
+        '''Handle a single request from a scrim script'''
+
+        try:
+            request = parse_request(await reader.read())
+            func = self.get_entry_point(request.entry_point)
+        except LookupError:
+            # Console scripts the daemon can't find are run directly
+            await self.respond(writer, FALLBACK_RESPONSE)
+            return
+        except Exception:
+            response = render_response('', traceback.format_exc(), '', 1)
+            await self.respond(writer, response)
+            return
+
+        fd = writer.get_extra_info('socket').fileno()
+        pid = os.fork()
+        if pid == 0:
+            self._run_child(func, request, fd)
+        writer.close()
+
+    def _run_child(self, func, request, fd):
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            conn = socket.socket(fileno=os.dup(fd))
+            conn.setblocking(True)
+            status, stdout, stderr, script = run_request(func, request)
+            response = render_response(stdout, stderr, script, status)
+            conn.sendall(response.encode('utf-8'))
+            conn.shutdown(socket.SHUT_RDWR)
+            conn.close()
+        finally:
+            os._exit(0)
+
+    def serve_forever(self):
+        '''Run the daemon until SIGINT or SIGTERM'''
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        stopped = loop.create_future()
+
+        def stop():
+            if not stopped.done():
+                stopped.set_result(None)
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop)
+        try:
+            loop.run_until_complete(self.start())
+            loop.run_until_complete(stopped)
+        finally:
+            loop.run_until_complete(self.stop())
+            loop.close()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+'''
+==============
+scrim.deferred
+==============
+Resolves deferred command arguments. Commands accept callables and awaitables
+as arguments, including the values of set_env_many, in place of values that
+are expensive to compute. They are resolved right before the commands are
+rendered or written by a worker, so they never run when the scrim isn't
+written.
+
+All deferred arguments of the commands being rendered are resolved together.
+Callables are called on a thread pool, awaitables and the awaitables returned
+by callables, like coroutines of async functions, are awaited concurrently in
+a new event loop. The first exception raised by a deferred argument is raised
+from the render.
+
+Rendering holds the scrims lock, deferred arguments must not render the scrim
+they belong to.
+'''
+from __future__ import absolute_import
+from scrim.commands import Command, OTHER
+__all__ = [
+    'is_deferred', 'resolve', 'resolve_command', 'resolve_commands'
+]
+
+# Types of arguments that are never deferred
+SIMPLE_TYPES = frozenset((str, bytes, int, float, bool, type(None)))
+
+
+def is_deferred(value):
+    '''Returns True if value is a callable or an awaitable'''
+
+    if value.__class__ in SIMPLE_TYPES:
+        return False
+    return callable(value) or hasattr(value, '__await__')
+
+
+def _run(coroutine_function):
+    import asyncio
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine_function())
+
+    # Rendering from a coroutine, the running loop can't be reentered
+    import threading
+    result = {}
+
+    def run():
+        try:
+            result['value'] = asyncio.run(coroutine_function())
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+def _resolve_async(values, max_workers):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    async def resolve_all():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers) as pool:
+
+            async def resolve_one(value):
+                if callable(value):
+                    value = await loop.run_in_executor(pool, value)
+                if hasattr(value, '__await__'):
+                    value = await value
+                return value
+
+            return await asyncio.gather(*map(resolve_one, values))
+
+    return list(_run(resolve_all))
+
+
+def resolve(values, max_workers=None):
+    '''Resolve a list of deferred values concurrently.
+
+    Arguments:
+        values (list): Callables, awaitables and other values to return as-is
+        max_workers (int): Size of the thread pool, defaults to the
+            concurrent.futures default
+
+    Returns:
+        list: resolved values
+    '''
+
+    results = list(values)
+    if any(hasattr(value, '__await__') for value in results):
+        # Await everything in one event loop, calling callables in its
+        # executor, so awaitables and callables run concurrently
+        return _resolve_async(results, max_workers)
+
+    calls = [i for i, value in enumerate(results) if callable(value)]
+    if len(calls) == 1:
+        results[calls[0]] = results[calls[0]]()
+    elif calls:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers) as pool:
+            futures = [pool.submit(results[i]) for i in calls]
+        for i, future in zip(calls, futures):
+            results[i] = future.result()
+
+    # Async functions return coroutines
+    awaits = [
+        i for i, value in enumerate(results) if hasattr(value, '__await__')
+    ]
+    if awaits:
+        awaited = _resolve_async([results[i] for i in awaits], max_workers)
+        for i, value in zip(awaits, awaited):
+            results[i] = value
+    return results
+
+
+def _find(args, start, end, found):
+    # Collects (index, item, value) of the deferred arguments in
+    # args[start:end] and the items of tuple arguments like set_env_many's
+    for i in range(start, end):
+        arg = args[i]
+        if arg.__class__ in SIMPLE_TYPES:
+            continue
+        if arg.__class__ is not tuple:
+            if is_deferred(arg):
+                found.append((i, None, arg))
+            continue
+        for j, item in enumerate(arg):
+            if item.__class__ is tuple:
+                for k, value in enumerate(item):
+                    if is_deferred(value):
+                        found.append((i, (j, k), value))
+            elif is_deferred(item):
+                found.append((i, (j,), item))
+
+
+def _replace(args, found, results):
+    for (i, item, _), value in zip(found, results):
+        if item is None:
+            args[i] = value
+        elif len(item) == 1:
+            arg = list(args[i])
+            arg[item[0]] = value
+            args[i] = tuple(arg)
+        else:
+            j, k = item
+            pair = list(args[i][j])
+            pair[k] = value
+            args[i] = args[i][:j] + (tuple(pair),) + args[i][j + 1:]
+
+
+def resolve_commands(commands, start=0, max_workers=None):
+    '''Resolve the deferred arguments of commands[start:] in place.
+
+    Arguments:
+        commands (CommandStore): Commands to resolve
+        start (int): Index of the first command to resolve
+        max_workers (int): Size of the thread pool
+
+    Returns:
+        int: number of deferred arguments resolved
+    '''
+
+    ops = commands._ops
+    offsets = commands._offsets
+    args = commands._args
+    if start >= len(ops):
+        return 0
+
+    # Most arguments are strings, check their types in a single pass
+    first = offsets[start]
+    if SIMPLE_TYPES.issuperset(map(type, args[first:])):
+        return 0
+
+    found = []
+    for i in range(start, len(ops)):
+        # RawCommands and other objects don't take arguments
+        if ops[i] > OTHER:
+            _find(args, offsets[i], offsets[i + 1], found)
+    if not found:
+        return 0
+
+    _replace(args, found, resolve([v for _, _, v in found], max_workers))
+    return len(found)
+
+
+def resolve_command(command, max_workers=None):
+    '''Resolve the deferred arguments of a single command.
+
+    Returns:
+        Command: command with resolved arguments, or command itself
+    '''
+
+    if command.__class__ is not Command:
+        return command
+
+    name, args, kwargs = command
+    if SIMPLE_TYPES.issuperset(map(type, args)):
+        return command
+
+    args = list(args)
+    found = []
+    _find(args, 0, len(args), found)
+    if not found:
+        return command
+
+    _replace(args, found, resolve([v for _, _, v in found], max_workers))
+    return Command(name, tuple(args), kwargs)
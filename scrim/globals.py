@@ -13,21 +13,75 @@ by a scrim script.
     SCRIM_AUTO_WRITE (bool): Write to SCRIM_PATH when python exits?
     SCRIM_SCRIPT (str): Path to the scrim script that invoked python
     SCRIM_DEBUG (bool): Is scrim script running in debug mode?
+    SCRIM_STREAM (bool): Stream commands to SCRIM_PATH as they are added?
+    SCRIM_FD (int): File descriptor to write the output shell script to
+    SCRIM_TRACE (str): Path to append per-phase timing records to
+    SCRIM_TRACE_ID (str): Id joining the trace records of a single call
+    SCRIM_WORKERS (str): Directory worker processes write their commands to
+    SCRIM_WORKER (bool): Is this a worker process of a scrim wrapped tool?
+    SCRIM_MEMO (str): Path of the memo entry for this call, see scrim.memo
+    SCRIM_MEMO_KEY (str): Key of this call computed by the scrim script
+
+Child processes of a scrim wrapped tool inherit SCRIM_PATH, or lose SCRIM_FD,
+and would clobber or drop its output. Instead they become workers that write
+their commands to SCRIM_WORKERS, where the tool collects them before writing.
+The tool sets SCRIM_WORKERS when its scrim gets its first command or when it
+forks, see scrim.api.export_workers. Importing scrim doesn't modify
+os.environ.
+
+The scrim script reads SCRIM_FD until every process holding the descriptor
+has exited. It is made non-inheritable when scrim is imported, but children
+forked or started before that keep the shell waiting until they exit. Import
+scrim before starting background processes.
 '''
 from __future__ import absolute_import
 import os
 __all__ = [
     'SHELLS', 'SCRIM_SHELL', 'SCRIM_PATH', 'SCRIM_AUTO_WRITE',
-    'SCRIM_SCRIPT', 'SCRIM_DEBUG'
+    'SCRIM_SCRIPT', 'SCRIM_DEBUG', 'SCRIM_STREAM', 'SCRIM_FD', 'SCRIM_TRACE',
+    'SCRIM_TRACE_ID', 'SCRIM_WORKERS', 'SCRIM_WORKER', 'SCRIM_MEMO',
+    'SCRIM_MEMO_KEY'
 ]
 
 SHELLS = [
     'powershell.exe',
     'cmd.exe',
-    'bash'
+    'bash',
+    'zsh',
+    'fish',
+    'csh'
 ]
 SCRIM_SHELL = os.environ.get('SCRIM_SHELL', None)
 SCRIM_PATH = os.environ.get('SCRIM_PATH', None)
 SCRIM_AUTO_WRITE = bool(os.environ.get('SCRIM_AUTO_WRITE', False))
 SCRIM_SCRIPT = os.environ.get('SCRIM_SCRIPT', None)
 SCRIM_DEBUG = bool(os.environ.get('SCRIM_DEBUG', False))
+SCRIM_STREAM = bool(os.environ.get('SCRIM_STREAM', False))
+SCRIM_TRACE = os.environ.get('SCRIM_TRACE', None)
+SCRIM_TRACE_ID = os.environ.get('SCRIM_TRACE_ID', None)
+# The memo entry describes this call only, hide it from children
+SCRIM_MEMO = os.environ.pop('SCRIM_MEMO', None)
+SCRIM_MEMO_KEY = os.environ.pop('SCRIM_MEMO_KEY', None)
+SCRIM_FD = os.environ.get('SCRIM_FD', None)
+if SCRIM_FD:
+    # The descriptor is only inherited by this process, hide it from children.
+    # The scrim script reads it until every process holding it exits, so
+    # children started by exec must not inherit it either.
+    SCRIM_FD = int(os.environ.pop('SCRIM_FD'))
+    if hasattr(os, 'set_inheritable'):
+        try:
+            os.set_inheritable(SCRIM_FD, False)
+        except OSError:
+            pass
+else:
+    SCRIM_FD = None
+SCRIM_WORKERS = os.environ.get('SCRIM_WORKERS', None)
+SCRIM_WORKER = bool(
+    SCRIM_WORKERS and SCRIM_FD is None and
+    (SCRIM_PATH is None or SCRIM_WORKERS == SCRIM_PATH + '.workers')
+)
+if not SCRIM_WORKER:
+    # Processes started by a scrim script own its output, scrim.api exports
+    # their workers directory to their children. Without a path it is a new
+    # path in the temporary directory, created when a worker writes.
+    SCRIM_WORKERS = SCRIM_PATH + '.workers' if SCRIM_PATH else None
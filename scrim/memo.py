@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+'''
+==========
+scrim.memo
+==========
+Memoized activation. Tools whose scrim only depends on their arguments, the
+working directory and a few files and environment variables call
+:meth:`scrim.api.Scrim.memoize`. The bash and zsh scrim scripts then look up
+the scrim of a call in a cache before starting python, on a hit the cached
+scrim is sourced and python doesn't run at all.
+
+The cache lives in :func:`scrim.utils.cache_path` ("memo"):
+
+    <entry_point>/: Exists once the entry point called memoize
+    <entry_point>/<key hash>.sh: Entries, a guard sourcing a blob
+    blobs/<sha1>.sh: Rendered scrims, stored by content
+    access.log: Entries sourced since the last eviction
+
+The scrim script only computes the key of entry points with a directory. The
+key is the shell, entry point, working directory and arguments quoted with
+printf %q, entries are named by the cksum of the key. Both are passed to
+python as :envvar:`SCRIM_MEMO` and :envvar:`SCRIM_MEMO_KEY`, python never
+computes them itself.
+
+An entry is a guard that only sources its blob when:
+
+    - the key matches, so cksum collisions miss
+    - each declared file is as it was, existing files are not newer than the
+      entry. The entry's mtime is set to the time scrim was imported.
+    - each declared environment variable has the same value
+
+Calls that exit with a non-zero status are never cached, python skips the
+store on uncaught exceptions and the scrim script removes the entry of any
+other failed call.
+
+These are shell builtins, a lookup costs a fork for cksum. Sourced entries
+are appended to access.log. When the cache grows larger than
+:envvar:`SCRIM_MEMO_SIZE` bytes, the least recently used entries are removed
+along with the blobs no other entry uses. Use `scrim memo clear` to clear the
+cache.
+'''
+from __future__ import absolute_import
+import hashlib
+import io
+import os
+import re
+import time
+from scrim.quoting import quote_bash
+from scrim.utils import cache_path
+__all__ = [
+    'MEMO_SHELLS', 'DEFAULT_MAX_SIZE', 'memo_root', 'enable', 'store',
+    'render_entry', 'evict', 'clear'
+]
+
+MEMO_SHELLS = ('bash', 'zsh')
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+ENV_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+BLOB_PATTERN = re.compile(r'^# blob (\w+\.sh)$')
+
+
+def memo_root(*args):
+    '''os.path.join relative to the memo cache'''
+
+    return cache_path('memo', *args)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path, 0o700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def enable(entry_point):
+    '''Create the directory that makes scrim scripts look up the memos of
+    entry_point'''
+
+    _makedirs(memo_root(entry_point))
+
+
+def _write(path, data, mtime=None):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with io.open(tmp, 'wb') as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(tmp, (mtime, mtime))
+    os.replace(tmp, path)
+
+
+def render_entry(key, blob, files=(), env=(), log=None):
+    '''Render the guard of a memo entry.
+
+    Arguments:
+        key (str): Key computed by the scrim script
+        blob (str): Path to the cached scrim
+        files (list): (path, existed) pairs
+        env (list): (name, value) pairs, value is None for unset variables
+        log (str): Path to append the entry to when it's sourced
+
+    Returns:
+        str: bash and zsh script
+    '''
+
+    tests = [
+        '[ "$_scrim_memo_key" = {} ]'.format(quote_bash(key)),
+        '[ -f {} ]'.format(quote_bash(blob)),
+    ]
+    for path, existed in files:
+        if existed:
+            tests.append('[ -e {0} ] && [ ! {0} -nt "$_scrim_memo" ]'.format(
+                quote_bash(path)
+            ))
+        else:
+            tests.append('[ ! -e {} ]'.format(quote_bash(path)))
+    for name, value in env:
+        if value is None:
+            tests.append('[ -z "${{{}+x}}" ]'.format(name))
+        else:
+            tests.append('[ "${{{}-}}" = {} ]'.format(name, quote_bash(value)))
+
+    lines = ['# blob ' + os.path.basename(blob)]
+    lines.append('if ' + ' &&\n    '.join(tests) + '; then')
+    lines.append('    _scrim_memo_hit=1')
+    if log:
+        lines.append(
+            '    printf \'%s\\n\' "$_scrim_memo" >> {}'.format(quote_bash(log))
+        )
+    lines.append('    . ' + quote_bash(blob))
+    lines.append('fi')
+    return '\n'.join(lines) + '\n'
+
+
+def store(path, key, script, files=(), env=(), mtime=None, max_size=None):
+    '''Store script as the memo entry at path. Evicts entries when the cache
+    grows larger than max_size.
+
+    Arguments:
+        path (str): Entry path, :envvar:`SCRIM_MEMO`
+        key (str): Key of the entry, :envvar:`SCRIM_MEMO_KEY`
+        script (str): Rendered scrim
+        files (list): Paths of the files the scrim depends on
+        env (list): Names of the environment variables the scrim depends on
+        mtime (float): Time before the files were read
+        max_size (int): Defaults to :envvar:`SCRIM_MEMO_SIZE`
+
+    Returns:
+        int: number of bytes written
+    '''
+
+    for name in env:
+        if not ENV_NAME.match(name):
+            raise ValueError('Invalid environment variable: ' + name)
+
+    root = os.path.dirname(os.path.dirname(path))
+    data = script.encode('utf-8')
+    blob = os.path.join(root, 'blobs', hashlib.sha1(data).hexdigest() + '.sh')
+    written = 0
+    if not os.path.exists(blob):
+        _makedirs(os.path.dirname(blob))
+        _write(blob, data)
+        written += len(data)
+
+    entry = render_entry(
+        key,
+        blob,
+        [(p, os.path.exists(p)) for p in files],
+        [(name, os.environ.get(name)) for name in env],
+        os.path.join(root, 'access.log'),
+    ).encode('utf-8')
+    _makedirs(os.path.dirname(path))
+    _write(path, entry, time.time() if mtime is None else mtime)
+    written += len(entry)
+
+    evict(root, max_size)
+    return written
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _entries(root):
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        if name == 'blobs' or not os.path.isdir(directory):
+            continue
+        for entry in os.listdir(directory):
+            if entry.endswith('.sh'):
+                yield os.path.join(directory, entry)
+
+
+def _blob_names(entries):
+    '''Map entries to the name of the blob they source'''
+
+    names = {}
+    for entry in entries:
+        try:
+            with io.open(entry, 'r', encoding='utf-8') as f:
+                match = BLOB_PATTERN.match(f.readline())
+        except (IOError, OSError):
+            continue
+        names[entry] = match.group(1) if match else None
+    return names
+
+
+def _remove_unused_blobs(root, used):
+    blobs = os.path.join(root, 'blobs')
+    if not os.path.isdir(blobs):
+        return
+
+    for name in os.listdir(blobs):
+        # Blobs being written end with .tmp
+        if name.endswith('.sh') and name not in used:
+            try:
+                os.remove(os.path.join(blobs, name))
+            except OSError:
+                pass
+
+
+def evict(root=None, max_size=None):
+    '''Remove the least recently used entries until the cache is no larger
+    than max_size, and the blobs no entry uses.
+
+    Entries are used when they are written and when they are sourced.
+    Sourced entries are the most recently used in the order of access.log,
+    followed by the entries written since the last eviction and the older
+    entries by their mtime.
+
+    Arguments:
+        root (str): Defaults to :func:`memo_root`
+        max_size (int): Defaults to :envvar:`SCRIM_MEMO_SIZE`
+
+    Returns:
+        int: number of entries removed
+    '''
+
+    root = root or memo_root()
+    if max_size is None:
+        max_size = int(os.environ.get('SCRIM_MEMO_SIZE', DEFAULT_MAX_SIZE))
+    if not os.path.isdir(root):
+        return 0
+
+    log = os.path.join(root, 'access.log')
+    blobs = _blob_names(_entries(root))
+    refs = {}
+    for name in blobs.values():
+        refs[name] = refs.get(name, 0) + 1
+    _remove_unused_blobs(root, refs)
+
+    def blob_size(name):
+        return _size(os.path.join(root, 'blobs', name)) if name else 0
+
+    total = _size(log)
+    total += sum(_size(entry) for entry in blobs)
+    total += sum(blob_size(name) for name in refs)
+    if total <= max_size:
+        return 0
+
+    evicted = 0.0
+    sourced = {}
+    if os.path.exists(log):
+        with io.open(log, 'r', encoding='utf-8', errors='replace') as f:
+            for i, line in enumerate(f):
+                if line.startswith('# evicted '):
+                    evicted = float(line.split()[-1])
+                else:
+                    sourced[line.rstrip('\n')] = i
+
+    used = {}
+    for entry in blobs:
+        try:
+            mtime = os.path.getmtime(entry)
+        except OSError:
+            continue
+        if entry in sourced:
+            used[entry] = (2, sourced[entry])
+        elif mtime >= evicted:
+            used[entry] = (1, mtime)
+        else:
+            used[entry] = (0, mtime)
+
+    # Remove entries until a quarter of the cache is free, so the next
+    # write doesn't evict again
+    order = sorted(used, key=used.__getitem__)
+    removed = 0
+    for entry in order:
+        if total <= max_size * 3 // 4:
+            break
+        total -= _size(entry)
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+        removed += 1
+
+        name = blobs[entry]
+        refs[name] -= 1
+        if name and not refs[name]:
+            total -= blob_size(name)
+            del refs[name]
+    _remove_unused_blobs(root, refs)
+
+    lines = ['# evicted {:.6f}\n'.format(time.time())]
+    lines.extend(
+        entry + '\n' for entry in order[removed:] if used[entry][0] == 2
+    )
+    _write(log, ''.join(lines).encode('utf-8'))
+    return removed
+
+
+def clear(entry_point=None):
+    '''Remove the memo entries of entry_point or the whole cache. The
+    directories of entry points are kept, so they are still memoized.
+
+    Returns:
+        int: number of entries removed
+    '''
+
+    root = memo_root()
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    kept = []
+    for entry in list(_entries(root)):
+        directory = os.path.basename(os.path.dirname(entry))
+        if entry_point is None or directory == entry_point:
+            os.remove(entry)
+            removed += 1
+        else:
+            kept.append(entry)
+    _remove_unused_blobs(root, set(_blob_names(kept).values()))
+    return removed
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+'''
+==============
+scrim.optimize
+==============
+Rewrites a list of commands into a smaller list with the same effect on the
+shell's state. The list is split into segments at commands that may observe
+state, within each segment:
+
+    - A variable write followed by another write to the same variable is
+      removed. set and unset write shell variables, set_env and unset_env
+      write environment variables. set_env_many and unset_env_many are
+      removed when all of their variables are written again.
+    - A pushd immediately followed by a popd, ignoring commands that don't
+      change directory, cancel out.
+    - A cd immediately followed by a cd to an absolute posix path is removed.
+
+Commands that observe state and therefore end a segment are RawCommands,
+execute, echo, commands not listed above, commands with kwargs and commands
+with arguments that may reference variables.
+'''
+from __future__ import absolute_import
+import ntpath
+from scrim.commands import Command
+__all__ = ['optimize_commands']
+
+WRITE_NAMESPACES = {
+    'set': 'var',
+    'unset': 'var',
+    'set_env': 'env',
+    'unset_env': 'env',
+}
+BATCH_WRITES = ('set_env_many', 'unset_env_many')
+DIRECTORY_COMMANDS = ('cd', 'pushd', 'popd')
+LITERAL_TYPES = (str, int, float, bool)
+EXPANSION_CHARS = ('$', '%', '!', '`')
+
+
+def is_barrier(command):
+    '''Returns True if the command may observe the shell's state'''
+
+    if command.__class__ is not Command or command.kwargs:
+        return True
+
+    name, args, _ = command
+    if name in BATCH_WRITES:
+        args = [
+            value for item in args[0]
+            for value in (item if isinstance(item, tuple) else (item,))
+        ]
+    elif name not in WRITE_NAMESPACES and name not in DIRECTORY_COMMANDS:
+        return True
+
+    for arg in args:
+        if not isinstance(arg, LITERAL_TYPES):
+            return True
+        if isinstance(arg, str):
+            for char in EXPANSION_CHARS:
+                if char in arg:
+                    return True
+    return False
+
+
+def replaces_directory(path, previous_path):
+    '''Returns True if cd path has the same result in every shell no matter
+    whether cd previous_path ran before it.'''
+
+    return (
+        str(path).startswith('/') and
+        not ntpath.splitdrive(str(previous_path))[0]
+    )
+
+
+def optimize_segment(commands, start, end, keep):
+    '''Mark the redundant commands in commands[start:end] in keep'''
+
+    # Writes followed by another write to the same variable
+    written = set()
+    for i in range(end - 1, start - 1, -1):
+        name, args, _ = commands[i]
+        if name in WRITE_NAMESPACES:
+            key = (WRITE_NAMESPACES[name], args[0])
+            if key in written:
+                keep[i] = False
+            written.add(key)
+        elif name == 'set_env_many':
+            keys = set(('env', var) for var, _ in args[0])
+            if keys <= written:
+                keep[i] = False
+            written |= keys
+        elif name == 'unset_env_many':
+            keys = set(('env', var) for var in args[0])
+            if keys <= written:
+                keep[i] = False
+            written |= keys
+
+    # pushd/popd pairs, leaves the remaining directory commands in stack
+    stack = []
+    for i in range(start, end):
+        name = commands[i].name
+        if name == 'popd' and stack and commands[stack[-1]].name == 'pushd':
+            keep[stack.pop()] = False
+            keep[i] = False
+        elif name in DIRECTORY_COMMANDS:
+            stack.append(i)
+
+    # cd followed by cd to an absolute path
+    for a, b in zip(stack, stack[1:]):
+        if commands[a].name == 'cd' and commands[b].name == 'cd':
+            if replaces_directory(commands[b].args[0], commands[a].args[0]):
+                keep[a] = False
+
+
+def optimize_commands(commands):
+    '''Remove redundant commands.
+
+    Arguments:
+        commands (list): Commands and RawCommands
+
+    Returns:
+        tuple: (optimized list of commands, number of commands removed)
+    '''
+
+    commands = list(commands)
+    keep = [True] * len(commands)
+    start = 0
+    for i, command in enumerate(commands):
+        if is_barrier(command):
+            optimize_segment(commands, start, i, keep)
+            start = i + 1
+    optimize_segment(commands, start, len(commands), keep)
+
+    optimized = [c for c, k in zip(commands, keep) if k]
+    return optimized, len(commands) - len(optimized)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+'''
+===========
+scrim.paths
+===========
+Models environment variables holding lists of paths, like PATH, PYTHONPATH
+and LD_LIBRARY_PATH, for :meth:`scrim.api.Scrim.prepend_path`,
+:meth:`scrim.api.Scrim.append_path` and :meth:`scrim.api.Scrim.remove_path`.
+
+A :class:`PathList` maps each path to its position in a dict. Prepending
+takes a position before the first path and appending one after the last, so
+adding, moving and removing a path are O(1) and paths are never duplicated.
+The paths are only sorted by position when the list is rendered.
+
+Edits with deferred paths, or of a variable set to a deferred value, can't
+be applied until the scrim is rendered. They are held by a
+:class:`DeferredPaths`, which is resolved like any other deferred argument.
+Values that reference variables, like $PATH, can't be split into paths in
+python, editing them raises a ValueError.
+'''
+from __future__ import absolute_import
+import os
+from threading import Lock
+from scrim.commands import Command
+from scrim.deferred import is_deferred, resolve
+from scrim.optimize import EXPANSION_CHARS
+__all__ = ['PathList', 'DeferredPaths', 'split_paths', 'written_paths']
+
+ENV_WRITES = ('set_env', 'unset_env', 'set_env_many', 'unset_env_many')
+
+
+def split_paths(value, separator=os.pathsep):
+    '''Split value at separator dropping empty paths'''
+
+    if not value:
+        return []
+    return [path for path in str(value).split(separator) if path]
+
+
+def value_paths(value):
+    '''Split the value of an environment variable into paths.
+
+    Returns:
+        list: paths, or a :class:`DeferredPaths` when value is deferred
+
+    Raises:
+        ValueError: when value may reference variables
+    '''
+
+    if is_deferred(value):
+        return DeferredPaths(value)
+    if isinstance(value, str):
+        for char in EXPANSION_CHARS:
+            if char in value:
+                raise ValueError(
+                    'Can not edit paths of a value referencing variables: '
+                    '{!r}'.format(value)
+                )
+    return split_paths(value)
+
+
+class PathList(object):
+    '''An ordered list of unique paths.
+
+    Arguments:
+        paths (iterable): Initial paths, later duplicates are dropped
+
+    Examples:
+        >>> paths = PathList(['/usr/bin', '/bin'])
+        >>> paths.prepend('/opt/bin', '/bin')
+        >>> paths.remove('/usr/bin')
+        >>> list(paths)
+        ['/opt/bin', '/bin']
+    '''
+
+    __slots__ = ('_positions', '_first', '_last')
+
+    def __init__(self, paths=()):
+        self._positions = {}
+        self._first = 0
+        self._last = -1
+        for path in paths:
+            if path not in self._positions:
+                self._last += 1
+                self._positions[path] = self._last
+
+    @classmethod
+    def from_environ(cls, var, environ=None):
+        '''Create a PathList from the value of var in environ. Defaults to
+        os.environ.'''
+
+        if environ is None:
+            environ = os.environ
+        return cls(split_paths(environ.get(var)))
+
+    def prepend(self, *paths):
+        '''Move or add paths to the front of the list, in the given order'''
+
+        positions = self._positions
+        for path in reversed(paths):
+            self._first -= 1
+            positions[path] = self._first
+
+    def append(self, *paths):
+        '''Move or add paths to the end of the list, in the given order'''
+
+        positions = self._positions
+        for path in paths:
+            self._last += 1
+            positions[path] = self._last
+
+    def remove(self, *paths):
+        '''Remove paths from the list, ignoring paths that aren't in it.
+
+        Returns:
+            int: number of paths removed
+        '''
+
+        pop = self._positions.pop
+        return sum(1 for path in paths if pop(path, None) is not None)
+
+    def join(self, separator=os.pathsep):
+        return separator.join(self)
+
+    def __iter__(self):
+        return iter(sorted(self._positions, key=self._positions.__getitem__))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, path):
+        return path in self._positions
+
+    def __eq__(self, other):
+        if isinstance(other, (PathList, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        # Wrapped so the state of an empty list isn't falsy
+        return (list(self),)
+
+    def __setstate__(self, state):
+        self.__init__(state[0])
+
+    def __repr__(self):
+        return 'PathList({!r})'.format(list(self))
+
+
+class DeferredPaths(object):
+    '''Paths of a variable after an edit with deferred arguments. Called
+    when the scrim is rendered, it resolves seed and paths and returns the
+    edited paths. The result is cached, so later edits can use it as their
+    seed.
+
+    Arguments:
+        seed: Paths before the edit, a list, a :class:`DeferredPaths` or a
+            deferred value of the variable
+        method (str): PathList method applying the edit, None for no edit
+        paths: Paths passed to the edit, may be deferred or contain deferred
+            paths
+    '''
+
+    def __init__(self, seed, method=None, paths=()):
+        if not is_deferred(seed):
+            seed = list(seed)
+        self.seed = seed
+        self.method = method
+        self.paths = paths
+        self._lock = Lock()
+        self._result = None
+
+    def __call__(self):
+        with self._lock:
+            if self._result is None:
+                self._result = self._resolve()
+            return self._result
+
+    def _resolve(self):
+        seed = self.seed
+        if isinstance(seed, DeferredPaths):
+            seed = seed()
+        elif is_deferred(seed):
+            seed = value_paths(resolve([seed])[0])
+
+        path_list = PathList(seed)
+        if self.method is not None:
+            paths = self.paths
+            if is_deferred(paths):
+                paths = resolve([paths])[0]
+            if isinstance(paths, str):
+                paths = (paths,)
+            getattr(path_list, self.method)(*resolve(paths))
+        return tuple(path_list)
+
+    def __repr__(self):
+        return 'DeferredPaths({!r}, {!r}, {!r})'.format(
+            self.seed, self.method, self.paths
+        )
+
+
+def written_paths(command, var):
+    '''Get the paths a command sets var to.
+
+    Returns:
+        list: paths, an empty list when var is unset or None when command
+        doesn't write var. A :class:`DeferredPaths` when the paths are
+        deferred.
+
+    Raises:
+        ValueError: when var is set to a value that may reference variables
+    '''
+
+    if command.__class__ is not Command:
+        return None
+
+    name, args, _ = command
+    if name == 'set_path':
+        if args[0] == var:
+            if isinstance(args[1], DeferredPaths):
+                return args[1]
+            return list(args[1])
+    elif name not in ENV_WRITES:
+        return None
+    elif name == 'set_env':
+        if args[0] == var:
+            return value_paths(args[1])
+    elif name == 'unset_env':
+        if args[0] == var:
+            return []
+    elif name == 'set_env_many':
+        for item, value in reversed(args[0]):
+            if item == var:
+                return value_paths(value)
+    elif var in args[0]:
+        return []
+    return None
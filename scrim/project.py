@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+'''
+=============
+scrim.project
+=============
+Find the console_scripts of a python project without running setup.py.
+
+Entry points are read statically from setup.py, setup.cfg and
+pyproject.toml. setup.py is only executed when its entry_points can't be
+determined from its source. Static results are cached per file in
+:func:`scrim.utils.cache_path`, executing setup.py may read any other file so
+its results are never cached.
+
+:func:`add_projects` writes scrim scripts for every project in a directory
+tree using a pool of processes.
+'''
+from __future__ import absolute_import
+import io
+import os
+from scrim.utils import (
+    cache_path, get_console_scripts, parse_setup, write_json
+)
+__all__ = [
+    'parse_setup_static', 'parse_setup_cfg', 'parse_pyproject',
+    'parse_console_scripts', 'cached_console_scripts', 'find_console_scripts',
+    'find_projects', 'add_project', 'add_projects'
+]
+
+PROJECT_FILES = ('setup.py', 'setup.cfg', 'pyproject.toml')
+SKIP_DIRS = ('node_modules', 'site-packages', 'build', 'dist', '__pycache__')
+
+
+def parse_setup_static(filepath):
+    '''Statically extract the entry_points passed to setup in setup.py
+    without executing it. Simple module level assignments are resolved.
+
+    Returns:
+        The entry_points literal or None if setup has no entry_points
+
+    Raises:
+        ValueError: when entry_points can't be determined statically
+    '''
+
+    import ast
+
+    with open(filepath, 'r') as f:
+        tree = ast.parse(f.read(), filepath)
+
+    assignments = {}
+    setup_calls = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+            if isinstance(target, ast.Name):
+                assignments[target.id] = node.value
+        elif isinstance(node, ast.Call):
+            func = node.func
+            name = getattr(func, 'id', getattr(func, 'attr', None))
+            if name == 'setup':
+                setup_calls.append(node)
+
+    if len(setup_calls) != 1:
+        raise ValueError('Could not find a single setup call')
+
+    call = setup_calls[0]
+    for keyword in call.keywords:
+        if keyword.arg == 'entry_points':
+            value = keyword.value
+            if isinstance(value, ast.Name) and value.id in assignments:
+                value = assignments[value.id]
+            return ast.literal_eval(value)
+        if keyword.arg is None:
+            raise ValueError('setup is called with **kwargs')
+
+    return None
+
+
+def parse_setup_cfg(filepath):
+    '''Get the console_scripts from [options.entry_points] in setup.cfg'''
+
+    from configparser import ConfigParser
+
+    config = ConfigParser()
+    config.read(filepath)
+    if not config.has_option('options.entry_points', 'console_scripts'):
+        return []
+
+    return get_console_scripts({
+        'entry_points': {
+            'console_scripts': config.get(
+                'options.entry_points',
+                'console_scripts'
+            )
+        }
+    })
+
+
+def parse_pyproject(filepath):
+    '''Get the console_scripts from [project.scripts] in pyproject.toml.
+    Requires Python 3.11+ or tomli.'''
+
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ImportError('Parsing pyproject.toml requires tomli.')
+
+    with open(filepath, 'rb') as f:
+        data = tomllib.load(f)
+    return list(data.get('project', {}).get('scripts', {}))
+
+
+def parse_console_scripts(filepath):
+    '''Get the console_scripts from a setup.py, setup.cfg or pyproject.toml.
+    setup.py is only executed when its entry_points are dynamic.'''
+
+    return _parse_console_scripts(filepath)[0]
+
+
+def _parse_console_scripts(filepath):
+    # Returns (scripts, static), static is False when setup.py was executed
+    name = os.path.basename(filepath)
+    if name == 'setup.cfg':
+        return parse_setup_cfg(filepath), True
+    if name == 'pyproject.toml':
+        return parse_pyproject(filepath), True
+
+    static = True
+    try:
+        entry_points = parse_setup_static(filepath)
+    except (ValueError, SyntaxError):
+        static = False
+        # setup.py may read files relative to itself
+        filepath = os.path.abspath(filepath)
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(filepath))
+        try:
+            entry_points = parse_setup(filepath).get('entry_points')
+        finally:
+            os.chdir(cwd)
+    return get_console_scripts({'entry_points': entry_points}), static
+
+
+def cached_console_scripts(filepath):
+    '''Cached :func:`parse_console_scripts`. Cache entries are stored in
+    :func:`cache_path` and are keyed by the files path. An entry is used when
+    the files mtime and size match, or when its sha1 matches. Results of
+    executing setup.py are not cached, they may depend on other files.'''
+
+    import hashlib
+    import json
+
+    filepath = os.path.abspath(filepath)
+    key = hashlib.sha1(filepath.encode('utf-8')).hexdigest()
+    entry_path = cache_path('setup', key + '.json')
+
+    stat = os.stat(filepath)
+    entry = {}
+    if os.path.exists(entry_path):
+        try:
+            with io.open(entry_path, 'r') as f:
+                entry = json.load(f)
+        except ValueError:
+            entry = {}
+
+    unchanged = (
+        entry.get('mtime') == stat.st_mtime and
+        entry.get('size') == stat.st_size
+    )
+    if unchanged:
+        return entry['scripts']
+
+    with io.open(filepath, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+
+    if entry.get('sha1') != digest:
+        scripts, static = _parse_console_scripts(filepath)
+        if not static:
+            if os.path.exists(entry_path):
+                os.remove(entry_path)
+            return scripts
+        entry['scripts'] = scripts
+
+    entry.update(
+        path=filepath,
+        mtime=stat.st_mtime,
+        size=stat.st_size,
+        sha1=digest
+    )
+    write_json(entry_path, entry)
+    return entry['scripts']
+
+
+def find_console_scripts(root='.'):
+    '''Get the console_scripts of the python project in root from its
+    setup.py, setup.cfg and pyproject.toml. Results are cached per file, see
+    :func:`cached_console_scripts`.'''
+
+    scripts = []
+    for name in PROJECT_FILES:
+        filepath = os.path.join(root, name)
+        if not os.path.exists(filepath):
+            continue
+        try:
+            found = cached_console_scripts(filepath)
+        except ImportError as e:
+            import warnings
+            warnings.warn('Skipping {}: {}'.format(filepath, e))
+            continue
+        for script in found:
+            if script not in scripts:
+                scripts.append(script)
+    return scripts
+
+
+def find_projects(root='.'):
+    '''Walk root for directories containing a setup.py or pyproject.toml.
+    Hidden directories, virtualenvs and build directories are skipped.
+
+    Returns:
+        list: sorted project directories
+    '''
+
+    projects = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            d for d in dirnames
+            if not d.startswith('.') and d not in SKIP_DIRS and
+            not os.path.exists(os.path.join(dirpath, d, 'pyvenv.cfg'))
+        ]
+        if 'setup.py' in filenames or 'pyproject.toml' in filenames:
+            projects.append(dirpath)
+    return sorted(projects)
+
+
+def add_project(project, auto_write=True, scripts_path='bin'):
+    '''Write scrim scripts for every console script in project. Console
+    scripts that don't start with py are skipped.
+
+    Arguments:
+        project: Directory containing a setup.py, setup.cfg or pyproject.toml
+        auto_write: Sets SCRIM_AUTO_WRITE to True
+        scripts_path: Directory relative to project to write scripts to
+
+    Returns:
+        dict: project, scripts as (script, status) tuples relative to project,
+        skipped console scripts and error
+    '''
+
+    from scrim.utils import write_templates
+
+    result = dict(project=project, scripts=[], skipped=[], error=None)
+    try:
+        for entry in find_console_scripts(project):
+            if not entry.startswith('py'):
+                result['skipped'].append(entry)
+                continue
+            results = write_templates(
+                entry[2:],
+                entry,
+                auto_write,
+                os.path.join(project, scripts_path)
+            )
+            result['scripts'].extend(
+                (scripts_path + '/' + os.path.basename(script), status)
+                for script, status in results
+            )
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+
+def _add_project(args):
+    return add_project(*args)
+
+
+def add_projects(root='.', auto_write=True, scripts_path='bin', jobs=None):
+    '''Run :func:`add_project` for every project found under root in a pool
+    of processes.
+
+    Arguments:
+        root: Directory to search for projects
+        auto_write: Sets SCRIM_AUTO_WRITE to True
+        scripts_path: Directory relative to each project to write scripts to
+        jobs: Number of processes, defaults to the number of cpus
+
+    Returns:
+        list: :func:`add_project` results in project order
+    '''
+
+    projects = find_projects(root)
+    if not projects:
+        return []
+
+    jobs = min(jobs or os.cpu_count() or 1, len(projects))
+    args = [(project, auto_write, scripts_path) for project in projects]
+    if jobs == 1:
+        return [_add_project(a) for a in args]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(args) // (jobs * 4))
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(_add_project, args, chunksize=chunksize))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+=============
+scrim.quoting
+=============
+Quote values so a shell reads them literally. Used by the
+:class:`scrim.commands.ShellCommands` backends when a command is added with
+quote=True.
+
+Values made only of characters a shell never treats specially are returned
+as-is. To find them the value is encoded and its safe characters are deleted
+with a precompiled translation table, anything left over needs quoting. Other
+values are escaped with str.replace. Both scan the value in C, which is an
+order of magnitude faster than a regex or a str.translate that maps to
+strings on multi-megabyte values.
+
+    bash, zsh: single quotes, ' is written as '\\''
+    fish: single quotes, \\ and ' are escaped with a backslash
+    csh, tcsh: single quotes, ! and newlines are escaped with a backslash
+    powershell.exe: single quotes, quote characters are doubled
+    cmd.exe: special characters outside of double quotes are escaped with ^
+        and % is doubled. Values can't contain newlines.
+'''
+from __future__ import absolute_import
+__all__ = [
+    'quote', 'quote_bash', 'quote_fish', 'quote_csh', 'quote_powershell',
+    'quote_cmd'
+]
+
+# Characters that never need quoting in posix shells, see shlex.quote
+SAFE = (
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    '_@%+=:,./-'
+)
+# fish expands % in older versions
+FISH_SAFE = SAFE.replace('%', '')
+CMD_SPECIAL = '^&|<>()'
+CMD_SAFE = ''.join(
+    chr(c) for c in range(128) if chr(c) not in '^&|<>()%"\r\n'
+)
+POWERSHELL_QUOTES = (u"'", u'‘', u'’', u'‚', u'‛')
+
+
+def _unsafe(safe):
+    '''Create a function returning True when a value contains characters
+    that aren't in safe'''
+
+    table = safe.encode('ascii')
+
+    def unsafe(value):
+        try:
+            return bool(value.encode('ascii').translate(None, table))
+        except UnicodeEncodeError:
+            return True
+    return unsafe
+
+
+_bash_unsafe = _unsafe(SAFE)
+_fish_unsafe = _unsafe(FISH_SAFE)
+_cmd_unsafe = _unsafe(CMD_SAFE)
+
+
+def _text(value):
+    if value.__class__ is str:
+        return value
+    return str(value)
+
+
+def quote_bash(value):
+    '''Quote value for bash and zsh'''
+
+    value = _text(value)
+    if value and not _bash_unsafe(value):
+        return value
+    return u"'" + value.replace(u"'", u"'\\''") + u"'"
+
+
+def quote_fish(value):
+    '''Quote value for fish'''
+
+    value = _text(value)
+    if value and not _fish_unsafe(value):
+        return value
+    return u"'" + value.replace(u'\\', u'\\\\').replace(u"'", u"\\'") + u"'"
+
+
+def quote_csh(value):
+    '''Quote value for csh and tcsh'''
+
+    value = _text(value)
+    if value and not _bash_unsafe(value):
+        return value
+    value = value.replace(u"'", u"'\\''").replace(u'!', u'\\!')
+    return u"'" + value.replace(u'\n', u'\\\n') + u"'"
+
+
+def quote_powershell(value):
+    '''Quote value as a powershell string literal. Values are always quoted
+    because bare words are commands in expressions.'''
+
+    value = _text(value)
+    for char in POWERSHELL_QUOTES:
+        value = value.replace(char, char + char)
+    return u"'" + value + u"'"
+
+
+def _escape_cmd(text):
+    for char in CMD_SPECIAL:
+        text = text.replace(char, u'^' + char)
+    return text.replace(u'%', u'%%')
+
+
+def quote_cmd(value):
+    '''Quote value for cmd.exe. Text between double quotes is only protected
+    from percent expansion, other text is escaped. cmd.exe can't hold empty
+    variables, setting a variable to an empty value unsets it.
+
+    Raises:
+        ValueError: when value contains a newline
+    '''
+
+    value = _text(value)
+    if not _cmd_unsafe(value):
+        return value
+    if u'\n' in value or u'\r' in value:
+        raise ValueError('cmd.exe values can not contain newlines')
+    if u'"' not in value:
+        return _escape_cmd(value)
+
+    # Parts never contain ", escape all outer and all inner parts in one pass
+    parts = value.split(u'"')
+    parts[0::2] = _escape_cmd(u'"'.join(parts[0::2])).split(u'"')
+    parts[1::2] = u'"'.join(parts[1::2]).replace(u'%', u'%%').split(u'"')
+    return u'"'.join(parts)
+
+
+def quote(value, shell):
+    '''Quote value for shell using the quote function of its backend'''
+
+    from scrim.commands import get_shell_commands
+    return get_shell_commands(shell).quote(value)
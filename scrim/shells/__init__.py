@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+'''
+============
+scrim.shells
+============
+Registry of :class:`scrim.commands.ShellCommands` backends. Backends are
+looked up by shell name in an index of "module:attribute" strings and are
+only imported the first time their shell is rendered.
+
+The index is made of the backends shipped with scrim in :data:`BACKENDS` and
+the backends of other packages registered as entry points in the
+"scrim.shells" group::
+
+    setup(
+        ...
+        entry_points={
+            'scrim.shells': ['xonsh = scrim_xonsh:XonshCommands'],
+        },
+    )
+
+Entry points are only read when a shell is not in :data:`BACKENDS`. They are
+cached in :func:`scrim.utils.cache_path` until a directory on sys.path
+changes.
+'''
+from __future__ import absolute_import
+import io
+import os
+import sys
+__all__ = [
+    'BACKENDS', 'ENTRY_POINT_GROUP', 'entry_point_index', 'get_index',
+    'find_backend', 'load_backend'
+]
+
+ENTRY_POINT_GROUP = 'scrim.shells'
+BACKENDS = {
+    'cmd.exe': 'scrim.commands:BatchCommands',
+    'powershell.exe': 'scrim.commands:PowershellCommands',
+    'bash': 'scrim.commands:BashCommands',
+    'zsh': 'scrim.shells.zsh:ZshCommands',
+    'fish': 'scrim.shells.fish:FishCommands',
+    'csh': 'scrim.shells.csh:CshCommands',
+}
+_entry_points = None
+
+
+def _scan_entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        return dict(
+            (ep.name, '{}:{}'.format(ep.module_name, '.'.join(ep.attrs)))
+            for ep in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP)
+        )
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return dict((ep.name, ep.value) for ep in eps)
+
+
+def entry_point_index():
+    '''Mapping of shell names to the backends registered as entry points.
+    The mapping is cached on disk and rescanned when the modification time
+    of a directory on sys.path changes.'''
+
+    global _entry_points
+    if _entry_points is not None:
+        return _entry_points
+
+    import json
+    from scrim.utils import cache_path, write_json
+
+    key = [
+        [path, os.stat(path).st_mtime]
+        for path in sys.path if path and os.path.isdir(path)
+    ]
+    path = cache_path('shells.json')
+    if os.path.exists(path):
+        try:
+            with io.open(path, 'r') as f:
+                cached = json.load(f)
+            if cached['key'] == key:
+                _entry_points = cached['backends']
+                return _entry_points
+        except (ValueError, KeyError):
+            pass
+
+    _entry_points = _scan_entry_points()
+    try:
+        write_json(path, dict(key=key, backends=_entry_points))
+    except OSError:
+        pass
+    return _entry_points
+
+
+def get_index():
+    '''Mapping of all known shell names to "module:attribute" strings.
+    Backends shipped with scrim take precedence over entry points.'''
+
+    index = dict(entry_point_index())
+    index.update(BACKENDS)
+    return index
+
+
+def find_backend(shell):
+    '''Get the "module:attribute" string of the backend for shell.
+
+    Raises:
+        KeyError: when there is no backend for shell
+    '''
+
+    try:
+        return BACKENDS[shell]
+    except KeyError:
+        return entry_point_index()[shell]
+
+
+def load_backend(shell):
+    '''Import and return the ShellCommands class for shell.
+
+    Raises:
+        KeyError: when there is no backend for shell
+    '''
+
+    module_name, attr = find_backend(shell).split(':')
+    module = __import__(module_name, fromlist=[attr])
+    obj = module
+    for part in attr.split('.'):
+        obj = getattr(obj, part)
+    return obj
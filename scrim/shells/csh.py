@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+'''
+================
+scrim.shells.csh
+================
+Commands for csh and tcsh.
+'''
+from __future__ import absolute_import
+from scrim.commands import ShellCommands
+__all__ = ['CshCommands']
+
+
+class CshCommands(ShellCommands):
+
+    shell = 'csh'
+    extension = '.csh'
+    path_module = 'posixpath'
+    quote_function = 'quote_csh'
+    templates = {
+        'execute': 'eval {0}',
+        'echo': 'echo {0}',
+        'set': 'set {0}={1}',
+        'unset': 'unset {0}',
+        'set_env': 'setenv {0} {1}',
+        'unset_env': 'unsetenv {0}',
+        'cd': 'cd {0}',
+        'pushd': 'pushd {0}',
+        'popd': 'popd',
+        'cat': 'cat {0}',
+    }
+    batch_templates = {
+        # setenv and unsetenv take a single variable
+        'set_env_many': ('', 'setenv {0} {1}', '; '),
+        'unset_env_many': ('', 'unsetenv {0}', '; '),
+    }
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+'''
+=================
+scrim.shells.fish
+=================
+'''
+from __future__ import absolute_import
+from scrim.commands import ShellCommands
+__all__ = ['FishCommands']
+
+
+class FishCommands(ShellCommands):
+
+    shell = 'fish'
+    extension = '.fish'
+    path_module = 'posixpath'
+    quote_function = 'quote_fish'
+    templates = {
+        'execute': 'eval {0}',
+        'echo': 'echo {0}',
+        'set': 'set -g {0} {1}',
+        'unset': 'set -e {0}',
+        'set_env': 'set -gx {0} {1}',
+        'unset_env': 'set -e {0}',
+        'cd': 'cd {0}',
+        'pushd': 'pushd {0}',
+        'popd': 'popd',
+        'cat': 'cat {0}',
+    }
+    batch_templates = {
+        'set_env_many': ('', 'set -gx {0} {1}', '; '),
+        'unset_env_many': ('set -e ', '{0}', ' '),
+    }
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+'''
+================
+scrim.shells.zsh
+================
+'''
+from __future__ import absolute_import
+from scrim.commands import ShellCommands
+__all__ = ['ZshCommands']
+
+
+class ZshCommands(ShellCommands):
+
+    shell = 'zsh'
+    extension = '.zsh'
+    path_module = 'posixpath'
+    quote_function = 'quote_bash'
+    templates = {
+        'execute': '$({0})',
+        'echo': 'echo {0}',
+        'set': '{0}={1}',
+        'unset': 'unset {0}',
+        'set_env': 'export {0}={1}',
+        'unset_env': 'unset {0}',
+        'cd': 'cd {0}',
+        'pushd': 'pushd {0}',
+        'popd': 'popd',
+        'cat': 'cat {0}',
+    }
+    batch_templates = {
+        'set_env_many': ('export ', '{0}={1}', ' '),
+        'unset_env_many': ('unset ', '{0}', ' '),
+    }
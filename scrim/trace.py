@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+'''
+===========
+scrim.trace
+===========
+Per-phase timing of scrim wrapped tools. When :envvar:`SCRIM_TRACE` is set to
+a file path the scrim scripts and :meth:`scrim.Scrim.on_exit` append json
+lines to it. The scrim script exports :envvar:`SCRIM_TRACE_ID` so the records
+of a single call can be joined together.
+
+The scrim script writes one record with the source set to its shell::
+
+    {"id": ..., "source": "bash", "entry_point": ..., "transport": ...,
+     "start": ..., "python_start": ..., "python_end": ..., "applied": ...}
+
+Python writes one record per :class:`scrim.Scrim` that had commands added,
+:func:`read_trace` merges the python records of a call::
+
+    {"id": ..., "source": "python", "pid": ..., "commands": ...,
+     "imported": ..., "exited": ..., "written": ...}
+
+Timestamps are seconds since the epoch. cmd.exe has no access to the epoch,
+its records set "clock" to "day" and use centiseconds since local midnight.
+
+:func:`read_trace` joins these records into the durations of each phase:
+
+    setup: scrim script setup before starting python
+    startup: python startup until scrim is imported
+    tool: running the tool until python exits
+    write: writing the scrim
+    teardown: python shutdown after the scrim is written
+    apply: executing the scrim in the shell
+    total: the whole call
+
+:func:`bench` generates a bash scrim script for a console script and traces
+repeated calls to it, it backs `scrim bench`.
+'''
+from __future__ import absolute_import
+import io
+import json
+import os
+import time
+__all__ = [
+    'PHASES', 'append_trace', 'python_record', 'read_trace',
+    'summarize_trace', 'bench'
+]
+
+PHASES = ('setup', 'startup', 'tool', 'write', 'teardown', 'apply', 'total')
+PHASE_BOUNDS = (
+    ('setup', 'start', 'python_start'),
+    ('startup', 'python_start', 'imported'),
+    ('tool', 'imported', 'exited'),
+    ('write', 'exited', 'written'),
+    ('teardown', 'written', 'python_end'),
+    ('apply', 'python_end', 'applied'),
+    ('total', 'start', 'applied'),
+)
+
+
+def append_trace(path, record):
+    '''Append record to the trace file at path as a single json line'''
+
+    line = json.dumps(record, sort_keys=True) + '\n'
+    with io.open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+
+def python_record(trace_id, imported, exited, written, commands):
+    '''Create the trace record written by python'''
+
+    return dict(
+        id=trace_id,
+        source='python',
+        pid=os.getpid(),
+        commands=commands,
+        imported=imported,
+        exited=exited,
+        written=written,
+    )
+
+
+def seconds_since_midnight(timestamp):
+    '''Convert an epoch timestamp to seconds since local midnight'''
+
+    local = time.localtime(timestamp)
+    midnight = time.mktime(local[:3] + (0, 0, 0) + local[6:8] + (-1,))
+    return timestamp - midnight
+
+
+def merge_record(joined, record):
+    '''Merge record into the joined records of a call. Every scrim of a call
+    writes a python record, the call exits with the first and is written with
+    the last one.'''
+
+    for key, value in record.items():
+        if key in ('id', 'source'):
+            continue
+        if key not in joined:
+            joined[key] = value
+        elif key in ('imported', 'exited'):
+            joined[key] = min(joined[key], value)
+        elif key == 'written':
+            joined[key] = max(joined[key], value)
+        elif key == 'commands':
+            joined[key] += value
+        else:
+            joined[key] = value
+
+
+def read_trace(path):
+    '''Join the records in a trace file by id.
+
+    Returns:
+        list: dicts with the id, entry_point, transport and a dict of
+        phase durations for each call. Phases missing a record are omitted.
+    '''
+
+    records = {}
+    order = []
+    with io.open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('id') is None:
+                continue
+            if record['id'] not in records:
+                order.append(record['id'])
+                records[record['id']] = {}
+            merge_record(records[record['id']], record)
+
+    calls = []
+    for trace_id in order:
+        record = records[trace_id]
+        if record.get('clock') == 'day':
+            for key in ('start', 'python_start', 'python_end', 'applied'):
+                if key in record:
+                    record[key] = record[key] / 100.0
+            for key in ('imported', 'exited', 'written'):
+                if key in record:
+                    record[key] = seconds_since_midnight(record[key])
+
+        phases = {}
+        for phase, start, end in PHASE_BOUNDS:
+            if start in record and end in record:
+                phases[phase] = record[end] - record[start]
+        calls.append(dict(
+            id=trace_id,
+            entry_point=record.get('entry_point'),
+            transport=record.get('transport'),
+            phases=phases,
+        ))
+    return calls
+
+
+def summarize_trace(calls):
+    '''Aggregate the phase durations of calls returned by :func:`read_trace`
+
+    Returns:
+        dict: phase to dict of count, mean, median, p95, p99 and max in
+        seconds
+    '''
+
+    summary = {}
+    for phase in PHASES:
+        values = sorted(
+            call['phases'][phase] for call in calls
+            if phase in call['phases']
+        )
+        if not values:
+            continue
+        summary[phase] = dict(
+            count=len(values),
+            mean=sum(values) / len(values),
+            median=values[len(values) // 2],
+            p95=values[min(len(values) - 1, int(len(values) * 0.95))],
+            p99=values[min(len(values) - 1, int(len(values) * 0.99))],
+            max=values[-1],
+        )
+    return summary
+
+
+# Sources the bash scrim script $1, then calls it $2 times after a warm up
+# call, and the bare console script $4 $2 times when $3 is 1. The arguments
+# of the calls follow the console script.
+BENCH_SCRIPT = '''
+source "$1"
+shift
+SCRIM_TRACE= scrim_bench "${@:4}" > /dev/null
+for ((_i = 0; _i < $1; _i++)); do
+    scrim_bench "${@:4}" > /dev/null
+done
+[ "$2" = 1 ] || exit 0
+"${@:3}" > /dev/null
+for ((_i = 0; _i < $1; _i++)); do
+    _scrim_now _t0
+    "${@:3}" > /dev/null
+    _scrim_now _t1
+    printf '%s %s\\n' "$_t0" "$_t1" >> "$SCRIM_TRACE.bare"
+done
+'''
+
+
+def bench(entry_point, args=(), number=100, compare=False):
+    '''Call the bash scrim script of entry_point number times in a single
+    bash process and trace each call. An untraced call warms up caches
+    first. The durations of the bare console script are measured by the same
+    bash process, so they include the same fork and exec.
+
+    Arguments:
+        entry_point (str): Console script to wrap
+        args (list): Arguments passed to each call
+        number (int): Number of calls
+        compare (bool): Also call the bare console script number times
+
+    Returns:
+        tuple: (calls, bare) calls are returned by :func:`read_trace`, bare
+        is a list of the durations of the bare calls in seconds
+    '''
+
+    import shutil
+    import subprocess
+    import tempfile
+    from scrim.utils import copy_templates
+
+    tmpdir = tempfile.mkdtemp(prefix='scrim-bench-')
+    try:
+        script = [
+            path for path in copy_templates(
+                'scrim_bench', entry_point, True, tmpdir
+            ) if path.endswith('.sh')
+        ][0]
+        path = os.path.join(tmpdir, 'trace.jsonl')
+        env = dict(os.environ, SCRIM_TRACE=path)
+        env.pop('SCRIM_TRACE_ID', None)
+        subprocess.check_call(
+            ['bash', '-c', BENCH_SCRIPT, 'bench', script, str(number),
+             '1' if compare else '0', entry_point] + list(args),
+            env=env,
+        )
+
+        calls = read_trace(path) if os.path.exists(path) else []
+        bare = []
+        if compare and os.path.exists(path + '.bare'):
+            with io.open(path + '.bare', 'r') as f:
+                for line in f:
+                    start, end = line.split()
+                    bare.append(float(end) - float(start))
+        return calls, bare
+    finally:
+        shutil.rmtree(tmpdir)
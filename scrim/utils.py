@@ -7,13 +7,15 @@ scrim.utils
 from __future__ import absolute_import
 import io
 import os
-from types import ModuleType
 __all__ = [
-    'this_path', 'relative_path', 'bin_path', 'copy_templates',
-    'parse_setup', 'get_console_scripts', 'init_attr'
+    'this_path', 'relative_path', 'bin_path', 'load_templates',
+    'write_templates', 'copy_templates',
+    'parse_setup', 'get_console_scripts', 'parse_entry_points_ini',
+    'cache_path', 'write_json', 'init_attr'
 ]
 
 this_path = os.path.dirname(__file__)
+_templates = None
 NEWLINE_MAP = {
     '.ps1': '\r\n',
     '.bat': '\r\n',
@@ -36,6 +38,21 @@ def bin_path(*args):
     return os.path.join(this_path, 'bin', *args)
 
 
+def cache_path(*args):
+    '''os.path.join relative to scrims cache directory. Defaults to
+    :envvar:`SCRIM_CACHE_DIR` falling back to $XDG_CACHE_HOME/scrim or
+    ~/.cache/scrim'''
+
+    root = os.environ.get('SCRIM_CACHE_DIR')
+    if not root:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser('~'),
+            '.cache'
+        )
+        root = os.path.join(cache_home, 'scrim')
+    return os.path.join(root, *args)
+
+
 def init_attr(value=None, default=None):
     '''Returns default if value is None'''
     if value is None:
@@ -43,42 +60,95 @@ def init_attr(value=None, default=None):
     return value
 
 
-def copy_templates(entry_point, py_entry_point, auto_write, output_dir):
-    '''Copy formatted templates from scrim/bin to output directory
+def load_templates():
+    '''Load and compile the templates in scrim/bin. Templates are loaded once
+    per process.
 
-    Attributes:
+    Returns:
+        list: (extension, newline, template) tuples, where template is a
+        str.format string taking entry_point, py_entry_point and auto_write
+    '''
+
+    global _templates
+    if _templates is not None:
+        return _templates
+
+    templates = []
+    for f in sorted(os.listdir(bin_path())):
+        ext = os.path.splitext(f)[-1]
+        with io.open(bin_path(f), 'r', encoding='utf-8') as f:
+            code = f.read()
+        code = code.replace('{', '{{').replace('}', '}}')
+        for field in ('entry_point', 'py_entry_point', 'auto_write'):
+            code = code.replace('{{{{' + field + '}}}}', '{' + field + '}')
+        templates.append((ext, NEWLINE_MAP.get(ext, '\n'), code))
+
+    _templates = templates
+    return templates
+
+
+def write_templates(entry_point, py_entry_point, auto_write, output_dir):
+    '''Write formatted templates from scrim/bin to output directory. Scripts
+    are only written when their content differs from the file on disk.
+
+    Arguments:
         entry_point: Name of shell script
         py_entry_point: Name of python console script
         auto_write: Sets SCRIM_AUTO_WRITE to True
-        output_dir: Guess
+        output_dir: Directory to write scripts to
+
+    Returns:
+        list: (script, status) tuples where status is one of 'created',
+        'updated' or 'unchanged'
     '''
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    scripts = []
-    for f in os.listdir(bin_path()):
-        ext = os.path.splitext(f)[-1]
-        newline = NEWLINE_MAP.get(ext, '\n')
-        template = bin_path(f)
+    results = []
+    for ext, newline, template in load_templates():
         destination = output_dir + '/' + entry_point + ext
-        scripts.append(destination)
+        code = template.format(
+            entry_point=entry_point,
+            py_entry_point=py_entry_point,
+            auto_write=int(auto_write),
+        )
+        data = code.replace('\n', newline).encode('utf-8')
 
-        with io.open(template, 'r') as f:
-            code = f.read()
-        code = code.replace('{{entry_point}}', entry_point)
-        code = code.replace('{{py_entry_point}}', py_entry_point)
-        code = code.replace('{{auto_write}}', str(int(auto_write)))
+        status = 'created'
+        if os.path.exists(destination):
+            status = 'updated'
+            if os.path.getsize(destination) == len(data):
+                with io.open(destination, 'rb') as f:
+                    if f.read() == data:
+                        status = 'unchanged'
+
+        if status != 'unchanged':
+            with io.open(destination, 'wb') as f:
+                f.write(data)
+        results.append((destination, status))
+
+    return results
+
+
+def copy_templates(entry_point, py_entry_point, auto_write, output_dir):
+    '''Copy formatted templates from scrim/bin to output directory
 
-        with io.open(destination, 'w', newline=newline) as f:
-            f.write(code)
+    Attributes:
+        entry_point: Name of shell script
+        py_entry_point: Name of python console script
+        auto_write: Sets SCRIM_AUTO_WRITE to True
+        output_dir: Guess
+    '''
 
-    return scripts
+    return [
+        script for script, _ in
+        write_templates(entry_point, py_entry_point, auto_write, output_dir)
+    ]
 
 
 def parse_setup(filepath):
     '''Get the kwargs from the setup function in setup.py'''
-    # TODO: Need to parse setup.cfg and merge with the data from below
 
     # Monkey patch setuptools.setup to capture keyword arguments
     setup_kwargs = {}
@@ -87,6 +157,7 @@ def parse_setup(filepath):
         setup_kwargs.update(kwargs)
 
     import setuptools
+    from types import ModuleType
     setuptools_setup = setuptools.setup
     setuptools.setup = setup_interceptor
 
@@ -104,11 +175,54 @@ def parse_setup(filepath):
 def get_console_scripts(setup_data):
     '''Parse and return a list of console_scripts from setup_data'''
 
-    # TODO: support ini format of entry_points
-    # TODO: support setup.cfg entry_points as available in pbr
-
-    if 'entry_points' not in setup_data:
+    entry_points = setup_data.get('entry_points')
+    if not entry_points:
         return []
 
-    console_scripts = setup_data['entry_points'].get('console_scripts', [])
-    return [script.split('=')[0].strip() for script in console_scripts]
+    if not isinstance(entry_points, dict):
+        entry_points = parse_entry_points_ini(entry_points)
+
+    console_scripts = entry_points.get('console_scripts', [])
+    if not isinstance(console_scripts, (list, tuple)):
+        console_scripts = console_scripts.splitlines()
+    return [
+        script.split('=')[0].strip()
+        for script in console_scripts
+        if script.strip()
+    ]
+
+
+def parse_entry_points_ini(text):
+    '''Parse entry_points in ini format to a dict of lists'''
+
+    entry_points = {}
+    group = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', ';')):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            group = entry_points.setdefault(line[1:-1].strip(), [])
+        elif group is not None:
+            group.append(line)
+    return entry_points
+
+
+def write_json(path, data):
+    '''Atomically write data to path as json'''
+
+    import json
+    import tempfile
+
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            if not os.path.isdir(dirname):
+                raise
+
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    with io.open(fd, 'w') as f:
+        f.write(json.dumps(data))
+    os.replace(tmp_path, path)
@@ -43,13 +43,12 @@ setup(
     author_email=info['email'],
     description=info['description'],
     long_description=long_description,
+    python_requires='>=3.7',
     install_requires=[
         'click>=6.7',
         'psutil>=5.2',
-        'fstrings>=0.1.0',
-        'six>=1.10.0'
     ],
-    packages=['scrim'],
+    packages=['scrim', 'scrim.shells'],
     package_data={
         'scrim': ['bin/*.*']
     },
@@ -64,12 +63,13 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ),
 )
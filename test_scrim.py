@@ -70,8 +70,1340 @@ def test_scrim():
     scrim.auto_write = False
 
 
+def test_add_projects():
+    '''Test scrim.project.add_projects'''
+
+    from scrim.project import add_projects
+
+    os.environ['SCRIM_CACHE_DIR'] = data_path('cache')
+    root = data_path('monorepo')
+    for name in ('a', 'b', 'c'):
+        project = os.path.join(root, 'packages', name)
+        os.makedirs(project)
+        with open(os.path.join(project, 'setup.py'), 'w') as f:
+            f.write(
+                'from setuptools import setup\n'
+                'setup(entry_points={{"console_scripts": ["py{0}={0}:main"]}})'
+                .format(name)
+            )
+    os.makedirs(os.path.join(root, '.hidden'))
+    with open(os.path.join(root, '.hidden', 'setup.py'), 'w') as f:
+        f.write('raise RuntimeError')
+
+    try:
+        results = add_projects(root, jobs=2)
+        assert [r['project'] for r in results] == [
+            os.path.join(root, 'packages', name) for name in 'abc'
+        ]
+        assert results[0]['scripts'] == [
+            ('bin/a.bat', 'created'),
+            ('bin/a.csh', 'created'),
+            ('bin/a.fish', 'created'),
+            ('bin/a.ps1', 'created'),
+            ('bin/a.sh', 'created'),
+            ('bin/a.zsh', 'created'),
+        ]
+        results = add_projects(root, jobs=1)
+        statuses = set(s for r in results for _, s in r['scripts'])
+        assert statuses == {'unchanged'}
+    finally:
+        os.environ.pop('SCRIM_CACHE_DIR')
+
+
 def test_copy_templates():
     '''Test scrim.utils.copy_templates'''
 
     scripts = copy_templates('test', 'pytest', True, data_path('bin'))
     assert all([os.path.exists(s) for s in scripts])
+
+
+def test_write_templates():
+    '''Test scrim.utils.write_templates only writes changed scripts'''
+
+    from scrim.utils import write_templates
+
+    output_dir = data_path('write_templates')
+    results = write_templates('test', 'pytest', True, output_dir)
+    assert set(status for _, status in results) == {'created'}
+
+    mtimes = [os.stat(script).st_mtime_ns for script, _ in results]
+    results = write_templates('test', 'pytest', True, output_dir)
+    assert set(status for _, status in results) == {'unchanged'}
+    assert mtimes == [os.stat(script).st_mtime_ns for script, _ in results]
+
+    results = write_templates('test', 'pyother', True, output_dir)
+    assert set(status for _, status in results) == {'updated'}
+
+
+def test_find_console_scripts():
+    '''Test scrim.utils.find_console_scripts'''
+
+    import sys
+    import warnings
+    from scrim.project import find_console_scripts, parse_console_scripts
+
+    os.environ['SCRIM_CACHE_DIR'] = data_path('cache')
+    project = data_path('project')
+    os.makedirs(project)
+    with open(os.path.join(project, 'setup.py'), 'w') as f:
+        f.write(
+            'from setuptools import setup\n'
+            'ENTRY_POINTS = {"console_scripts": ["pytool = tool:main"]}\n'
+            'setup(name="tool", entry_points=ENTRY_POINTS)\n'
+        )
+    with open(os.path.join(project, 'setup.cfg'), 'w') as f:
+        f.write(
+            '[options.entry_points]\n'
+            'console_scripts =\n'
+            '    pytool = tool:main\n'
+            '    pycfg = tool:cfg\n'
+        )
+    with open(os.path.join(project, 'pyproject.toml'), 'w') as f:
+        f.write('[project.scripts]\npytoml = "tool:toml"\n')
+
+    try:
+        expected = ['pytool', 'pycfg']
+        try:
+            import tomllib
+        except ImportError:
+            pass
+        else:
+            expected.append('pytoml')
+        assert find_console_scripts(project) == expected
+        assert os.listdir(data_path('cache', 'setup'))
+
+        # Dynamic entry_points fall back to executing setup.py, which may
+        # read other files so it runs every time
+        with open(os.path.join(project, 'names.txt'), 'w') as f:
+            f.write('ab')
+        with open(os.path.join(project, 'setup.py'), 'w') as f:
+            f.write(
+                'from setuptools import setup\n'
+                'names = open("names.txt").read()\n'
+                'scripts = ["py{} = tool:main".format(n) for n in names]\n'
+                'setup(name="tool", entry_points={"console_scripts": scripts})'
+            )
+        assert find_console_scripts(project)[:2] == ['pya', 'pyb']
+        with open(os.path.join(project, 'names.txt'), 'w') as f:
+            f.write('c')
+        assert find_console_scripts(project)[:1] == ['pyc']
+        with open(os.path.join(project, 'names.txt'), 'w') as f:
+            f.write('ab')
+
+        # Relative paths are resolved before changing directory
+        cwd = os.getcwd()
+        os.chdir(data_path())
+        try:
+            scripts = parse_console_scripts(
+                os.path.join('project', 'setup.py')
+            )
+        finally:
+            os.chdir(cwd)
+        assert scripts == ['pya', 'pyb']
+
+        # Projects that can't be parsed here are skipped with a warning
+        toml_project = data_path('toml_project')
+        os.makedirs(toml_project)
+        with open(os.path.join(toml_project, 'pyproject.toml'), 'w') as f:
+            f.write('[project.scripts]\npytoml = "tool:toml"\n')
+        modules = dict(
+            (name, sys.modules.pop(name, None))
+            for name in ('tomllib', 'tomli')
+        )
+        sys.modules.update(tomllib=None, tomli=None)
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                assert find_console_scripts(toml_project) == []
+            assert 'tomli' in str(caught[0].message)
+        finally:
+            for name, module in modules.items():
+                if module is None:
+                    sys.modules.pop(name)
+                else:
+                    sys.modules[name] = module
+    finally:
+        os.environ.pop('SCRIM_CACHE_DIR')
+
+
+def test_daemon():
+    '''Test scrim.daemon.Daemon'''
+
+    import asyncio
+    from scrim.daemon import Daemon, FALLBACK_RESPONSE, encode_request
+
+    import socket
+    import subprocess
+    import sys
+
+    def pytool():
+        print('Hello from ' + os.getcwd())
+        get_scrim().set_env('SCRIM_DAEMON_TEST', '1')
+
+    def pyfail():
+        sys.exit(3)
+
+    daemon = Daemon(
+        data_path('daemon', 'daemon.sock'),
+        {'pytool': pytool, 'pyfail': pyfail}
+    )
+
+    async def call(*entry_points):
+        await daemon.start()
+        responses = []
+        try:
+            for entry_point in entry_points:
+                reader, writer = await asyncio.open_unix_connection(
+                    daemon.path
+                )
+                writer.write(encode_request(
+                    entry_point,
+                    data_path(),
+                    [],
+                    {'SCRIM_SHELL': 'bash'}
+                ))
+                writer.write_eof()
+                responses.append((await reader.read()).decode('utf-8'))
+            return responses
+        finally:
+            await daemon.stop()
+
+    response, failed, missing = asyncio.run(
+        call('pytool', 'pyfail', 'scrim-test-missing')
+    )
+    assert missing == FALLBACK_RESPONSE
+    assert response.splitlines() == [
+        '_scrim_status=0',
+        "printf '%s' 'Hello from " + data_path(),
+        "'",
+        'export SCRIM_DAEMON_TEST=1',
+    ]
+    assert failed.splitlines() == ['_scrim_status=3']
+    assert not os.path.exists(daemon.path)
+
+    # The socket directory must be private to the user
+    os.chmod(data_path('daemon'), 0o755)
+    try:
+        asyncio.run(daemon.start())
+        assert False, 'Daemon sockets must be in a private directory'
+    except RuntimeError:
+        pass
+    os.chmod(data_path('daemon'), 0o700)
+
+    # Scrim scripts return the exit status of the tool
+    root = data_path('status')
+    os.makedirs(root)
+    with open(os.path.join(root, 'pyfail'), 'w') as f:
+        f.write('#!{}\nimport sys\nsys.exit(3)\n'.format(sys.executable))
+    os.chmod(os.path.join(root, 'pyfail'), 0o755)
+    copy_templates('fail', 'pyfail', True, root)
+    env = dict(os.environ, SCRIM_DAEMON_SOCKET=daemon.path)
+    env['PATH'] = root + os.pathsep + env['PATH']
+    output = subprocess.check_output(
+        ['bash', '-c', 'source fail.sh; fail; echo $?'],
+        cwd=root,
+        env=env,
+        universal_newlines=True
+    )
+    assert output == '3\n'
+
+    # Scrim scripts run console scripts the daemon can't find directly
+    with open(os.path.join(root, 'socat'), 'w') as f:
+        f.write('#!/bin/sh\ncat > /dev/null\nprintf "_scrim_fallback=1"\n')
+    os.chmod(os.path.join(root, 'socat'), 0o755)
+    sock = socket.socket(socket.AF_UNIX)
+    try:
+        sock.bind(daemon.path)
+        output = subprocess.check_output(
+            ['bash', '-c', 'source fail.sh; fail; echo $?'],
+            cwd=root,
+            env=env,
+            universal_newlines=True
+        )
+        assert output == '3\n'
+    finally:
+        sock.close()
+
+
+def test_stream():
+    '''Test Scrim in stream mode'''
+
+    from scrim import Scrim
+
+    path = data_path('stream', '.scrim')
+    os.makedirs(data_path('stream'))
+    with open(path, 'w') as f:
+        f.write('stale')
+    scrim = Scrim(path, shell='bash', script='null', stream=True)
+    scrim.stream_buffer_count = 2
+    scrim.set_env('A', '1')
+    scrim.raw('line 01', 'cmd.exe')
+    scrim.raw('line 02', 'bash')
+    scrim.echo('Hello')
+    assert scrim.commands == []
+    with open(path, 'r') as f:
+        assert f.read() == 'stale'
+    try:
+        scrim.to_string()
+        assert False, 'Streamed commands can not be rendered again'
+    except RuntimeError:
+        pass
+
+    scrim.write()
+    with open(path, 'r') as f:
+        assert f.read() == 'export A=1\nline 02\necho Hello'
+
+    scrim.echo('World')
+    scrim.write()
+    with open(path, 'r') as f:
+        assert f.read() == 'export A=1\nline 02\necho Hello\necho World'
+    assert os.listdir(data_path('stream')) == ['.scrim']
+
+
+def test_render():
+    '''Test scrim.commands.render'''
+
+    from scrim import Scrim, shells
+
+    # SHELL_COMMANDS scans the entry points of shells, caching the result
+    os.environ['SCRIM_CACHE_DIR'] = data_path('cache')
+    entry_points, shells._entry_points = shells._entry_points, None
+    try:
+        from scrim.commands import SHELL_COMMANDS
+        assert os.path.exists(data_path('cache', 'shells.json'))
+    finally:
+        shells._entry_points = entry_points
+        os.environ.pop('SCRIM_CACHE_DIR')
+
+    scrim = Scrim(auto_write=False)
+    scrim.set_env('A', '1')
+    scrim.unset_env('A')
+    scrim.pushd('a/../b')
+    scrim.popd()
+    scrim._add('set', var='B', value='2')
+
+    assert scrim.to_bash().splitlines() == [
+        'export A=1', 'unset A', 'pushd b', 'popd', 'B=2'
+    ]
+    assert scrim.to_cmd().splitlines() == [
+        'set "A=1"', 'set "A="', 'pushd b', 'popd', 'set "B=2"'
+    ]
+    assert scrim.to_powershell().splitlines() == [
+        '$env:A=1', 'Remove-Item Env:A', 'Push-Location -Path "b"',
+        'Pop-Location', '$B=2'
+    ]
+    for shell, commands in SHELL_COMMANDS.items():
+        assert commands.set_env('A', '1') == commands.table['set_env']('A', 1)
+
+
+def import_time(statement, repeat=3):
+    '''Run statement in a fresh interpreter with -X importtime and return the
+    cumulative import time of each module in microseconds. The fastest of
+    repeat runs is used for each module.
+
+    Bytecode is written to a private cache by a first untimed run, like it
+    is for an installed package, so the times don't include compiling.'''
+
+    import subprocess
+    import sys
+
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=data_path('pycache'))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    times = {}
+    for i in range(repeat + 1):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', statement],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        if not i:
+            continue
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            name, cumulative = name.strip(), int(cumulative)
+            times[name] = min(times.get(name, cumulative), cumulative)
+    return times
+
+
+def test_import_time():
+    '''Test that importing scrim stays lazy and cheap'''
+
+    times = import_time('import scrim')
+    assert times['scrim'] < 10000
+    assert not [name for name in times if name.startswith('scrim.')]
+
+    times = import_time('from scrim import get_scrim; get_scrim()')
+    assert times['scrim.api'] < 25000
+    for name in ('fstrings', 'inspect', 'shutil', 'tempfile', 'ntpath'):
+        assert name not in times
+
+
+def test_render_cache():
+    '''Test Scrim.to_string render cache'''
+
+    from scrim import Scrim
+    from scrim.commands import Command
+
+    scrim = Scrim(auto_write=False, shell='bash')
+    scrim.echo('a')
+    scrim.echo('b')
+    assert scrim.to_string() == 'echo a\necho b'
+    assert scrim.to_cmd() == 'echo a\necho b'
+
+    scrim.raw('type c', 'cmd.exe')
+    assert scrim.to_string() == 'echo a\necho b'
+    scrim.echo('c')
+    assert scrim.to_string() == 'echo a\necho b\necho c'
+    assert scrim.to_cmd() == 'echo a\necho b\ntype c\necho c'
+
+    scrim.commands[0] = Command('echo', ('z',), {})
+    assert scrim.to_string() == 'echo z\necho b\necho c'
+    del scrim.commands[1]
+    assert scrim.to_string() == 'echo z\necho c'
+    scrim.commands.clear()
+    assert scrim.to_string() == ''
+
+    scrim.commands = [Command('echo', ('y',), {})]
+    assert scrim.to_string() == 'echo y'
+    scrim.commands += [Command('echo', ('x',), {})]
+    assert scrim.to_string() == 'echo y\necho x'
+
+
+def test_render_all():
+    '''Test Scrim.render_all and Scrim.write_all'''
+
+    from scrim import Scrim
+    from scrim.commands import get_shell_commands
+
+    scrim = Scrim(auto_write=False)
+    scrim.set_env('A', '1')
+    scrim.pushd('a/b')
+    scrim.raw('ls', 'bash')
+    scrim.popd()
+
+    texts = scrim.render_all()
+    assert sorted(texts) == sorted(SHELLS)
+    for shell in SHELLS:
+        assert texts[shell] == scrim.to_string(shell)
+
+    scrim.echo('more')
+    assert scrim.render_all(['bash'])['bash'].endswith('ls\npopd\necho more')
+
+    paths = {}
+    for shell in SHELLS:
+        extension = get_shell_commands(shell).extension
+        paths[shell] = data_path('all', 'activate' + extension)
+    assert len(set(paths.values())) == len(SHELLS)
+    scrim.write_all(paths)
+    for shell, path in paths.items():
+        with open(path, 'r') as f:
+            assert f.read() == scrim.to_string(shell)
+
+
+def test_optimize():
+    '''Test Scrim.optimize'''
+
+    from scrim import Scrim
+
+    scrim = Scrim(auto_write=False, shell='bash')
+    scrim.set_env('A', '1')
+    scrim.set('A', '1')
+    scrim.set_env('A', '2')
+    scrim.set_env('B', '1')
+    scrim.unset_env('B')
+    scrim.cd('relative')
+    scrim.cd('/absolute')
+    scrim.pushd('a')
+    scrim.pushd('b')
+    scrim.set_env('C', '1')
+    scrim.popd()
+    scrim.popd()
+    scrim.echo('$A')
+    scrim.set_env('A', '3')
+    scrim.set_env('PATH', '$PATH:/bin')
+    scrim.set_env('PATH', '/usr/bin')
+    scrim.cd('a')
+    scrim.cd('b')
+    scrim.raw('pwd', 'bash')
+    scrim.pushd('c')
+    scrim.raw('pwd', 'bash')
+    scrim.popd()
+
+    assert scrim.optimize() == 7
+    assert scrim.to_string().splitlines() == [
+        'A=1',
+        'export A=2',
+        'unset B',
+        'cd /absolute',
+        'export C=1',
+        'echo $A',
+        'export A=3',
+        'export PATH=$PATH:/bin',
+        'export PATH=/usr/bin',
+        'cd a',
+        'cd b',
+        'pwd',
+        'pushd c',
+        'pwd',
+        'popd',
+    ]
+    assert scrim.optimize() == 0
+
+
+def test_command_store():
+    '''Test scrim.commands.CommandStore'''
+
+    from scrim.commands import Command, CommandStore, RawCommand
+
+    commands = [
+        Command('set_env', ('A', '1'), {}),
+        RawCommand('ls', 'bash'),
+        Command('set', (), {'var': 'B', 'value': '2'}),
+        'not a command',
+        Command('popd', (), {}),
+    ]
+    store = CommandStore(commands)
+    assert len(store) == 5
+    assert store == commands
+    assert list(store) == commands
+    assert store[-1] == commands[-1]
+    assert store[1:3] == commands[1:3]
+
+    store.add('echo', ('hi',), {})
+    assert store[5] == Command('echo', ('hi',), {})
+    assert store.version == 0
+
+    assert store.pop() == Command('echo', ('hi',), {})
+    assert store.pop(1) == RawCommand('ls', 'bash')
+    del store[2]
+    store.insert(0, RawCommand('pwd', 'bash'))
+    assert store == [
+        RawCommand('pwd', 'bash'), commands[0], commands[2], commands[4]
+    ]
+    assert store.version == 4
+
+    store.clear()
+    assert store == [] and len(store._args) == 0
+
+
+def test_env_many():
+    '''Test Scrim.set_env_many and Scrim.unset_env_many'''
+
+    from scrim import Scrim
+
+    scrim = Scrim(auto_write=False)
+    scrim.set_env_many([('A', '1'), ('B', '2')])
+    scrim.unset_env_many(['A', 'B'])
+    scrim.set_env_many({})
+    scrim.unset_env_many([])
+    assert len(scrim.commands) == 2
+
+    assert scrim.to_bash() == 'export A=1 B=2\nunset A B'
+    assert scrim.to_powershell() == (
+        '$env:A=1; $env:B=2\nRemove-Item Env:A, Env:B'
+    )
+    assert scrim.to_cmd() == (
+        'set "A=1"\nset "B=2"\nset "A="\nset "B="'
+    )
+
+    scrim.set_env('A', '3')
+    assert scrim.optimize() == 1
+    assert scrim.to_bash() == 'unset A B\nexport A=3'
+    scrim.set_env('B', '3')
+    assert scrim.optimize() == 1
+    assert scrim.to_bash() == 'export A=3\nexport B=3'
+
+
+def test_capture_env():
+    '''Test Scrim.capture_env'''
+
+    from scrim import Scrim
+
+    os.environ['SCRIM_TEST_REMOVED'] = '1'
+    os.environ['SCRIM_TEST_CHANGED'] = '1'
+    scrim = Scrim(auto_write=False, shell='bash')
+    try:
+        with scrim.capture_env():
+            del os.environ['SCRIM_TEST_REMOVED']
+            os.environ['SCRIM_TEST_CHANGED'] = '2'
+            os.environ['SCRIM_TEST_ADDED'] = '3'
+        assert scrim.to_string() == (
+            'export SCRIM_TEST_ADDED=3 SCRIM_TEST_CHANGED=2\n'
+            'unset SCRIM_TEST_REMOVED'
+        )
+
+        scrim.commands.clear()
+        scrim.capture_env(at_exit=True)
+        os.environ['SCRIM_TEST_ADDED'] = '4'
+        scrim.on_exit()
+        assert scrim.to_string() == 'export SCRIM_TEST_ADDED=4'
+
+        # Captured values are set literally
+        scrim.commands.clear()
+        with scrim.capture_env():
+            os.environ['SCRIM_TEST_ADDED'] = 'a b $HOME;rm'
+        assert scrim.to_string() == "export SCRIM_TEST_ADDED='a b $HOME;rm'"
+        assert scrim.to_cmd() == 'set SCRIM_TEST_ADDED=a b $HOME;rm'
+    finally:
+        for var in ('SCRIM_TEST_CHANGED', 'SCRIM_TEST_ADDED'):
+            os.environ.pop(var, None)
+
+
+def test_fd():
+    '''Test writing a Scrim to a file descriptor'''
+
+    from scrim import Scrim, api
+
+    read_fd, write_fd = os.pipe()
+    try:
+        scrim = Scrim(
+            fd=write_fd, auto_write=True, shell='bash', script='null'
+        )
+        scrim.echo('a')
+        scrim.write()
+        scrim.echo('b')
+        scrim.on_exit()
+
+        stream = Scrim(fd=write_fd, shell='bash', stream=True)
+        stream.echo('c')
+        stream.write()
+        stream.echo('d')
+        stream.write()
+    finally:
+        os.close(write_fd)
+
+    with os.fdopen(read_fd, 'r') as f:
+        assert f.read() == 'echo a\necho b\necho c\necho d'
+
+    # Optimizing and replacing commands keep track of the written commands
+    read_fd, write_fd = os.pipe()
+    # The descriptor numbers of the first pipe are reused
+    api._written_fds.discard(write_fd)
+    try:
+        scrim = Scrim(fd=write_fd, shell='bash')
+        scrim.auto_optimize = True
+        scrim.set_env('A', '1')
+        scrim.write()
+        scrim.set_env('A', '2')
+        scrim.set_env('B', '1')
+        scrim.write()
+        scrim.commands = []
+        scrim.set_env('C', '1')
+        scrim.write()
+    finally:
+        os.close(write_fd)
+
+    with os.fdopen(read_fd, 'r') as f:
+        assert f.read() == (
+            'export A=1\nexport A=2\nexport B=1\nexport C=1'
+        )
+
+
+def test_trace():
+    '''Test SCRIM_TRACE records written by Scrim.on_exit'''
+
+    import atexit
+    import json
+    from scrim import api
+    from scrim.api import Scrim
+    from scrim.trace import read_trace, summarize_trace
+
+    path = data_path('trace.jsonl')
+    trace, trace_id = api.SCRIM_TRACE, api.SCRIM_TRACE_ID
+    api.SCRIM_TRACE, api.SCRIM_TRACE_ID = path, 'call'
+    try:
+        scrim = Scrim(path=data_path('trace.sh'), auto_write=True,
+                      shell='bash', script='scrim.sh')
+        # Tracing doesn't register scrims until commands are added
+        assert not scrim._registered
+        scrim.set_env('VAR', 'VALUE')
+        scrim.on_exit()
+    finally:
+        api.SCRIM_TRACE, api.SCRIM_TRACE_ID = trace, trace_id
+        atexit.unregister(scrim.on_exit)
+
+    with open(path) as f:
+        record = json.loads(f.read())
+    assert record['id'] == 'call'
+    assert record['commands'] == 1
+    assert record['imported'] <= record['exited'] <= record['written']
+    assert os.path.exists(data_path('trace.sh'))
+
+    with open(path, 'a') as f:
+        f.write(json.dumps(dict(
+            id='call',
+            source='bash',
+            entry_point='pytool',
+            transport='path',
+            start=record['imported'] - 0.1,
+            python_start=record['imported'] - 0.05,
+            python_end=record['written'] + 0.01,
+            applied=record['written'] + 0.02,
+        )) + '\n')
+
+    calls = read_trace(path)
+    assert len(calls) == 1
+    phases = calls[0]['phases']
+    assert round(phases['setup'], 6) == 0.05
+    assert round(phases['teardown'], 6) == 0.01
+    assert summarize_trace(calls)['total']['count'] == 1
+
+    # Records of other scrims of the same call are merged
+    with open(path, 'a') as f:
+        f.write(json.dumps(dict(
+            id='call',
+            source='python',
+            commands=2,
+            imported=record['imported'],
+            exited=record['exited'] + 0.001,
+            written=record['written'] + 0.002,
+        )) + '\n')
+    phases = read_trace(path)[0]['phases']
+    assert round(phases['write'], 6) == round(
+        record['written'] + 0.002 - record['exited'], 6
+    )
+    assert round(phases['teardown'], 6) == 0.008
+
+
+def test_stats():
+    '''Test Scrim.stats and Scrim.subscribe'''
+
+    from scrim.api import Scrim
+
+    events = []
+
+    def on_add(scrim, name, args, kwargs):
+        events.append(('add', name))
+
+    def on_render(scrim, shell, seconds):
+        events.append(('render', shell))
+
+    def on_write(scrim, size, seconds):
+        events.append(('write', size))
+
+    for event, callback in [
+            ('add', on_add), ('render', on_render), ('write', on_write)]:
+        Scrim.subscribe(event, callback)
+
+    try:
+        scrim = Scrim(path=data_path('stats.sh'), shell='bash')
+        scrim._registered = True
+        scrim.set_env('A', '1')
+        scrim.set_env('B', '2')
+        scrim.raw('echo ok', 'bash')
+        scrim.write()
+    finally:
+        Scrim.unsubscribe('add', on_add)
+        Scrim.unsubscribe('render', on_render)
+        Scrim.unsubscribe('write', on_write)
+
+    text = 'export A=1\nexport B=2\necho ok'
+    assert events == [
+        ('add', 'set_env'),
+        ('add', 'set_env'),
+        ('add', 'raw'),
+        ('render', 'bash'),
+        ('write', len(text)),
+    ]
+
+    stats = scrim.stats
+    assert stats['commands'] == {'set_env': 2, 'raw': 1}
+    assert list(stats['render_time']) == ['bash']
+    assert stats['writes'] == 1
+    assert stats['bytes_written'] == len(text)
+    assert stats['write_time'] >= stats['render_time']['bash']
+
+    scrim.echo('unsubscribed')
+    assert len(events) == 5
+
+    # Commands are counted when they are added, removing them later or
+    # writing non-ascii text doesn't change the stats
+    scrim.commands = []
+    scrim.echo(u'caf\xe9')
+    scrim.write()
+    stats = scrim.stats
+    assert stats['commands'] == {'set_env': 2, 'raw': 1, 'echo': 2}
+    assert stats['bytes_written'] == len(text) + len(u'echo caf\xe9'.encode(
+        'utf-8'
+    ))
+
+
+def test_shells():
+    '''Test the zsh, fish and csh backends and the scrim.shells registry'''
+
+    import subprocess
+    import sys
+    from scrim import Scrim, shells
+    from scrim.commands import get_shell_commands, _shell_commands
+
+    scrim = Scrim(auto_write=False)
+    scrim.set_env('A', '1')
+    scrim.set_env_many([('B', '2'), ('C', '3')])
+    scrim.unset_env_many(['B', 'C'])
+    scrim.pushd('a/b')
+
+    assert scrim.to_string('zsh') == scrim.to_string('bash')
+    assert scrim.to_string('fish') == (
+        'set -gx A 1\n'
+        'set -gx B 2; set -gx C 3\n'
+        'set -e B C\n'
+        'pushd a/b'
+    )
+    assert scrim.to_string('csh') == (
+        'setenv A 1\n'
+        'setenv B 2; setenv C 3\n'
+        'unsetenv B; unsetenv C\n'
+        'pushd a/b'
+    )
+
+    # Backends are imported the first time their shell is rendered
+    subprocess.check_call([sys.executable, '-c', (
+        'import sys, scrim\n'
+        's = scrim.Scrim(auto_write=False)\n'
+        's.echo("x")\n'
+        's.to_string("bash")\n'
+        'assert "scrim.shells.fish" not in sys.modules\n'
+        's.to_string("fish")\n'
+        'assert "scrim.shells.fish" in sys.modules\n'
+    )], cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    # Backends registered as entry points
+    entry_points = shells._entry_points
+    shells._entry_points = {'zsh-compat': 'scrim.shells.zsh:ZshCommands'}
+    try:
+        commands = get_shell_commands('zsh-compat')
+        assert commands.__class__.__name__ == 'ZshCommands'
+        scrim.raw('compat', 'zsh-compat')
+        assert scrim.to_string('zsh-compat').endswith('pushd a/b\ncompat')
+    finally:
+        shells._entry_points = entry_points
+        _shell_commands.pop('zsh-compat', None)
+
+
+def test_quoting():
+    '''Test quoting values for each shell'''
+
+    import subprocess
+    from scrim import Scrim
+    from scrim.quoting import quote, quote_bash
+
+    value = "it's $5 & up!"
+    assert quote(value, 'bash') == "'it'\\''s $5 & up!'"
+    assert quote(value, 'zsh') == "'it'\\''s $5 & up!'"
+    assert quote(value, 'fish') == "'it\\'s $5 & up!'"
+    assert quote(value, 'csh') == "'it'\\''s $5 & up\\!'"
+    assert quote(value, 'powershell.exe') == "'it''s $5 & up!'"
+    assert quote(value, 'cmd.exe') == "it's $5 ^& up!"
+    assert quote('"a&b%"&c%', 'cmd.exe') == '"a&b%%"^&c%%'
+    assert quote('', 'bash') == "''"
+    try:
+        quote('a\nb', 'cmd.exe')
+        assert False, 'cmd.exe values can not contain newlines'
+    except ValueError:
+        pass
+    assert quote('', 'cmd.exe') == ''
+
+    # cmd.exe unsets variables set to an empty value, other shells render
+    scrim = Scrim(auto_write=False)
+    scrim.set_env('EMPTY', '', quote=True)
+    scripts = scrim.render_all()
+    assert scripts['bash'] == "export EMPTY=''"
+    assert scripts['cmd.exe'] == 'set EMPTY='
+
+    # Values that need no quoting are returned as-is
+    value = '/usr/local/bin:/usr/bin:C:/Program-Files'
+    assert quote_bash(value) is value
+
+    scrim = Scrim(auto_write=False)
+    scrim.set_env('PRICE', '$5 & up', quote=True)
+    scrim.set_env_many([('A', 'a b'), ('B', 'b')], quote=True)
+    scrim.echo('*', quote=True)
+    scrim.set_env('HOME_BIN', '$HOME/bin')
+    assert scrim.to_string('bash') == (
+        "export PRICE='$5 & up'\n"
+        "export A='a b' B=b\n"
+        "echo '*'\n"
+        'export HOME_BIN=$HOME/bin'
+    )
+    assert scrim.to_string('cmd.exe').startswith(
+        'set PRICE=$5 ^& up\n'
+        'set A=a b\n'
+        'set B=b\n'
+    )
+
+    # bash reads quoted values back literally
+    values = ["'", '"', '\\', '$(exit 1)', '`id`', '!x', 'a\nb', u'é ☃', '']
+    script = '\n'.join(
+        'printf "%s\\0" ' + quote_bash(value) for value in values
+    )
+    output = subprocess.check_output(['bash', '-c', script])
+    assert output.decode('utf-8').split('\0')[:-1] == values
+
+
+def test_paths():
+    '''Test Scrim.prepend_path, append_path and remove_path'''
+
+    import pickle
+    from scrim import Scrim, PathList
+
+    paths = PathList(['/a', '/b', '/a'])
+    paths.prepend('/c', '/b')
+    paths.append('/d', '/c')
+    assert paths.remove('/a', '/e') == 1
+    assert list(paths) == ['/b', '/d', '/c']
+    assert pickle.loads(pickle.dumps(PathList())) == []
+
+    os.environ['SCRIM_TEST_PATH'] = os.pathsep.join(['/a', '', '/b', '/a'])
+    try:
+        scrim = Scrim(auto_write=False)
+        scrim.prepend_path('SCRIM_TEST_PATH', ['/x', '/y'])
+        scrim.set_env('A', '1')
+        scrim.append_path('SCRIM_TEST_PATH', '/x')
+        scrim.remove_path('SCRIM_TEST_PATH', '/a')
+        scrim.remove_path('SCRIM_TEST_MISSING', '/a')
+        assert len(scrim.commands) == 2
+        assert scrim.to_string('bash') == (
+            'export SCRIM_TEST_PATH=/y:/b:/x\nexport A=1'
+        )
+        assert scrim.to_string('cmd.exe').startswith(
+            'set SCRIM_TEST_PATH=/y;/b;/x\n'
+        )
+        assert scrim.to_string('powershell.exe').startswith(
+            "$env:SCRIM_TEST_PATH='/y;/b;/x'\n"
+        )
+
+        # Edits made after the variable may have been read are not folded
+        scrim.execute('tool')
+        scrim.prepend_path('SCRIM_TEST_PATH', '/z')
+        scrim.set_env('SCRIM_TEST_PATH', '/q')
+        scrim.append_path('SCRIM_TEST_PATH', ['/r', '/q'])
+        assert scrim.to_string('bash') == (
+            'export SCRIM_TEST_PATH=/y:/b:/x\n'
+            'export A=1\n'
+            '$(tool)\n'
+            'export SCRIM_TEST_PATH=/z:/y:/b:/x\n'
+            'export SCRIM_TEST_PATH=/q\n'
+            'export SCRIM_TEST_PATH=/r:/q'
+        )
+
+        # Replacing the commands starts a new list
+        scrim = Scrim(auto_write=False)
+        scrim.prepend_path('SCRIM_TEST_PATH', '/x')
+        scrim.commands = []
+        scrim.prepend_path('SCRIM_TEST_PATH', '/y')
+        assert scrim.to_string('bash') == (
+            'export SCRIM_TEST_PATH=/y:/a:/b'
+        )
+
+        # Edits after writing to fd aren't folded into written commands
+        read_fd, write_fd = os.pipe()
+        try:
+            scrim = Scrim(fd=write_fd, shell='bash')
+            scrim.prepend_path('SCRIM_TEST_PATH', '/x')
+            scrim.write()
+            scrim.prepend_path('SCRIM_TEST_PATH', '/y')
+            scrim.write()
+        finally:
+            os.close(write_fd)
+        with os.fdopen(read_fd, 'r') as f:
+            # The descriptor number may have been written to by other tests
+            assert f.read().strip() == (
+                'export SCRIM_TEST_PATH=/x:/a:/b\n'
+                'export SCRIM_TEST_PATH=/y:/x:/a:/b'
+            )
+
+        # Values referencing variables can't be edited
+        scrim = Scrim(auto_write=False)
+        scrim.set_env('SCRIM_TEST_PATH', '$SCRIM_TEST_PATH:/x')
+        try:
+            scrim.prepend_path('SCRIM_TEST_PATH', '/y')
+            assert False, 'Can not edit paths of a value referencing variables'
+        except ValueError:
+            pass
+        scrim.set_env('SCRIM_TEST_PATH', '/x')
+        scrim.prepend_path('SCRIM_TEST_PATH', '/y')
+        assert scrim.to_string('bash').endswith(
+            'export SCRIM_TEST_PATH=/y:/x'
+        )
+
+        # Deferred paths and values are edited when rendered
+        calls = []
+
+        def deferred(value):
+            def resolve():
+                calls.append(value)
+                return value
+            return resolve
+
+        scrim = Scrim(auto_write=False)
+        scrim.set_env('SCRIM_TEST_PATH', deferred('/a:/b'))
+        scrim.prepend_path('SCRIM_TEST_PATH', deferred('/x'))
+        scrim.append_path('SCRIM_TEST_PATH', deferred(['/a', '/y']))
+        scrim.remove_path('SCRIM_TEST_PATH', '/b')
+        assert not calls
+        assert scrim.to_string('bash').splitlines()[-1] == (
+            'export SCRIM_TEST_PATH=/x:/a:/y'
+        )
+        scrim.prepend_path('SCRIM_TEST_PATH', '/z')
+        assert scrim.to_string('bash').splitlines()[-1] == (
+            'export SCRIM_TEST_PATH=/z:/x:/a:/y'
+        )
+    finally:
+        os.environ.pop('SCRIM_TEST_PATH')
+
+
+def test_memo():
+    '''Test memoized scrims are sourced by the bash scrim script'''
+
+    import subprocess
+    import sys
+    from scrim import Scrim, memo
+
+    root = data_path('memo')
+    os.makedirs(os.path.join(root, 'bin'))
+    tool = os.path.join(root, 'bin', 'pymemo')
+    with open(tool, 'w') as f:
+        f.write(
+            '#!{}\n'
+            'import sys\n'
+            'sys.path.insert(0, {!r})\n'
+            'from scrim import get_scrim\n'
+            'with open("runs", "a") as f:\n'
+            '    f.write("run\\n")\n'
+            'scrim = get_scrim()\n'
+            'with open("input") as f:\n'
+            '    value = " ".join(sys.argv[1:] + [f.read()])\n'
+            'scrim.set_env("MEMO_OUT", value, quote=True)\n'
+            'scrim.memoize(files=["input"], env=["MEMO_ENV"])\n'
+            'if sys.argv[1:] == ["fail"]:\n'
+            '    sys.exit(3)\n'
+            'if sys.argv[1:] == ["raise"]:\n'
+            '    raise ValueError("raise")\n'
+            .format(sys.executable, os.path.dirname(os.path.abspath(__file__)))
+        )
+    os.chmod(tool, 0o755)
+    copy_templates('memo', 'pymemo', True, os.path.join(root, 'bin'))
+
+    script = (
+        'source bin/memo.sh\n'
+        'call () { "$@"; printf "%s|" "$MEMO_OUT"; }\n'
+        'printf one > input\n'
+        'call memo a "b c"; call memo a "b c"; call memo a "b c"\n'
+        'call memo x\n'
+        'call memo fail; call memo fail\n'
+        'call memo raise 2> /dev/null; call memo raise 2> /dev/null\n'
+        'sleep 0.05; printf two > input\n'
+        'call memo a "b c"; call memo a "b c"\n'
+        'MEMO_ENV=1 call memo a "b c"\n'
+    )
+    env = dict(os.environ)
+    env['PATH'] = os.path.join(root, 'bin') + os.pathsep + env['PATH']
+    env['SCRIM_CACHE_DIR'] = os.path.join(root, 'cache')
+    output = subprocess.check_output(
+        ['bash', '-c', script],
+        cwd=root,
+        env=env,
+        universal_newlines=True
+    )
+    assert output.split('|')[:-1] == [
+        'a b c one', 'a b c one', 'a b c one', 'x one', 'fail one',
+        'fail one', 'raise one', 'raise one', 'a b c two', 'a b c two',
+        'a b c two'
+    ]
+    with open(os.path.join(root, 'runs')) as f:
+        # The first call enables memos, the third and tenth are cached.
+        # Failed calls are never cached.
+        assert len(f.readlines()) == 9
+
+    os.environ['SCRIM_CACHE_DIR'] = os.path.join(root, 'cache')
+    try:
+        entries = os.listdir(memo.memo_root('pymemo'))
+        assert len(entries) == 2
+        assert memo.evict(max_size=10 ** 6) == 0
+        assert len(os.listdir(memo.memo_root('blobs'))) == 2
+
+        # The entry that was sourced last is kept
+        size = sum(
+            os.path.getsize(os.path.join(path, name))
+            for path, _, names in os.walk(memo.memo_root()) for name in names
+        )
+        assert memo.evict(max_size=size - 1) == 1
+        assert len(os.listdir(memo.memo_root('blobs'))) == 1
+        with open(memo.memo_root('access.log')) as f:
+            kept = f.read().splitlines()[1:]
+        assert os.listdir(memo.memo_root('pymemo')) == [
+            os.path.basename(kept[-1])
+        ]
+
+        assert memo.clear('pymemo') == 1
+        assert os.listdir(memo.memo_root('pymemo')) == []
+        assert os.listdir(memo.memo_root('blobs')) == []
+    finally:
+        os.environ.pop('SCRIM_CACHE_DIR')
+
+    try:
+        Scrim(auto_write=False, stream=True).memoize()
+        assert False, 'Scrim.memoize is not available in stream mode'
+    except RuntimeError:
+        pass
+
+
+def test_deferred():
+    '''Test deferred arguments are resolved when the scrim is rendered'''
+
+    import asyncio
+    import threading
+    from scrim import Scrim
+
+    barrier = threading.Barrier(2, timeout=10)
+    calls = []
+
+    def deferred(value):
+        def resolve():
+            # Both callables have to run at the same time to pass
+            barrier.wait()
+            calls.append(value)
+            return value
+        return resolve
+
+    async def async_value():
+        await asyncio.sleep(0)
+        return 'async'
+
+    scrim = Scrim(auto_write=False, script='null', shell='bash')
+    scrim.set_env('A', deferred('a'))
+    scrim.set_env_many([('B', 'b'), ('C', deferred('c d'))], quote=True)
+    scrim.echo(async_value)
+    scrim.on_exit()
+    assert calls == []
+
+    assert scrim.to_string() == (
+        'export A=a\n'
+        "export B=b C='c d'\n"
+        'echo async'
+    )
+    assert sorted(calls) == ['a', 'c d']
+    assert scrim.to_string('cmd.exe').startswith('set "A=a"\n')
+    assert len(calls) == 2
+
+    scrim.cd(lambda: 1 / 0)
+    try:
+        scrim.to_string()
+        assert False, 'Errors of deferred arguments are raised'
+    except ZeroDivisionError:
+        pass
+
+    path = data_path('deferred', '.scrim')
+    scrim = Scrim(path, shell='bash', script='null', stream=True)
+    scrim.set_env('A', lambda: 'streamed')
+    scrim.write()
+    with open(path, 'r') as f:
+        assert f.read() == 'export A=streamed'
+
+
+def test_threads():
+    '''Test adding commands and getting scrims from multiple threads'''
+
+    import threading
+    from scrim import api
+
+    scrim = api.Scrim(auto_write=False, shell='bash')
+    scrim.echo('start')
+    barrier = threading.Barrier(8)
+    found = []
+
+    def work(n):
+        barrier.wait()
+        found.append(api.get_scrim(path=data_path('threads.sh')))
+        for i in range(500):
+            scrim.set_env('T{}'.format(n), str(i))
+            if i == 250:
+                scrim.to_string()
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, found))) == 1
+    assert len(scrim.commands) == 4001
+    assert scrim.stats['commands'] == {'echo': 1, 'set_env': 4000}
+
+    # Each thread's commands keep the order they were added in
+    for n in range(8):
+        values = [
+            c.args[1] for c in scrim.commands[1:]
+            if c.args[0] == 'T{}'.format(n)
+        ]
+        assert values == [str(i) for i in range(500)]
+
+    text = scrim.to_string()
+    assert text == '\n'.join(
+        ['echo start'] +
+        ['export {}={}'.format(*c.args) for c in scrim.commands[1:]]
+    )
+
+    # Commands added while other threads optimize are kept
+    scrim = api.Scrim(auto_write=False, shell='bash')
+    scrim._registered = True
+    done = threading.Event()
+
+    def add(n):
+        for i in range(2000):
+            scrim.set_env('T{}_{}'.format(n, i), '1')
+
+    def optimize():
+        k = 0
+        while not done.is_set():
+            scrim.set_env('X', str(k))
+            scrim.optimize()
+            k += 1
+
+    optimizer = threading.Thread(target=optimize)
+    optimizer.start()
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    optimizer.join()
+
+    names = [c.args[0] for c in scrim.commands if c.args[0] != 'X']
+    assert len(names) == 8000
+    for n in range(4):
+        prefix = 'T{}_'.format(n)
+        added = [name for name in names if name.startswith(prefix)]
+        assert added == [prefix + str(i) for i in range(2000)]
+
+
+def test_workers():
+    '''Test collecting the commands of multiprocessing workers'''
+
+    import subprocess
+    import sys
+
+    tool = data_path('workers_tool.py')
+    with open(tool, 'w') as f:
+        f.write(
+            'import multiprocessing\n'
+            'from concurrent.futures import ProcessPoolExecutor\n'
+            'import scrim\n'
+            '\n'
+            'def work(n):\n'
+            '    scrim.get_scrim().set_env("W{}".format(n), str(n))\n'
+            '\n'
+            'if __name__ == "__main__":\n'
+            '    import os\n'
+            '    assert "SCRIM_WORKERS" not in os.environ\n'
+            '    scrim.get_scrim().echo("parent")\n'
+            '    for method in ("fork", "spawn"):\n'
+            '        context = multiprocessing.get_context(method)\n'
+            '        with ProcessPoolExecutor(4, context) as pool:\n'
+            '            list(pool.map(work, range(8)))\n'
+            '        scrim.get_scrim().echo(method)\n'
+            '    scrim.get_scrim().echo("done")\n'
+            '    # Exits first and must leave the workers to the writer\n'
+            '    scrim.Scrim(auto_write=False).echo("preview")\n'
+        )
+
+    path = data_path('workers.sh')
+    env = dict(os.environ)
+    env.pop('SCRIM_WORKERS', None)
+    env.update(
+        SCRIM_SHELL='bash',
+        SCRIM_SCRIPT='scrim.sh',
+        SCRIM_AUTO_WRITE='1',
+        PYTHONPATH=os.path.dirname(os.path.abspath(__file__)),
+    )
+    # Parts of workers killed while writing are removed
+    os.makedirs(path + '.workers', 0o700)
+    with open(os.path.join(path + '.workers', 'killed.tmp'), 'w') as f:
+        f.write('partial')
+    subprocess.check_call(
+        [sys.executable, tool], env=dict(env, SCRIM_PATH=path)
+    )
+    with open(path) as f:
+        path_lines = f.read().splitlines()
+    assert not os.path.exists(path + '.workers')
+
+    # Without a path the workers directory is in the temporary directory
+    tmpdir = data_path('workers_tmp')
+    os.makedirs(tmpdir)
+    r, w = os.pipe()
+    proc = subprocess.Popen(
+        [sys.executable, tool],
+        env=dict(env, SCRIM_FD=str(w), TMPDIR=tmpdir),
+        pass_fds=(w,)
+    )
+    os.close(w)
+    with os.fdopen(r) as f:
+        fd_lines = f.read().splitlines()
+    assert proc.wait() == 0
+    assert os.listdir(tmpdir) == []
+
+    # It is only created when a worker writes
+    subprocess.check_call(
+        [sys.executable, '-c', 'import scrim; scrim.get_scrim().echo("a")'],
+        env=dict(env, SCRIM_FD='1', TMPDIR=tmpdir),
+        stdout=subprocess.DEVNULL
+    )
+    assert os.listdir(tmpdir) == []
+
+    for lines in (path_lines, fd_lines):
+        # Workers are collected after the parents commands
+        assert lines[:4] == [
+            'echo parent', 'echo fork', 'echo spawn', 'echo done'
+        ]
+        assert sorted(lines[4:]) == sorted(
+            'export W{0}={0}'.format(n) for n in list(range(8)) * 2
+        )
+
+
+def test_bench():
+    '''Test scrim bench traces calls to the bash scrim script'''
+
+    import sys
+    from click.testing import CliRunner
+    from scrim.__main__ import cli
+    from scrim.trace import bench
+
+    root = data_path('bench')
+    os.makedirs(root)
+    tool = os.path.join(root, 'pybench')
+    with open(tool, 'w') as f:
+        f.write(
+            '#!{}\n'
+            'import sys\n'
+            'sys.path.insert(0, {!r})\n'
+            'from scrim import get_scrim\n'
+            'get_scrim().set_env("BENCH_ARGS", " ".join(sys.argv[1:]))\n'
+            .format(sys.executable, os.path.dirname(os.path.abspath(__file__)))
+        )
+    os.chmod(tool, 0o755)
+
+    path = os.environ['PATH']
+    os.environ['PATH'] = root + os.pathsep + path
+    try:
+        calls, bare = bench('pybench', ['a', 'b'], number=3, compare=True)
+        assert len(calls) == 3
+        assert len(bare) == 3
+        for call in calls:
+            assert call['entry_point'] == 'pybench'
+            phases = set(call['phases'])
+            assert {'setup', 'startup', 'apply', 'total'} <= phases
+
+        result = CliRunner().invoke(cli, ['bench', '-n', '2', 'pybench', 'a'])
+        assert result.exit_code == 0, result.output
+        lines = result.output.splitlines()
+        assert lines[0] == '2 calls'
+        assert lines[2].split() == ['phase', 'count', 'p50', 'p95', 'p99']
+        assert 'overhead' not in result.output
+    finally:
+        os.environ['PATH'] = path